@@ -0,0 +1,124 @@
+"""Compare GetFile request counts and transfer time of the block planner with the old sizing
+
+Usage: python benchmarks/block_plan_bench.py [--requests 2000] [--rtt 0.1] [--bandwidth 4] [--video-share 0.7]
+
+A synthetic mix of player traffic (seek probes, mid-size ranges and
+open-ended playback from a random position) is planned twice: with the
+old chunk_size/offset_fix rules that media_streamer used before, and with
+web.utils.block_planner. Transfer time is modelled as one round trip per
+GetFile plus the fetched bytes over the link bandwidth, with the same
+read-ahead window yield_file uses. Plans with a block size or offset
+that upload.GetFile rejects are counted as illegal.
+"""
+import os
+import sys
+import math
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for key, value in {"API_ID": "0", "API_HASH": "bench", "BOT_TOKEN": "0:bench", "BIN_CHANNEL": "0",
+                   "ADMIN_ID": "0", "STREAM_URL": "http://127.0.0.1:8080/"}.items():
+    os.environ.setdefault(key, value)
+
+from web.utils.block_planner import choose_block_size, is_legal_block
+from web.utils.range_plan import plan_blocks
+
+MB = 1024 * 1024
+
+
+def legacy_chunk_size(length):
+    """chunk_size() as it was in web/utils/custom_dl.py"""
+    if length > 50 * 1024 * 1024:
+        return min(2 * 1024 * 1024, 2 ** max(min(math.ceil(math.log2(length / 1024)), 21), 11) * 1024)
+    elif length > 10 * 1024 * 1024:
+        return min(1024 * 1024, 2 ** max(min(math.ceil(math.log2(length / 1024)), 20), 10) * 1024)
+    else:
+        return 2 ** max(min(math.ceil(math.log2(length / 1024)), 10), 2) * 1024
+
+
+def legacy_plan(start, end, is_video):
+    """media_streamer's sizing before the block planner
+
+    The old part count, ceil(length / chunk), ignored the misalignment of
+    `start` and often stopped one block short. The blocks really needed
+    to deliver the range are counted instead, and short plans are
+    reported separately.
+    """
+    req_length = end - start
+    if req_length <= 0:
+        chunk = 4096
+    elif is_video:
+        chunk = legacy_chunk_size(min(req_length, MB))
+    else:
+        chunk = legacy_chunk_size(req_length)
+    offset, _, _, part_count = plan_blocks(start, end, chunk)
+    return offset, part_count, chunk, max(1, math.ceil(req_length / chunk)) < part_count
+
+
+def planner_plan(start, end, is_video, rtt, bandwidth):
+    chunk = choose_block_size(start, end, rtt, bandwidth)
+    offset, _, _, part_count = plan_blocks(start, end, chunk)
+    return offset, part_count, chunk, False
+
+
+def workload(count, video_share, seed=1):
+    rng = random.Random(seed)
+    for _ in range(count):
+        file_size = rng.randint(20 * MB, 1500 * MB)
+        kind = rng.random()
+        if kind < 0.4:
+            # Seek probe / container header read
+            start = rng.randrange(file_size - 4096)
+            end = start + rng.randint(1, 4096) - 1
+        elif kind < 0.8:
+            start = rng.randrange(file_size - 8 * MB)
+            end = start + rng.randint(16 * 1024, 8 * MB) - 1
+        else:
+            # Open-ended playback, the player stops reading after a while
+            start = rng.randrange(file_size // 2)
+            end = min(file_size - 1, start + rng.randint(8 * MB, 64 * MB))
+        yield start, end, rng.random() < video_share
+
+
+def modelled_time(part_count, chunk, rtt, bandwidth, window=4):
+    rounds = math.ceil(part_count / window)
+    return rounds * rtt + part_count * chunk / bandwidth
+
+
+def run(name, plan, ranges, rtt, bandwidth):
+    requests = fetched = illegal = short = 0
+    transfer = 0.0
+    started = time.perf_counter()
+    plans = [plan(start, end, is_video) for start, end, is_video in ranges]
+    planning = time.perf_counter() - started
+    for offset, part_count, chunk, was_short in plans:
+        short += was_short
+        requests += part_count
+        fetched += part_count * chunk
+        transfer += modelled_time(part_count, chunk, rtt, bandwidth)
+        if not is_legal_block(offset, chunk):
+            illegal += 1
+    wanted = sum(end - start + 1 for start, end, _ in ranges)
+    print(f"{name:<10} requests {requests:>9}  fetched {fetched / MB:>10.1f} MB "
+          f"({fetched / wanted:5.2f}x)  modelled time {transfer:>9.1f} s  "
+          f"illegal {illegal:>4}  short {short:>4}  planning {planning * 1000:6.1f} ms")
+
+
+def main(args):
+    bandwidth = args.bandwidth * MB
+    ranges = list(workload(args.requests, args.video_share))
+    print(f"{len(ranges)} ranges ({args.video_share:.0%} video), rtt {args.rtt * 1000:.0f} ms, "
+          f"bandwidth {args.bandwidth} MB/s")
+    run("legacy", legacy_plan, ranges, args.rtt, bandwidth)
+    run("planner", lambda s, e, v: planner_plan(s, e, v, args.rtt, bandwidth), ranges, args.rtt, bandwidth)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rtt", type=float, default=0.1, help="GetFile round trip in seconds")
+    parser.add_argument("--bandwidth", type=float, default=4, help="link bandwidth in MB/s")
+    parser.add_argument("--video-share", type=float, default=0.7, help="fraction of requests for video files")
+    main(parser.parse_args())
@@ -0,0 +1,352 @@
+"""Simulate many users driving the bot handlers against a stub client
+
+Usage: python benchmarks/bot_load_bench.py [--users 20] [--jobs-per-user 3] [--job-size 40]
+       [--bulk-files 10] [--single-files 2] [--media-share 0.8] [--latency 0.02]
+       [--flood-rate 0.01] [--rate-scale 10] [--seed 1] [--output results.json]
+       [--min-jobs-per-minute N] [--max-calls-per-file N] [--max-wait-p99 N] [--min-fairness N]
+
+Every user sends `--single-files` files in normal mode, turns on bulk mode,
+sends `--bulk-files` files at once and asks for them with /link_txt, then
+runs `--jobs-per-user` /link and /link_txt jobs of `--job-size` messages
+in a group. The handlers of plugins/main.py get synthetic Message objects
+and a stub client that answers after `--latency` seconds, counts every
+API call and raises FloodWait on `--flood-rate` of them.
+
+The rate limiter, bulk copy delay and status edit interval run
+`--rate-scale` times faster than in production, so a run takes seconds;
+rates in the report are in that scaled time. The report has jobs per
+minute, API calls per file, queue wait percentiles and Jain's fairness
+index over each user's mean job turnaround (1.0 is perfectly fair).
+With the --min/--max options it exits with status 1 when a value
+regresses past them, for use as a CI gate.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import datetime
+from collections import Counter
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for key, value in {"API_ID": "0", "API_HASH": "bench", "BOT_TOKEN": "0:bench", "BIN_CHANNEL": "-1001000000000",
+                   "ADMIN_ID": "0", "STREAM_URL": "http://127.0.0.1:8080", "JOB_DB_PATH": "",
+                   "STREAM_TRACE_SAMPLE_RATE": "0"}.items():
+    os.environ.setdefault(key, value)
+
+BIN_CHANNEL_ID = 1000000000
+GROUP_CHAT_ID = -1002000000000
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(share * (len(values) - 1))))]
+
+
+def jain_index(values):
+    """(sum x)^2 / (n * sum x^2): 1.0 when all equal, 1/n when one user gets everything"""
+    values = [value for value in values if value is not None]
+    if not values or not any(values):
+        return 1.0
+    return sum(values) ** 2 / (len(values) * sum(value * value for value in values))
+
+
+class StubMessage:
+    """The parts of pyrogram's Message the handlers use; replies go through the stub client"""
+
+    def __init__(self, client, chat_id, message_id, user_id=None, text=None, media=None, chat_title=None):
+        self.client = client
+        self.id = message_id
+        self.chat = SimpleNamespace(id=chat_id, title=chat_title)
+        self.from_user = SimpleNamespace(id=user_id) if user_id is not None else None
+        self.text = text
+        self.date = datetime.datetime(2024, 1, 1)
+        self.document = media
+        self.video = None
+        self.photo = None
+        self.audio = None
+        self.reply_to_message = None
+        self.empty = False
+
+    async def reply_text(self, text, **kwargs):
+        await self.client.call("send_message")
+        return self.client.new_message(self.chat.id)
+
+    async def reply_document(self, document, **kwargs):
+        await self.client.call("send_document")
+        self.client.documents.append(document.name)
+        return self.client.new_message(self.chat.id)
+
+    async def edit_text(self, text, **kwargs):
+        await self.client.call("edit_message")
+        return self
+
+    async def delete(self):
+        await self.client.call("delete_messages")
+
+
+class StubClient:
+    """Answers the API calls of plugins/main.py from synthetic chats and counts them"""
+
+    def __init__(self, args):
+        from pyrogram import raw
+        from pyrogram.errors import FloodWait
+        self.raw = raw
+        self.FloodWait = FloodWait
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.calls = Counter()
+        self.handler_errors = Counter()
+        self.flood_waits = 0
+        self.copied = 0
+        self.documents = []
+        self.next_id = 1
+        self.message_cache = {}
+        self.me = SimpleNamespace(id=1, username="bench_bot")
+        self.parse_mode = None
+
+    def new_message(self, chat_id, **kwargs):
+        self.next_id += 1
+        return StubMessage(self, chat_id, self.next_id, **kwargs)
+
+    def media(self, name):
+        return SimpleNamespace(file_id=name, file_unique_id=name, file_name=f"{name}.mkv", file_size=1024)
+
+    def source_message(self, chat_id, message_id):
+        """Group messages are deterministic: the same id always holds the same file or text"""
+        rng = random.Random(message_id)
+        media = self.media(f"group_{message_id}") if rng.random() < self.args.media_share else None
+        return StubMessage(self, chat_id, message_id, user_id=0, media=media)
+
+    async def call(self, method):
+        self.calls[method] += 1
+        await asyncio.sleep(self.args.latency)
+        if self.random.random() < self.args.flood_rate:
+            self.flood_waits += 1
+            raise self.FloodWait(value=1 / self.args.rate_scale)
+
+    def rnd_id(self):
+        return self.random.getrandbits(63)
+
+    async def resolve_peer(self, peer_id):
+        return self.raw.types.InputPeerChannel(channel_id=abs(peer_id) % 10 ** 10, access_hash=0)
+
+    async def get_chat(self, chat_id):
+        from pyrogram.enums import ChatType
+        await self.call("get_chat")
+        return SimpleNamespace(id=chat_id, type=ChatType.SUPERGROUP)
+
+    async def get_chat_member(self, chat_id, user_id):
+        await self.call("get_chat_member")
+        return SimpleNamespace(status="administrator", privileges=SimpleNamespace(can_delete_messages=True))
+
+    async def get_messages(self, chat_id, message_ids):
+        await self.call("get_messages")
+        if isinstance(message_ids, int):
+            return self.source_message(chat_id, message_ids)
+        return [self.source_message(chat_id, message_id) for message_id in message_ids]
+
+    async def copy_message(self, chat_id, from_chat_id, message_id):
+        await self.call("copy_message")
+        self.copied += 1
+        return self.new_message(chat_id)
+
+    async def invoke(self, query):
+        raw = self.raw
+        await self.call(type(query).__name__)
+        if not isinstance(query, raw.functions.messages.ForwardMessages):
+            raise NotImplementedError(type(query).__name__)
+        updates = []
+        for random_id in query.random_id:
+            self.next_id += 1
+            self.copied += 1
+            updates.append(raw.types.UpdateMessageID(id=self.next_id, random_id=random_id))
+            updates.append(raw.types.UpdateNewChannelMessage(
+                message=raw.types.Message(id=self.next_id, peer_id=raw.types.PeerChannel(channel_id=BIN_CHANNEL_ID),
+                                          date=0, message="", entities=[]),
+                pts=0, pts_count=0
+            ))
+        chat = raw.types.Channel(id=BIN_CHANNEL_ID, title="bin", photo=raw.types.ChatPhotoEmpty(), date=0,
+                                 access_hash=0, restriction_reason=[])
+        return raw.types.Updates(updates=updates, users=[], chats=[chat], date=0, seq=0)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self.call("send_message")
+        return self.new_message(chat_id)
+
+    async def send_document(self, chat_id, document, **kwargs):
+        await self.call("send_document")
+        self.documents.append(document.name)
+        return self.new_message(chat_id)
+
+
+def speed_up(scale):
+    """Make every pacing delay of the bot `scale` times shorter"""
+    from info import TELEGRAM_MAX_RATE
+    from plugins import main
+    from web.utils import rate_limiter as rate_limiter_module
+    from web.utils.status_updater import status_updater
+
+    limits = rate_limiter_module.METHOD_LIMITS
+    for method, (rate, burst) in list(limits.items()):
+        limits[method] = (rate * scale, burst)
+    rate_limiter_module.DEFAULT_LIMIT = tuple((rate_limiter_module.DEFAULT_LIMIT[0] * scale,
+                                               rate_limiter_module.DEFAULT_LIMIT[1]))
+    limiter = rate_limiter_module.rate_limiter
+    limiter.buckets.clear()
+    limiter.global_bucket = rate_limiter_module.TokenBucket(TELEGRAM_MAX_RATE * scale, max(1, int(TELEGRAM_MAX_RATE)))
+    main.bin_copy_batcher.delay /= scale
+    status_updater.interval /= scale
+
+
+async def dispatch(client, handler, message):
+    """Run a handler like Pyrogram's dispatcher does: an exception only ends that update"""
+    try:
+        await handler(client, message)
+    except Exception as e:
+        client.handler_errors[type(e).__name__] += 1
+
+
+async def simulate_user(client, main, user_id, args, rng):
+    from info import temp
+    temp.AUTHORIZED_USERS.add(user_id)
+
+    def private(text=None, media=None):
+        return client.new_message(user_id, user_id=user_id, text=text, media=media)
+
+    for index in range(args.single_files):
+        await dispatch(client, main.private_receive_handler, private(media=client.media(f"single_{user_id}_{index}")))
+
+    if args.bulk_files:
+        await dispatch(client, main.bulk_links_start, private("/bulk_links"))
+        # A burst, as when a user forwards an album or a selection of files
+        await asyncio.gather(*(
+            dispatch(client, main.private_receive_handler, private(media=client.media(f"bulk_{user_id}_{index}")))
+            for index in range(args.bulk_files)
+        ))
+        count = len(temp.BULK_FILES.get(user_id, []))
+        if count:
+            await dispatch(client, main.private_link_txt_handler, private(f"/link_txt {count}"))
+        await dispatch(client, main.exit_bulk_mode, private("/exit_bulk"))
+
+    # Every user works on their own stretch of the group history
+    first_id = 100000 + user_id * args.jobs_per_user * args.job_size * 2
+    for job in range(args.jobs_per_user):
+        start_id = first_id + job * args.job_size * 2
+        command = f"/link {min(args.job_size, 20)}" if job % 2 else f"/link_txt {args.job_size}"
+        message = client.new_message(GROUP_CHAT_ID, user_id=user_id, text=command, chat_title="Bench Group")
+        message.reply_to_message = client.source_message(GROUP_CHAT_ID, start_id)
+        handler = main.group_link_handler if job % 2 else main.group_link_txt_handler
+        await dispatch(client, handler, message)
+        await asyncio.sleep(rng.uniform(0, 0.05))
+
+
+async def run(args):
+    from plugins import main
+
+    speed_up(args.rate_scale)
+    client = StubClient(args)
+    rng = random.Random(args.seed)
+
+    started = time.time()
+    await asyncio.gather(*(simulate_user(client, main, user_id, args, rng) for user_id in range(1, args.users + 1)))
+    # Commands a FloodWait cut short never became jobs
+    while True:
+        jobs = list(main.bulk_queue.jobs.values())
+        finished = [job for job in jobs if job['state'] in ('done', 'failed')]
+        if len(finished) == len(jobs) or time.time() - started > args.timeout:
+            break
+        await asyncio.sleep(0.05)
+    elapsed = time.time() - started
+
+    waits = [job['started'] - job['created'] for job in finished if job['started']]
+    turnaround = {}
+    for job in finished:
+        turnaround.setdefault(job['user_id'], []).append(job['finished'] - job['created'])
+    user_means = [sum(values) / len(values) for values in turnaround.values()]
+    files = client.copied
+    api_calls = sum(client.calls.values())
+
+    return {
+        "users": args.users,
+        "seconds": round(elapsed, 3),
+        "jobs": len(finished),
+        "unfinished_jobs": len(jobs) - len(finished),
+        "failed_jobs": sum(1 for job in finished if job['state'] == 'failed'),
+        "jobs_per_minute": round(len(finished) / elapsed * 60, 1),
+        "files_copied": files,
+        "api_calls": api_calls,
+        "api_calls_per_file": round(api_calls / files, 3) if files else None,
+        "wait_p50_s": round(percentile(waits, 0.5), 3) if waits else None,
+        "wait_p99_s": round(percentile(waits, 0.99), 3) if waits else None,
+        "fairness": round(jain_index(user_means), 4),
+        "injected_flood_waits": client.flood_waits,
+        "handler_errors": dict(client.handler_errors),
+        "documents_sent": len(client.documents),
+        "calls": dict(client.calls.most_common()),
+    }
+
+
+def check(result, args):
+    """Gate failures as messages, empty when every limit holds"""
+    failures = []
+    if args.min_jobs_per_minute is not None and result["jobs_per_minute"] < args.min_jobs_per_minute:
+        failures.append(f"jobs_per_minute {result['jobs_per_minute']} < {args.min_jobs_per_minute}")
+    if args.max_calls_per_file is not None and (result["api_calls_per_file"] or 0) > args.max_calls_per_file:
+        failures.append(f"api_calls_per_file {result['api_calls_per_file']} > {args.max_calls_per_file}")
+    if args.max_wait_p99 is not None and (result["wait_p99_s"] or 0) > args.max_wait_p99:
+        failures.append(f"wait_p99_s {result['wait_p99_s']} > {args.max_wait_p99}")
+    if args.min_fairness is not None and result["fairness"] < args.min_fairness:
+        failures.append(f"fairness {result['fairness']} < {args.min_fairness}")
+    if result["unfinished_jobs"]:
+        failures.append(f"{result['unfinished_jobs']} jobs didn't finish within {args.timeout}s")
+    return failures
+
+
+def main(args):
+    # Keep the per-file prints of the handlers out of the report
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            result = asyncio.run(run(args))
+        finally:
+            sys.stdout = stdout
+
+    print(f"users: {args.users}, jobs per user: {args.jobs_per_user}, rate scale: {args.rate_scale}x")
+    for key, value in result.items():
+        print(f"  {key:<22}{value}")
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"time": time.time(), "config": vars(args), "results": result}, output, indent=2)
+        print(f"saved to {args.output}")
+
+    failures = check(result, args)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--jobs-per-user", type=int, default=3)
+    parser.add_argument("--job-size", type=int, default=40, help="messages per /link_txt job, /link uses at most 20")
+    parser.add_argument("--bulk-files", type=int, default=10)
+    parser.add_argument("--single-files", type=int, default=2)
+    parser.add_argument("--media-share", type=float, default=0.8, help="share of group messages that are files")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per stub API call")
+    parser.add_argument("--flood-rate", type=float, default=0.01)
+    parser.add_argument("--rate-scale", type=float, default=10)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    parser.add_argument("--min-jobs-per-minute", type=float)
+    parser.add_argument("--max-calls-per-file", type=float)
+    parser.add_argument("--max-wait-p99", type=float)
+    parser.add_argument("--min-fairness", type=float)
+    sys.exit(main(parser.parse_args()))
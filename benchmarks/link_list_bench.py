@@ -0,0 +1,95 @@
+"""Compare link list generation by string concatenation with the streaming writer
+
+Usage: python benchmarks/link_list_bench.py [--entries 10000] [--rounds 5]
+
+The old handlers grew one str with `+=` per file, encoded it and copied the
+bytes into a BytesIO. build_link_file encodes every line straight into the
+buffer. Both are timed over `--rounds` runs and their peak allocation is
+measured with tracemalloc.
+"""
+import io
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for key, value in {"API_ID": "0", "API_HASH": "bench", "BOT_TOKEN": "0:bench", "BIN_CHANNEL": "0",
+                   "ADMIN_ID": "0"}.items():
+    os.environ.setdefault(key, value)
+
+from web.utils.link_list import FORMATS, build_link_file
+
+HEADER = (
+    "📁 Batch Download Links - {count} Files",
+    "Generated from: Benchmark Channel",
+    "Date: 2024-01-01 00:00:00",
+)
+
+
+def make_entries(count):
+    return [
+        {'name': f"Some.Show.S01E{i:05d}.1080p.WEB-DL.x264_[group].mkv",
+         'url': f"https://stream.example.com/download/{100000 + i}/Some.Show.S01E{i:05d}.1080p.WEB-DL.x264_[group].mkv"}
+        for i in range(count)
+    ]
+
+
+def legacy(entries):
+    """What process_link_txt_task used to do"""
+    txt_content = HEADER[0].format(count=len(entries)) + "\n"
+    txt_content += HEADER[1] + "\n"
+    txt_content += HEADER[2] + "\n\n"
+    for idx, file_data in enumerate(entries, 1):
+        txt_content += f"{file_data['name']} : {file_data['url']}\n"
+    file_content = txt_content.encode('utf-8')
+    file_buffer = io.BytesIO(file_content)
+    file_buffer.name = "links.txt"
+    return file_buffer
+
+
+def streaming(entries, file_format):
+    header = (HEADER[0].format(count=len(entries)),) + HEADER[1:]
+    return build_link_file(((f['name'], f['url']) for f in entries), file_format, "links", header=header)
+
+
+def measure(rounds, build):
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        buffer = build()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    size = len(buffer.getvalue())
+
+    tracemalloc.start()
+    buffer = build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del buffer
+    return best, peak, size
+
+
+def main(args):
+    entries = make_entries(args.entries)
+    print(f"entries: {args.entries}, best of {args.rounds} rounds")
+    print(f"{'method':<18}{'time ms':>10}{'peak KB':>12}{'output KB':>12}")
+
+    results = [("legacy txt +=", measure(args.rounds, lambda: legacy(entries)))]
+    for file_format in FORMATS:
+        results.append((f"streaming {file_format}", measure(args.rounds, lambda: streaming(entries, file_format))))
+
+    for name, (seconds, peak, size) in results:
+        print(f"{name:<18}{seconds * 1000:>10.2f}{peak / 1024:>12.1f}{size / 1024:>12.1f}")
+
+    legacy_text = legacy(entries).getvalue()
+    streamed_text = streaming(entries, "txt").getvalue()
+    print(f"txt output identical to legacy: {legacy_text == streamed_text}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=5)
+    main(parser.parse_args())
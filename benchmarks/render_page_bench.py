@@ -0,0 +1,102 @@
+"""Compare /watch page rendering with and without the old loopback size request
+
+Usage: python benchmarks/render_page_bench.py [--views 50] [--latency 0.15]
+
+The old renderer sent a GET to our own STREAM_URL to read Content-Length,
+which started a real Telegram download for every page view. Here a local
+fake stream endpoint stands in for that URL: it waits `--latency` seconds
+(message lookup plus first GetFile) before sending headers, then streams
+1 MB chunks until the client goes away, counting every byte it pushed out.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for key, value in {"API_ID": "0", "API_HASH": "bench", "BOT_TOKEN": "0:bench", "BIN_CHANNEL": "0",
+                   "ADMIN_ID": "0"}.items():
+    os.environ.setdefault(key, value)
+# The page links to the fake stream endpoint below
+os.environ["STREAM_URL"] = "http://127.0.0.1:8765/"
+
+import aiohttp
+from aiohttp import web
+from web.utils.custom_dl import file_cache, file_cache_key
+from web.utils.render_template import get_size, render_page
+
+FILE_SIZE = 1536 * 1024 * 1024
+CHUNK = 1024 * 1024
+
+
+class FakeStream:
+    def __init__(self, latency):
+        self.latency = latency
+        self.bytes_sent = 0
+
+    async def handler(self, request):
+        # Headers only go out after the message lookup and the first GetFile
+        await asyncio.sleep(self.latency)
+        response = web.StreamResponse(headers={"Content-Length": str(FILE_SIZE)})
+        await response.prepare(request)
+        chunk = b"\0" * CHUNK
+        try:
+            for _ in range(FILE_SIZE // CHUNK):
+                await response.write(chunk)
+                self.bytes_sent += CHUNK
+                await asyncio.sleep(0.005)
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        return response
+
+
+async def legacy_file_size(src):
+    """What render_page used to do for documents"""
+    async with aiohttp.ClientSession() as s:
+        async with s.get(src) as u:
+            return get_size(u.headers.get('Content-Length', 0))
+
+
+async def timed(views, coro_factory):
+    started = time.perf_counter()
+    for i in range(views):
+        await coro_factory(i)
+    return (time.perf_counter() - started) / views
+
+
+async def main(args):
+    fake = FakeStream(args.latency)
+    app = web.Application()
+    app.router.add_get("/{message_id}", fake.handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 8765).start()
+
+    for message_id in range(args.views):
+        file_cache.set(file_cache_key(None, message_id), SimpleNamespace(
+            file_name=f"archive_{message_id}.zip", mime_type="application/zip", file_size=FILE_SIZE
+        ))
+
+    src = os.environ["STREAM_URL"]
+    legacy = await timed(args.views, lambda i: legacy_file_size(f"{src}{i}"))
+    await asyncio.sleep(args.latency)
+    legacy_bytes = fake.bytes_sent / args.views
+
+    fake.bytes_sent = 0
+    current = await timed(args.views, render_page)
+    current_bytes = fake.bytes_sent / args.views
+    await runner.cleanup()
+
+    print(f"page views:              {args.views}")
+    print(f"loopback size request:   {legacy * 1000:8.2f} ms/view, {legacy_bytes / 1024:10.1f} KB streamed/view")
+    print(f"size from properties:    {current * 1000:8.2f} ms/view, {current_bytes / 1024:10.1f} KB streamed/view")
+    print(f"saved per view:          {(legacy - current) * 1000:8.2f} ms, {(legacy_bytes - current_bytes) / 1024:10.1f} KB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--views", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.15, help="simulated Telegram latency in seconds")
+    asyncio.run(main(parser.parse_args()))
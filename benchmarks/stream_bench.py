@@ -0,0 +1,333 @@
+"""Drive the aiohttp app against an in-process fake Telegram backend
+
+Usage: python benchmarks/stream_bench.py [--requests 200] [--concurrency 16] [--files 4] [--file-size 64]
+       [--latency 0.08] [--jitter 0.04] [--bandwidth 20] [--flood-rate 0] [--error-rate 0]
+       [--range-share 0.7] [--block-cache 64]
+       [--read-timeout 10] [--seed 1] [--output results.json] [--compare old.json]
+
+temp.BOT is replaced by a fake client whose BIN_CHANNEL messages are
+synthetic documents, and its media session pool by one whose sessions
+answer upload.GetFile after `--latency` +/- `--jitter` seconds plus the
+block size over `--bandwidth` MB/s. `--flood-rate` and `--error-rate` are
+the chances that a GetFile raises FloodWait or TimeoutError instead.
+
+The web app is served on a local port and downloaded from by
+`--concurrency` clients: player style range requests (`--range-share`)
+and full downloads. Every body is checked byte for byte. Throughput,
+TTFB percentiles and peak memory are printed and, with `--output`, saved
+as JSON; `--compare` prints the change against an earlier JSON result.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import datetime
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for key, value in {"API_ID": "0", "API_HASH": "bench", "BOT_TOKEN": "0:bench", "BIN_CHANNEL": "0",
+                   "ADMIN_ID": "0", "STREAM_URL": "http://127.0.0.1:8080/", "DISK_CACHE_DIR": "",
+                   "MEDIA_SESSION_HEALTH_INTERVAL": "0", "STREAM_TRACE_SAMPLE_RATE": "0"}.items():
+    os.environ.setdefault(key, value)
+
+MB = 1024 * 1024
+# Synthetic file bytes repeat with this period, so any slice can be rebuilt
+PATTERN = bytes(range(251))
+FILLER = PATTERN * ((2 * MB) // len(PATTERN) + 2)
+
+
+def synthetic_bytes(file_index, offset, length):
+    """Content of synthetic file `file_index` at `offset`; files differ by a shifted pattern"""
+    chunks = []
+    while length > 0:
+        start = (offset + file_index * 17) % len(PATTERN)
+        piece = min(length, len(FILLER) - start)
+        chunks.append(FILLER[start:start + piece])
+        offset += piece
+        length -= piece
+    return b"".join(chunks)
+
+
+def rss_bytes():
+    """Resident set size of this process, or 0 where /proc isn't available"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(share * (len(values) - 1))))]
+
+
+class FakeSession:
+    """Stands in for a media Session: answers GetFile from the synthetic files"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.is_started = asyncio.Event()
+        self.is_started.set()
+
+    async def send(self, query):
+        return await self.backend.get_file(query)
+
+    async def stop(self):
+        self.is_started.clear()
+
+
+class FakeBackend:
+    def __init__(self, args):
+        from pyrogram import raw
+        from pyrogram.errors import FloodWait
+        self.raw = raw
+        self.FloodWait = FloodWait
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.file_size = args.file_size * MB
+        self.media_ids = {}  # media_id -> file index
+        self.getfile_calls = 0
+        self.flood_waits = 0
+        self.errors = 0
+
+    async def get_file(self, query):
+        args = self.args
+        self.getfile_calls += 1
+        delay = max(0.0, args.latency + self.random.uniform(-args.jitter, args.jitter))
+        delay += query.limit / (args.bandwidth * MB) if args.bandwidth > 0 else 0
+        await asyncio.sleep(delay)
+
+        roll = self.random.random()
+        if roll < args.flood_rate:
+            self.flood_waits += 1
+            raise self.FloodWait(value=1)
+        if roll < args.flood_rate + args.error_rate:
+            self.errors += 1
+            raise TimeoutError("fake GetFile timeout")
+
+        file_index = self.media_ids[query.location.id]
+        length = max(0, min(query.limit, self.file_size - query.offset))
+        return self.raw.types.upload.File(
+            type=self.raw.types.storage.FileUnknown(), mtime=0,
+            bytes=synthetic_bytes(file_index, query.offset, length)
+        )
+
+
+class FakeClient:
+    """Enough of a pyrogram Client for get_file_properties and yield_file"""
+
+    def __init__(self, backend, files):
+        from types import SimpleNamespace
+        from pyrogram import types
+        from pyrogram.file_id import FileId, FileType
+        self.name = "fake_bot"
+        self.me = SimpleNamespace(id=1)
+        self.messages = {}
+        for file_index in range(files):
+            message_id = 1000 + file_index
+            media_id = 5000 + file_index
+            backend.media_ids[media_id] = file_index
+            self.messages[message_id] = types.Message(
+                id=message_id,
+                date=datetime.datetime(2024, 1, 1),
+                document=types.Document(
+                    file_id=FileId(file_type=FileType.DOCUMENT, dc_id=4, media_id=media_id, access_hash=1,
+                                   file_reference=b"bench").encode(),
+                    file_unique_id=f"bench{file_index}",
+                    file_name=f"file{file_index}.mkv",
+                    mime_type="video/x-matroska",
+                    file_size=backend.file_size,
+                ),
+            )
+
+    async def get_messages(self, chat_id, message_id):
+        await asyncio.sleep(0.01)
+        return self.messages[message_id]
+
+
+async def download(session, base_url, message_id, file_index, byte_range, results):
+    headers = {}
+    if byte_range is not None:
+        headers["Range"] = "bytes={}-{}".format(*byte_range)
+    position = byte_range[0] if byte_range else 0
+    received = 0
+    corrupt = False
+    started = time.monotonic()
+    ttfb = None
+    try:
+        async with session.get(f"{base_url}/{message_id}/file.mkv", headers=headers) as response:
+            async for chunk in response.content.iter_any():
+                if ttfb is None:
+                    ttfb = time.monotonic() - started
+                # Checked as it arrives, so the client side holds no bodies
+                if not corrupt and chunk != synthetic_bytes(file_index, position + received, len(chunk)):
+                    corrupt = True
+                received += len(chunk)
+            status = response.status
+            expected_length = int(response.headers.get("Content-Length", -1))
+    except Exception as e:
+        results["errors"].append(f"{type(e).__name__}: {e}")
+        return
+
+    results["bytes"] += received
+    if ttfb is not None:
+        results["ttfb"].append(ttfb)
+    results["durations"].append(time.monotonic() - started)
+    if status not in (200, 206) or received != expected_length:
+        results["short"] += 1
+    elif corrupt:
+        results["corrupt"] += 1
+
+
+def make_workload(args, file_size):
+    """(file index, byte range or None for the whole file) per request"""
+    rng = random.Random(args.seed + 1)
+    workload = []
+    for _ in range(args.requests):
+        file_index = rng.randrange(args.files)
+        if rng.random() < args.range_share:
+            start = rng.randrange(file_size)
+            end = min(file_size - 1, start + rng.choice((1024, 64 * 1024, MB, 4 * MB, 8 * MB)) - 1)
+            workload.append((file_index, (start, end)))
+        else:
+            workload.append((file_index, None))
+    return workload
+
+
+async def run(args):
+    from aiohttp import ClientSession, ClientTimeout, TCPConnector, web
+    from info import temp
+    from web import web_server
+    from web.utils import media_sessions
+    from web.utils.block_fetcher import block_fetcher
+
+    backend = FakeBackend(args)
+    client = FakeClient(backend, args.files)
+    temp.BOT = client
+
+    class FakePool(media_sessions.MediaSessionPool):
+        async def create_session(self, dc_id):
+            return FakeSession(backend)
+
+    media_sessions._pools[client] = FakePool(client)
+
+    runner = web.AppRunner(await web_server())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    results = {"bytes": 0, "ttfb": [], "durations": [], "errors": [], "short": 0, "corrupt": 0}
+    workload = make_workload(args, backend.file_size)
+    baseline_rss = rss_bytes()
+    peak_rss = baseline_rss
+    done = asyncio.Event()
+
+    async def sample_memory():
+        nonlocal peak_rss
+        while not done.is_set():
+            peak_rss = max(peak_rss, rss_bytes())
+            await asyncio.sleep(0.05)
+
+    queue = asyncio.Queue()
+    for item in workload:
+        queue.put_nowait(item)
+
+    async def client_loop(session):
+        while not queue.empty():
+            file_index, byte_range = queue.get_nowait()
+            await download(session, base_url, 1000 + file_index, file_index, byte_range, results)
+
+    sampler = asyncio.ensure_future(sample_memory())
+    started = time.monotonic()
+    # A body cut short of its Content-Length stalls until the read timeout
+    timeout = ClientTimeout(sock_read=args.read_timeout)
+    async with ClientSession(connector=TCPConnector(limit=args.concurrency), timeout=timeout) as session:
+        await asyncio.gather(*(client_loop(session) for _ in range(args.concurrency)))
+    elapsed = time.monotonic() - started
+    done.set()
+    await sampler
+    await runner.cleanup()
+    await media_sessions.stop_session_pools()
+
+    return {
+        "requests": len(workload),
+        "seconds": round(elapsed, 3),
+        "throughput_mb_s": round(results["bytes"] / MB / elapsed, 2),
+        "bytes": results["bytes"],
+        "ttfb_p50_ms": round(percentile(results["ttfb"], 0.5) * 1000, 1) if results["ttfb"] else None,
+        "ttfb_p99_ms": round(percentile(results["ttfb"], 0.99) * 1000, 1) if results["ttfb"] else None,
+        "duration_p50_ms": round(percentile(results["durations"], 0.5) * 1000, 1) if results["durations"] else None,
+        "peak_rss_mb": round(peak_rss / MB, 1),
+        "rss_growth_mb": round((peak_rss - baseline_rss) / MB, 1),
+        "short_responses": results["short"],
+        "corrupt_responses": results["corrupt"],
+        "failed_requests": len(results["errors"]),
+        "failures": sorted(set(results["errors"]))[:10],
+        "getfile_calls": backend.getfile_calls,
+        "injected_flood_waits": backend.flood_waits,
+        "injected_errors": backend.errors,
+        "block_cache": block_fetcher.stats(),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(result, path):
+    with open(path) as old_file:
+        old = json.load(old_file)["results"]
+    print(f"\ncompared with {path}:")
+    for key, value in result.items():
+        before = old.get(key)
+        if isinstance(value, (int, float)) and isinstance(before, (int, float)) and before:
+            print(f"  {key:<22}{before:>12} -> {value:<12}({(value - before) / before * 100:+.1f}%)")
+
+
+def main(args):
+    # Read by web.utils.block_fetcher when run() imports it
+    os.environ["BLOCK_CACHE_SIZE"] = str(args.block_cache * MB)
+    result = asyncio.run(run(args))
+    print(f"requests: {args.requests}, concurrency: {args.concurrency}, files: {args.files} x {args.file_size} MB")
+    for key, value in result.items():
+        print(f"  {key:<22}{value}")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"commit": git_commit(), "time": time.time(), "config": vars(args), "results": result},
+                      output, indent=2)
+        print(f"saved to {args.output}")
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--file-size", type=int, default=64, help="MB per synthetic file")
+    parser.add_argument("--latency", type=float, default=0.08, help="seconds per GetFile round trip")
+    parser.add_argument("--jitter", type=float, default=0.04)
+    parser.add_argument("--bandwidth", type=float, default=20, help="MB/s per GetFile, 0 for unlimited")
+    parser.add_argument("--flood-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--range-share", type=float, default=0.7)
+    parser.add_argument("--block-cache", type=int, default=64, help="MB of the shared block cache")
+    parser.add_argument("--read-timeout", type=float, default=10, help="seconds without body bytes before a download fails")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    parser.add_argument("--compare")
+    main(parser.parse_args())
@@ -2,9 +2,18 @@
 
 
 from pyrogram import Client, __version__
-from info import API_ID, API_HASH, BOT_TOKEN, PORT, BIN_CHANNEL, temp
+from info import (
+    API_ID, API_HASH, BOT_TOKEN, PORT, BIN_CHANNEL, HELPER_BOT_TOKENS, METRICS_PORT, STREAM_WORKERS, WARMUP_DCS, temp
+)
 from aiohttp import web
 from plugins import web_server
+from web import metrics_server
+from plugins.main import resume_jobs
+from web.utils.client_pool import client_pool
+from web.utils.job_store import job_store
+from web.utils.media_sessions import get_session_pool, stop_session_pools
+import asyncio
+import sys
 import os
 
 
@@ -54,12 +63,79 @@ class Bot(Client):
             else:
                 print("Please add the bot to the BIN_CHANNEL as an administrator")
         
+        client_pool.add(self)
+        if HELPER_BOT_TOKENS and not STREAM_WORKERS:
+            # Helper bots only download, they don't handle any updates
+            await client_pool.start_helpers(HELPER_BOT_TOKENS)
+        
+        # Bring back bulk mode lists and finish the jobs a restart interrupted
+        await resume_jobs(self)
+
+        if STREAM_WORKERS:
+            # Downloads are served by worker processes, this one only handles updates
+            self.stream_workers = {}
+            self.stopping = False
+            for index in range(1, STREAM_WORKERS + 1):
+                await self.start_stream_worker(index)
+            self.supervisor_task = asyncio.create_task(self.supervise_stream_workers())
+            self.metrics_runner = None
+            if METRICS_PORT:
+                # The workers only export their own streaming metrics
+                self.metrics_runner = web.AppRunner(await metrics_server())
+                await self.metrics_runner.setup()
+                await web.TCPSite(self.metrics_runner, "0.0.0.0", METRICS_PORT).start()
+                print(f"Bot metrics served on port {METRICS_PORT}")
+            print(f"Bot started with {STREAM_WORKERS} stream workers. Pyrogram v{__version__}")
+            return
+        
         app = web.AppRunner(await web_server())
         await app.setup()
         await web.TCPSite(app, "0.0.0.0", PORT).start()
+
+        if WARMUP_DCS:
+            # Open media sessions in the background; /ready reports progress
+            print(f"Warming up media sessions for DCs: {WARMUP_DCS}")
+            self.warmup_task = asyncio.create_task(asyncio.gather(
+                *(get_session_pool(client).warm_up(WARMUP_DCS) for client in client_pool.states)
+            ))
+
         print(f"Bot started. Pyrogram v{__version__}")
 
+    async def start_stream_worker(self, index):
+        self.stream_workers[index] = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "web.stream_worker", str(index)
+        )
+
+    async def supervise_stream_workers(self):
+        """Start a worker again if it exits while the bot is running"""
+        while not self.stopping:
+            await asyncio.sleep(5)
+            for index, process in list(self.stream_workers.items()):
+                if process.returncode is not None and not self.stopping:
+                    print(f"Stream worker {index} exited with code {process.returncode}, restarting")
+                    await self.start_stream_worker(index)
+
+    async def stop_stream_workers(self):
+        self.stopping = True
+        self.supervisor_task.cancel()
+        for process in self.stream_workers.values():
+            if process.returncode is None:
+                process.terminate()
+        for index, process in self.stream_workers.items():
+            try:
+                await asyncio.wait_for(process.wait(), 10)
+            except asyncio.TimeoutError:
+                print(f"Stream worker {index} didn't stop in time, killing it")
+                process.kill()
+
     async def stop(self, *args):
+        if STREAM_WORKERS:
+            await self.stop_stream_workers()
+            if self.metrics_runner is not None:
+                await self.metrics_runner.cleanup()
+        await stop_session_pools()
+        await client_pool.stop()
+        await job_store.close()
         await super().stop()
         print("Bot stopped. Bye.")
 
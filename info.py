@@ -16,3 +16,84 @@ PORT = int(os.getenv('PORT', 8080))
 BIN_CHANNEL = int(os.getenv("BIN_CHANNEL"))
 STREAM_URL = os.getenv("STREAM_URL")
 ADMIN_ID = int(os.getenv("ADMIN_ID"))
+
+# Streaming: number of GetFile requests kept in flight per stream and the
+# most bytes a single stream may hold in its read-ahead buffer
+PREFETCH_CHUNKS = int(os.getenv("PREFETCH_CHUNKS", 4))
+PREFETCH_MAX_BYTES = int(os.getenv("PREFETCH_MAX_BYTES", 8 * 1024 * 1024))
+
+# In-memory LRU of recently downloaded blocks shared by all streams
+BLOCK_CACHE_SIZE = int(os.getenv("BLOCK_CACHE_SIZE", 64 * 1024 * 1024))
+
+# Optional on-disk block cache; fully cached ranges are served with sendfile
+DISK_CACHE_DIR = os.getenv("DISK_CACHE_DIR", "")
+DISK_CACHE_SIZE = int(os.getenv("DISK_CACHE_SIZE", 2 * 1024 * 1024 * 1024))
+
+# Cache of decoded file properties per BIN_CHANNEL message
+FILE_CACHE_SIZE = int(os.getenv("FILE_CACHE_SIZE", 1024))
+FILE_CACHE_TTL = int(os.getenv("FILE_CACHE_TTL", 3600))
+
+# Media sessions opened per DC for GetFile traffic and how often idle ones are pinged
+MEDIA_SESSIONS_PER_DC = int(os.getenv("MEDIA_SESSIONS_PER_DC", 2))
+MEDIA_SESSION_HEALTH_INTERVAL = int(os.getenv("MEDIA_SESSION_HEALTH_INTERVAL", 60))
+# Consecutive GetFile timeouts after which a media session is replaced
+MEDIA_SESSION_MAX_TIMEOUTS = int(os.getenv("MEDIA_SESSION_MAX_TIMEOUTS", 3))
+
+# DCs whose media sessions are opened at startup: "all", a comma separated
+# list such as "1,4" or empty to open them on the first stream
+WARMUP_DCS = os.getenv("WARMUP_DCS", "").strip().lower()
+if WARMUP_DCS == "all":
+    WARMUP_DCS = [1, 2, 3, 4, 5]
+else:
+    WARMUP_DCS = [int(dc_id) for dc_id in WARMUP_DCS.split(",") if dc_id.strip()]
+
+# Re-read web/template/*.html when they change (for development)
+TEMPLATE_RELOAD = os.getenv("TEMPLATE_RELOAD", "").lower() in ("1", "true", "yes")
+
+# Most Telegram API calls per second the bot makes in total; per-method rates
+# start below this and adapt to FloodWait on their own
+TELEGRAM_MAX_RATE = float(os.getenv("TELEGRAM_MAX_RATE", 25))
+
+# /link and /link_txt jobs: workers shared by all users, jobs one user may
+# run at once and jobs one user may have waiting
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", 4))
+BULK_JOBS_PER_USER = int(os.getenv("BULK_JOBS_PER_USER", 1))
+BULK_MAX_QUEUED = int(os.getenv("BULK_MAX_QUEUED", 20))
+
+# SQLite file that keeps bulk jobs, bulk mode lists and the BIN_CHANNEL file
+# index across restarts, empty to keep them in memory only, and how often
+# queued changes are written
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.db")
+JOB_DB_FLUSH_INTERVAL = float(os.getenv("JOB_DB_FLUSH_INTERVAL", 1))
+
+# Progress messages are edited at most once per this many seconds
+STATUS_EDIT_INTERVAL = float(os.getenv("STATUS_EDIT_INTERVAL", 3))
+
+# Extra bot tokens, comma separated, whose clients share the streaming
+# traffic with the main bot. Each helper bot must be an admin of BIN_CHANNEL.
+HELPER_BOT_TOKENS = [token.strip() for token in os.getenv("HELPER_BOT_TOKENS", "").split(",") if token.strip()]
+
+# Streaming worker processes that serve HTTP on PORT together (SO_REUSEPORT),
+# each with its own Telegram client, while this process only handles bot
+# updates. 0 serves HTTP from the bot process itself. File properties are
+# shared between the workers through SHARED_CACHE_PATH.
+STREAM_WORKERS = int(os.getenv("STREAM_WORKERS", 0))
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "stream_cache.db")
+# Port where the bot process serves its own /metrics while STREAM_WORKERS
+# serve PORT, 0 to not export the bot metrics
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+
+# Share of download requests traced (0 to 1), and streams whose first byte or
+# any later chunk takes this many seconds are written as a JSON line to
+# SLOW_STREAM_LOG (empty prints them)
+STREAM_TRACE_SAMPLE_RATE = float(os.getenv("STREAM_TRACE_SAMPLE_RATE", 0.01))
+SLOW_STREAM_SECONDS = float(os.getenv("SLOW_STREAM_SECONDS", 5))
+SLOW_STREAM_LOG = os.getenv("SLOW_STREAM_LOG", "slow_streams.log")
+
+# A failed block download is retried this many times within the same
+# response, after STREAM_RETRY_BACKOFF seconds doubling per attempt, or
+# through another client. FloodWaits longer than STREAM_MAX_FLOOD_WAIT
+# seconds end the stream if no other client can take over.
+STREAM_RETRIES = int(os.getenv("STREAM_RETRIES", 4))
+STREAM_RETRY_BACKOFF = float(os.getenv("STREAM_RETRY_BACKOFF", 0.5))
+STREAM_MAX_FLOOD_WAIT = float(os.getenv("STREAM_MAX_FLOOD_WAIT", 30))
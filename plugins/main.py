@@ -1,41 +1,176 @@
 import os
-import io
 import asyncio
-from pyrogram import Client, filters
+from pyrogram import Client, filters, raw
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from pyrogram.errors import FloodWait, ChatAdminRequired, UserNotParticipant
 from pyrogram.enums import ChatType
-from info import STREAM_URL, BIN_CHANNEL, ADMIN_ID, temp
+from info import STREAM_URL, BIN_CHANNEL, ADMIN_ID, BULK_WORKERS, BULK_JOBS_PER_USER, BULK_MAX_QUEUED, temp
+from web.utils.client_pool import client_pool
+from web.utils.file_index import file_index, media_unique_id
+from web.utils.job_store import job_store
+from web.utils.link_list import FORMATS, build_link_file, numbered_line, parse_format
+from web.utils.metrics import bin_copies, bin_copy_seconds, bulk_job_seconds, bulk_jobs, registry
+from web.utils.rate_limiter import rate_limiter
+from web.utils.status_updater import status_updater
 import time
-from collections import defaultdict
+from collections import OrderedDict, defaultdict, deque
+
+# Telegram returns at most 200 messages per get_messages call
+GET_MESSAGES_BATCH = 200
+# and forwards at most 100 messages per call
+COPY_BATCH = 100
+# Bulk mode waits this long for more files before copying them together
+COPY_BATCH_DELAY = 2
+# and starts a new summary message after this many seconds without files
+BULK_SUMMARY_IDLE = 60
 
 
 # Queue system for bulk operations
 class BulkQueue:
-    def __init__(self):
-        self.queues = defaultdict(list)  # user_id -> list of tasks
-        self.processing = defaultdict(bool)  # user_id -> is_processing
-    
-    async def add_task(self, user_id, task_data):
-        """Add a task to user's queue"""
+    """Runs bulk jobs on a fixed pool of workers, taking turns between users"""
+
+    def __init__(self, workers=BULK_WORKERS, per_user=BULK_JOBS_PER_USER, max_queued=BULK_MAX_QUEUED):
+        self.worker_count = workers
+        self.per_user = per_user
+        self.max_queued = max_queued
+        self.queues = defaultdict(deque)  # user_id -> deque of waiting tasks
+        self.turns = deque()  # users with waiting tasks, in round-robin order
+        self.running = defaultdict(int)  # user_id -> jobs running right now
+        self.jobs = OrderedDict()  # job_id -> job info, oldest first
+        self.next_job_id = 1
+        self.workers = []
+        self.wakeup = None
+
+    def start(self):
+        if not self.workers:
+            self.wakeup = asyncio.Condition()
+            self.workers = [asyncio.ensure_future(self.worker()) for _ in range(self.worker_count)]
+
+    async def add_task(self, user_id, task_data, job_id=None):
+        """Queue a task and return its job id right away, or None if the user's queue is full
+
+        Jobs resumed after a restart keep their saved `job_id`.
+        """
+        resumed = job_id is not None
+        if not resumed and len(self.queues[user_id]) >= self.max_queued:
+            return None
+        self.start()
+
+        if not resumed:
+            job_id = self.next_job_id
+        self.next_job_id = max(self.next_job_id, job_id + 1)
+        task_data['job_id'] = job_id
+        task_data['user_id'] = user_id
+        self.jobs[job_id] = {
+            'id': job_id,
+            'user_id': user_id,
+            'type': task_data['type'],
+            'count': task_data.get('count'),
+            'state': 'queued',
+            'created': task_data.get('created', time.time()),
+            'started': None,
+            'finished': None,
+            'error': None,
+        }
+        self.forget_old_jobs()
+        if not resumed:
+            job_store.add_job({
+                **self.jobs[job_id],
+                'chat_id': task_data['chat_id'],
+                'start_id': task_data['replied_message_id'],
+                'base_name': task_data.get('base_name'),
+                'format': task_data.get('format'),
+                'message_id': task_data['message'].id,
+                'status_msg_id': task_data['status_msg'].id,
+            })
+
+        if not self.queues[user_id]:
+            self.turns.append(user_id)
         self.queues[user_id].append(task_data)
-        
-        # Start processing if not already processing
-        if not self.processing[user_id]:
-            await self.process_queue(user_id)
-    
-    async def process_queue(self, user_id):
-        """Process all tasks in user's queue"""
-        if self.processing[user_id]:
-            return
-        
-        self.processing[user_id] = True
-        
-        while self.queues[user_id]:
-            task = self.queues[user_id].pop(0)
-            await self.execute_task(task)
-        
-        self.processing[user_id] = False
+        async with self.wakeup:
+            self.wakeup.notify()
+        return job_id
+
+    def next_task(self):
+        """Waiting task of the next user in turn that is below its running limit"""
+        for _ in range(len(self.turns)):
+            user_id = self.turns.popleft()
+            if self.running[user_id] >= self.per_user:
+                self.turns.append(user_id)
+                continue
+            task = self.queues[user_id].popleft()
+            if self.queues[user_id]:
+                self.turns.append(user_id)
+            else:
+                del self.queues[user_id]
+            return task
+        return None
+
+    async def worker(self):
+        while True:
+            async with self.wakeup:
+                task = self.next_task()
+                while task is None:
+                    await self.wakeup.wait()
+                    task = self.next_task()
+
+            user_id = task['user_id']
+            job = self.jobs.get(task['job_id'], {})
+            self.running[user_id] += 1
+            job['state'], job['started'] = 'running', time.time()
+            job_store.set_state(task['job_id'], 'running')
+            try:
+                await self.execute_task(task)
+                job['state'] = 'failed' if job.get('error') else 'done'
+                # A job cut short by a shutdown stays 'running' and is resumed on the next start
+                job_store.set_state(task['job_id'], job['state'], job.get('error'))
+                bulk_jobs.inc(type=task['type'], state=job['state'])
+                bulk_job_seconds.observe(time.time() - job['started'], type=task['type'])
+            finally:
+                job['finished'] = time.time()
+                self.running[user_id] -= 1
+                if not self.running[user_id]:
+                    del self.running[user_id]
+                # A user may have been skipped while at the limit
+                async with self.wakeup:
+                    self.wakeup.notify()
+
+    def position(self, job_id):
+        """1-based place of a queued job among its user's waiting jobs"""
+        job = self.jobs.get(job_id)
+        if not job or job['state'] != 'queued':
+            return None
+        for i, task in enumerate(self.queues.get(job['user_id'], ()), 1):
+            if task['job_id'] == job_id:
+                return i
+        return None
+
+    def must_wait(self, job_id):
+        """True if a queued job can't start until another job finishes"""
+        position = self.position(job_id)
+        if position is None:
+            return False
+        user_id = self.jobs[job_id]['user_id']
+        return position > 1 or self.running.get(user_id, 0) >= self.per_user or \
+            sum(self.running.values()) >= self.worker_count
+
+    def user_jobs(self, user_id):
+        return [job for job in self.jobs.values() if job['user_id'] == user_id]
+
+    def forget_old_jobs(self, keep=500):
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= keep:
+                break
+            if self.jobs[job_id]['state'] in ('done', 'failed'):
+                del self.jobs[job_id]
+
+    def stats(self):
+        return {
+            'workers': self.worker_count,
+            'queued': sum(len(q) for q in self.queues.values()),
+            'running': sum(self.running.values()),
+            'users_waiting': len(self.turns),
+        }
     
     async def execute_task(self, task_data):
         """Execute a single task"""
@@ -46,9 +181,11 @@ class BulkQueue:
                 await self.process_link_task(task_data)
         except Exception as e:
             print(f"Error executing task: {e}")
+            if task_data.get('job_id') in self.jobs:
+                self.jobs[task_data['job_id']]['error'] = str(e)
             if 'status_msg' in task_data:
                 try:
-                    await task_data['status_msg'].edit_text(f"❌ **Error:** {str(e)}")
+                    await status_updater.finish(task_data['status_msg'], f"❌ **Error:** {str(e)}")
                 except:
                     pass
     
@@ -62,91 +199,136 @@ class BulkQueue:
         status_msg = task_data['status_msg']
         base_name = task_data.get('base_name', f'batch_links_{chat_id}_{replied_message_id}')
         
-        # Get messages starting from replied message
-        processed_files = []
-        current_message_id = replied_message_id
+        if task_data.get('queued'):
+            status_updater.update(status_msg, f"⏳ **Processing {count} files for text file generation...**")
         
-        for i in range(count):
-            try:
-                # Add delay to prevent flood
-                if i > 0:
-                    await asyncio.sleep(2)
-                
-                # Update status every 5 files
-                if i % 5 == 0 and i > 0:
-                    await status_msg.edit_text(f"⏳ **Processing files... {i}/{count} completed**")
-                
-                # Get the current message
-                current_message = await client.get_messages(chat_id, current_message_id)
-                
-                # Check if message has file
-                if current_message and (current_message.document or current_message.video):
-                    file_id = current_message.document or current_message.video
-                    
-                    # Copy file to bin channel
-                    msg = await copy_file_with_retry(client, current_message)
-                    
-                    if msg:
-                        file_name = file_id.file_name.replace(" ", "_") if file_id.file_name else f"file_{msg.id}"
-                        download_url = f"{STREAM_URL}/download/{msg.id}/{file_name}"
-                        
-                        processed_files.append({
-                            'name': file_name,
-                            'url': download_url
-                        })
-                
-                # Move to next message
-                current_message_id += 1
-                
-            except Exception as e:
-                print(f"Error processing message {current_message_id}: {e}")
-                current_message_id += 1
-                continue
+        processed_files, stats = await copy_message_range(client, chat_id, replied_message_id, count, status_msg,
+                                                          job_id=task_data['job_id'])
         
         if processed_files:
-            # Create text file content
-            txt_content = f"📁 Batch Download Links - {len(processed_files)} Files\n"
-            txt_content += f"Generated from: {message.chat.title or 'Channel/Group'}\n"
-            txt_content += f"Date: {message.date.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-            
-            for idx, file_data in enumerate(processed_files, 1):
-                txt_content += f"{file_data['name']} : {file_data['url']}\n"
-            
-            # Create file buffer with base name
-            file_content = txt_content.encode('utf-8')
-            file_buffer = io.BytesIO(file_content)
-            file_buffer.name = f"{base_name}_links_{count}_files.txt"
+            # Write the link list straight into the file buffer
+            file_buffer = build_link_file(
+                ((file_data['name'], file_data['url']) for file_data in processed_files),
+                task_data.get('format') or 'txt',
+                f"{base_name}_links_{count}_files",
+                header=(
+                    f"📁 Batch Download Links - {len(processed_files)} Files",
+                    f"Generated from: {message.chat.title or 'Channel/Group'}",
+                    f"Date: {message.date.strftime('%Y-%m-%d %H:%M:%S')}",
+                )
+            )
             
-            await status_msg.delete()
+            status_updater.forget(status_msg)
+            await rate_limiter.call("delete_messages", status_msg.delete)
             
             # Try to send in the same chat, if fails send to user privately
             try:
-                await message.reply_document(
+                await rate_limiter.call(
+                    "send_document", message.reply_document,
                     document=file_buffer,
-                    file_name=f"{base_name}_links_{count}_files.txt",
-                    caption=f"📋 **Batch Links Generated!**\n\n**Total Files:** {len(processed_files)}\n**Source:** {message.chat.title or 'Channel/Group'}\n\n**Powered By - @sdbots1**"
+                    file_name=file_buffer.name,
+                    caption=f"📋 **Batch Links Generated!**\n\n**Total Files:** {len(processed_files)}\n**Source:** {message.chat.title or 'Channel/Group'}\n{format_stats(stats)}\n\n**Powered By - @sdbots1**"
                 )
             except Exception as e:
                 # If can't send in channel, send to user privately
                 try:
-                    await client.send_document(
+                    file_buffer.seek(0)
+                    await rate_limiter.call(
+                        "send_document", client.send_document,
                         chat_id=message.from_user.id,
                         document=file_buffer,
-                        file_name=f"{base_name}_links_{count}_files.txt",
-                        caption=f"📋 **Batch Links Generated!**\n\n**Total Files:** {len(processed_files)}\n**Source:** {message.chat.title or 'Channel/Group'}\n**Note:** Sent privately because bot can't send files in the channel.\n\n**Powered By - @sdbots1**"
+                        file_name=file_buffer.name,
+                        caption=f"📋 **Batch Links Generated!**\n\n**Total Files:** {len(processed_files)}\n**Source:** {message.chat.title or 'Channel/Group'}\n{format_stats(stats)}\n**Note:** Sent privately because bot can't send files in the channel.\n\n**Powered By - @sdbots1**"
                     )
                 except Exception as private_error:
                     print(f"Failed to send document privately: {private_error}")
         else:
-            await status_msg.edit_text("❌ **No valid files found in the specified range!**")
+            await status_updater.finish(status_msg, "❌ **No valid files found in the specified range!**")
     
     async def process_link_task(self, task_data):
         """Process link task"""
-        # Similar implementation to link_txt but without file generation
-        pass
+        client = task_data['client']
+        message = task_data['message']
+        user_id = task_data['user_id']
+        status_msg = task_data['status_msg']
+        
+        if task_data.get('queued'):
+            status_updater.update(status_msg, f"⏳ **Processing {task_data['count']} files starting from replied message...**")
+        processed_files, stats = await copy_message_range(
+            client, task_data['chat_id'], task_data['replied_message_id'], task_data['count'],
+            job_id=task_data['job_id']
+        )
+        
+        if processed_files:
+            # Create response message
+            response_text = f"📋 **Generated {len(processed_files)} file links:**\n\n"
+            
+            for idx, file_data in enumerate(processed_files, 1):
+                response_text += f"{idx}. [{file_data['name']}]({file_data['url']})\n"
+            
+            response_text += f"\n{format_stats(stats)}\n**Powered By - @sdbots1**"
+            
+            try:
+                await status_updater.finish(status_msg, response_text, disable_web_page_preview=True)
+            except Exception:
+                # If can't edit in channel, send to user privately
+                await rate_limiter.call(
+                    "send_message", client.send_message,
+                    chat_id=user_id,
+                    text=f"📋 **Links from {message.chat.title}:**\n\n{response_text}",
+                    disable_web_page_preview=True
+                )
+                await status_updater.finish(status_msg, "✅ **Links generated and sent to you privately!**")
+        else:
+            await status_updater.finish(status_msg, "❌ **No valid files found in the specified range!**")
 
 # Initialize queue system
 bulk_queue = BulkQueue()
+registry.add_stats("file2link_bulk_queue", bulk_queue.stats)
+registry.add_stats("file2link_file_index", file_index.stats)
+registry.add_stats("file2link_job_store", job_store.stats)
+registry.add_stats("file2link_status_updater", status_updater.stats)
+registry.add_stats("file2link_rate_limiter", rate_limiter.stats, label="method")
+
+
+async def resume_jobs(client):
+    """Restore BULK_FILES and the file index, and queue the jobs a restart interrupted"""
+    jobs, bulk_files = job_store.open()
+    temp.BULK_FILES.update(bulk_files)
+    file_index.load()
+    # Job ids keep counting up across restarts
+    bulk_queue.next_job_id = job_store.last_job_id() + 1
+    
+    for job in jobs:
+        try:
+            message, status_msg = await rate_limiter.call(
+                "get_messages", client.get_messages, job['chat_id'], [job['message_id'], job['status_msg_id']]
+            )
+            if not message or message.empty:
+                raise ValueError("the command message was deleted")
+            if not status_msg or status_msg.empty:
+                status_msg = await rate_limiter.call("send_message", message.reply_text, "🔄 **Resuming after a restart...**")
+            else:
+                status_updater.update(status_msg, "🔄 **Resuming after a restart...**")
+        except Exception as e:
+            print(f"Could not resume job #{job['id']}: {e}")
+            job_store.set_state(job['id'], 'failed', str(e))
+            continue
+        
+        await bulk_queue.add_task(job['user_id'], {
+            'type': job['type'],
+            'client': client,
+            'message': message,
+            'count': job['count'],
+            'chat_id': job['chat_id'],
+            'replied_message_id': job['start_id'],
+            'status_msg': status_msg,
+            'base_name': job['base_name'],
+            'format': job['format'],
+            'created': job['created'],
+            'queued': True
+        }, job_id=job['id'])
+        print(f"Resumed job #{job['id']} after message {job['last_message_id']}")
 
 
 def is_authorized(user_id):
@@ -158,18 +340,18 @@ async def check_channel_permissions(client, chat_id, user_id):
     """Check if bot has necessary permissions in channel"""
     try:
         # Check if it's a channel
-        chat = await client.get_chat(chat_id)
+        chat = await rate_limiter.call("get_chat", client.get_chat, chat_id)
         if chat.type not in [ChatType.CHANNEL, ChatType.SUPERGROUP]:
             return True  # Not a channel, no special checks needed
         
         # Check bot permissions
-        bot_member = await client.get_chat_member(chat_id, "me")
+        bot_member = await rate_limiter.call("get_chat_member", client.get_chat_member, chat_id, "me")
         if not bot_member.privileges:
             return False
             
         # Check if user is admin or has permissions
         try:
-            user_member = await client.get_chat_member(chat_id, user_id)
+            user_member = await rate_limiter.call("get_chat_member", client.get_chat_member, chat_id, user_id)
             if user_member.status in ["creator", "administrator"]:
                 return True
         except Exception:
@@ -186,7 +368,7 @@ async def start(client, message):
     user_id = message.from_user.id
     
     if not is_authorized(user_id):
-        await message.reply_text("❌ **Access Denied!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Access Denied!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
         return
     
     start_text = f"""**Hello {message.from_user.mention},
@@ -196,14 +378,15 @@ I am a Telegram Video Stream Bot. Send me any video and I will give you streamin
 📋 **Available Commands:**
 • Send any file - Get instant download link
 • /bulk_links - Start bulk file collection
-• /get_bulk_link - Get all bulk links in a text file
+• /get_bulk_link [format] - Get all bulk links in a text file
 • /clear_bulk - Clear your bulk file queue
 • /exit_bulk - Exit bulk mode and return to normal mode
-• /link_txt <count> - Generate links for your bulk files (Private chat only)
+• /link_txt <count> [format] - Generate links for your bulk files (Private chat only)
 
 **Group/Channel Commands:**
 • Reply to file: /link <count> - Get links for next files
-• Reply to file: /link_txt <count> - Get links in text file
+• Reply to file: /link_txt <count> [format] - Get links in text file
+• /status [job id] - Check your queued /link and /link_txt jobs
 
 **Channel Usage Tips:**
 • Make sure bot is admin in channel
@@ -215,9 +398,12 @@ I am a Telegram Video Stream Bot. Send me any video and I will give you streamin
 • Use /bulk_links mode for multiple files
 • Bot can process files from any source
 
+**Link File Formats:** txt (default), m3u8 playlist, csv, json
+Example: /link_txt 10 m3u8
+
 **Powered By - @sdbots1**"""
     
-    await message.reply_text(start_text)
+    await rate_limiter.call("send_message", message.reply_text, start_text)
 
 
 @Client.on_message(filters.command("link_txt") & filters.private)
@@ -225,60 +411,61 @@ async def private_link_txt_handler(client, message):
     user_id = message.from_user.id
     
     if not is_authorized(user_id):
-        await message.reply_text("❌ **Access Denied!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Access Denied!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
         return
     
     # Check if user has bulk files
     if user_id not in temp.BULK_FILES or not temp.BULK_FILES[user_id]:
-        await message.reply_text("❌ **No files in your bulk queue!**\n\nUse /bulk_links to start adding files, then use this command.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **No files in your bulk queue!**\n\nUse /bulk_links to start adding files, then use this command.")
         return
     
     # Extract count from command
     try:
         command_parts = message.text.split()
-        if len(command_parts) != 2:
-            await message.reply_text(f"**Usage:** `/link_txt <count>`\n\nExample: `/link_txt 10`\n\n**Available files in queue:** {len(temp.BULK_FILES[user_id])}")
+        if len(command_parts) not in (2, 3):
+            await rate_limiter.call("send_message", message.reply_text, f"**Usage:** `/link_txt <count> [format]`\n\nExample: `/link_txt 10` or `/link_txt 10 m3u8`\n\n**Formats:** {FORMAT_NAMES}\n\n**Available files in queue:** {len(temp.BULK_FILES[user_id])}")
             return
         
         count = int(command_parts[1])
         available_files = len(temp.BULK_FILES[user_id])
+        file_format = await get_format(message, command_parts, 2)
+        if not file_format:
+            return
         
         if count <= 0:
-            await message.reply_text("❌ **Count must be greater than 0!**")
+            await rate_limiter.call("send_message", message.reply_text, "❌ **Count must be greater than 0!**")
             return
         
         if count > available_files:
-            await message.reply_text(f"❌ **You only have {available_files} files in queue!**\n\nUse a count between 1 and {available_files}")
+            await rate_limiter.call("send_message", message.reply_text, f"❌ **You only have {available_files} files in queue!**\n\nUse a count between 1 and {available_files}")
             return
         
     except ValueError:
-        await message.reply_text("❌ **Invalid count! Please provide a number.**\n\nExample: `/link_txt 10`")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Invalid count! Please provide a number.**\n\nExample: `/link_txt 10`")
         return
     
-    # Create text file from bulk files
-    selected_files = temp.BULK_FILES[user_id][:count]
-    
-    # Create text file content
-    txt_content = f"📁 Bulk Download Links - {count} Files\n"
-    txt_content += f"Generated from: Private Bot Chat\n"
-    txt_content += f"Date: {message.date.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-    
-    for idx, file_data in enumerate(selected_files, 1):
-        txt_content += f"{file_data['name']} : {file_data['download_url']}\n"
-    
-    # Create file buffer
-    file_content = txt_content.encode('utf-8')
-    file_buffer = io.BytesIO(file_content)
-    file_buffer.name = f"bulk_links_{user_id}_{int(time.time())}.txt"
+    # Create the link file from the first `count` bulk files
+    file_buffer = build_link_file(
+        ((file_data['name'], file_data['download_url']) for file_data in temp.BULK_FILES[user_id][:count]),
+        file_format,
+        f"bulk_links_{count}_files",
+        header=(
+            f"📁 Bulk Download Links - {count} Files",
+            "Generated from: Private Bot Chat",
+            f"Date: {message.date.strftime('%Y-%m-%d %H:%M:%S')}",
+        )
+    )
     
-    await message.reply_document(
+    await rate_limiter.call(
+        "send_document", message.reply_document,
         document=file_buffer,
-        file_name=f"bulk_links_{count}_files.txt",
+        file_name=file_buffer.name,
         caption=f"📋 **Bulk Links Generated!**\n\n**Files processed:** {count}/{len(temp.BULK_FILES[user_id])}\n**Remaining in queue:** {len(temp.BULK_FILES[user_id]) - count}\n\n**Powered By - @sdbots1**"
     )
     
     # Remove processed files from queue
     temp.BULK_FILES[user_id] = temp.BULK_FILES[user_id][count:]
+    job_store.drop_bulk_files(user_id, count)
 
 
 @Client.on_message(filters.command("link") & (filters.group | filters.channel))
@@ -286,28 +473,28 @@ async def group_link_handler(client, message):
     user_id = message.from_user.id
     
     if not is_authorized(user_id):
-        await message.reply_text("❌ **Access Denied!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Access Denied!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
         return
     
     # Check if message is a reply
     if not message.reply_to_message:
-        await message.reply_text("❌ **Please reply to a file message to use this command!**\n\n**Usage:** Reply to file and use `/link 5` to get 5 file links")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Please reply to a file message to use this command!**\n\n**Usage:** Reply to file and use `/link 5` to get 5 file links")
         return
     
     # Extract count from command
     try:
         command_parts = message.text.split()
         if len(command_parts) != 2:
-            await message.reply_text("**Usage:** `/link <count>`\n\nExample: Reply to a file and use `/link 5`")
+            await rate_limiter.call("send_message", message.reply_text, "**Usage:** `/link <count>`\n\nExample: Reply to a file and use `/link 5`")
             return
         
         count = int(command_parts[1])
         if count <= 0 or count > 20:
-            await message.reply_text("❌ **Count must be between 1 and 20!**")
+            await rate_limiter.call("send_message", message.reply_text, "❌ **Count must be between 1 and 20!**")
             return
         
     except ValueError:
-        await message.reply_text("❌ **Invalid count! Please provide a number.**\n\nExample: `/link 5`")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Invalid count! Please provide a number.**\n\nExample: `/link 5`")
         return
     
     try:
@@ -316,74 +503,24 @@ async def group_link_handler(client, message):
         
         # Check channel permissions
         if not await check_channel_permissions(client, chat_id, user_id):
-            await message.reply_text("❌ **Insufficient permissions!**\n\nBot needs admin permissions in this channel or you need to be an admin.")
+            await rate_limiter.call("send_message", message.reply_text, "❌ **Insufficient permissions!**\n\nBot needs admin permissions in this channel or you need to be an admin.")
             return
         
-        status_msg = await message.reply_text(f"⏳ **Processing {count} files starting from replied message...**")
-        
-        # Get messages starting from replied message
-        processed_files = []
-        current_message_id = replied_message_id
+        status_msg = await rate_limiter.call("send_message", message.reply_text, f"⏳ **Processing {count} files starting from replied message...**")
         
-        for i in range(count):
-            try:
-                # Add delay to prevent flood
-                if i > 0:
-                    await asyncio.sleep(2)
-                
-                # Get the current message
-                current_message = await client.get_messages(chat_id, current_message_id)
-                
-                # Check if message has file
-                if current_message and (current_message.document or current_message.video):
-                    file_id = current_message.document or current_message.video
-                    
-                    # Copy file to bin channel
-                    msg = await copy_file_with_retry(client, current_message)
-                    
-                    if msg:
-                        file_name = file_id.file_name.replace(" ", "_") if file_id.file_name else f"file_{msg.id}"
-                        download_url = f"{STREAM_URL}/download/{msg.id}/{file_name}"
-                        
-                        processed_files.append({
-                            'name': file_name,
-                            'url': download_url,
-                            'msg_id': current_message_id
-                        })
-                
-                # Move to next message
-                current_message_id += 1
-                
-            except Exception as e:
-                print(f"Error processing message {current_message_id}: {e}")
-                current_message_id += 1
-                continue
+        await submit_job(user_id, status_msg, {
+            'type': 'link',
+            'client': client,
+            'message': message,
+            'count': count,
+            'chat_id': chat_id,
+            'replied_message_id': replied_message_id,
+            'status_msg': status_msg
+        })
         
-        if processed_files:
-            # Create response message
-            response_text = f"📋 **Generated {len(processed_files)} file links:**\n\n"
-            
-            for idx, file_data in enumerate(processed_files, 1):
-                response_text += f"{idx}. [{file_data['name']}]({file_data['url']})\n"
-            
-            response_text += f"\n**Powered By - @sdbots1**"
-            
-            try:
-                await status_msg.edit_text(response_text, disable_web_page_preview=True)
-            except Exception:
-                # If can't edit in channel, send to user privately
-                await client.send_message(
-                    chat_id=user_id,
-                    text=f"📋 **Links from {message.chat.title}:**\n\n{response_text}",
-                    disable_web_page_preview=True
-                )
-                await status_msg.edit_text("✅ **Links generated and sent to you privately!**")
-        else:
-            await status_msg.edit_text("❌ **No valid files found in the specified range!**")
-            
     except Exception as e:
         print(f"Error in group link handler: {e}")
-        await message.reply_text(f"❌ **Error processing files:** {str(e)}")
+        await rate_limiter.call("send_message", message.reply_text, f"❌ **Error processing files:** {str(e)}")
 
 
 @Client.on_message(filters.command("link_txt") & (filters.group | filters.channel))
@@ -391,28 +528,31 @@ async def group_link_txt_handler(client, message):
     user_id = message.from_user.id
     
     if not is_authorized(user_id):
-        await message.reply_text("❌ **Access Denied!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Access Denied!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
         return
     
     # Check if message is a reply
     if not message.reply_to_message:
-        await message.reply_text("❌ **Please reply to a file message to use this command!**\n\n**Usage:** Reply to file and use `/link_txt 9` to get 9 file links in text file")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Please reply to a file message to use this command!**\n\n**Usage:** Reply to file and use `/link_txt 9` to get 9 file links in text file")
         return
     
     # Extract count from command
     try:
         command_parts = message.text.split()
-        if len(command_parts) != 2:
-            await message.reply_text("**Usage:** `/link_txt <count>`\n\nExample: Reply to a file and use `/link_txt 9`")
+        if len(command_parts) not in (2, 3):
+            await rate_limiter.call("send_message", message.reply_text, f"**Usage:** `/link_txt <count> [format]`\n\nExample: Reply to a file and use `/link_txt 9` or `/link_txt 9 csv`\n\n**Formats:** {FORMAT_NAMES}")
             return
         
         count = int(command_parts[1])
         if count <= 0 or count > 200:
-            await message.reply_text("❌ **Count must be between 1 and 200 for text file generation!**")
+            await rate_limiter.call("send_message", message.reply_text, "❌ **Count must be between 1 and 200 for text file generation!**")
+            return
+        file_format = await get_format(message, command_parts, 2)
+        if not file_format:
             return
         
     except ValueError:
-        await message.reply_text("❌ **Invalid count! Please provide a number.**\n\nExample: `/link_txt 9`")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Invalid count! Please provide a number.**\n\nExample: `/link_txt 9`")
         return
     
     chat_id = message.chat.id
@@ -430,13 +570,12 @@ async def group_link_txt_handler(client, message):
     
     # Check channel permissions
     if not await check_channel_permissions(client, chat_id, user_id):
-        await message.reply_text("❌ **Insufficient permissions!**\n\nBot needs admin permissions in this channel or you need to be an admin.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Insufficient permissions!**\n\nBot needs admin permissions in this channel or you need to be an admin.")
         return
     
-    status_msg = await message.reply_text(f"⏳ **Processing {count} files for text file generation...**")
+    status_msg = await rate_limiter.call("send_message", message.reply_text, f"⏳ **Processing {count} files for text file generation...**")
     
-    # Check if user has ongoing task, add to queue if yes
-    task_data = {
+    await submit_job(user_id, status_msg, {
         'type': 'link_txt',
         'client': client,
         'message': message,
@@ -444,46 +583,329 @@ async def group_link_txt_handler(client, message):
         'chat_id': chat_id,
         'replied_message_id': replied_message_id,
         'status_msg': status_msg,
-        'base_name': base_name  # Add base name to task data
-    }
-    
-    queue_position = len(bulk_queue.queues[user_id])
-    if queue_position > 0:
-        await status_msg.edit_text(f"📋 **Added to queue!**\n\n**Position:** {queue_position + 1}\n**Processing:** {count} files\n\n⏳ **Will start when current tasks complete...**")
+        'base_name': base_name,  # Add base name to task data
+        'format': file_format
+    })
+
+
+async def submit_job(user_id, status_msg, task_data):
+    """Hand a task to the bulk queue and tell the user where it stands"""
+    job_id = await bulk_queue.add_task(user_id, task_data)
+    if job_id is None:
+        await status_updater.finish(status_msg, f"❌ **Too many queued jobs!**\n\nYou can have at most {bulk_queue.max_queued} jobs waiting. Check them with /status")
+        return
     
-    await bulk_queue.add_task(user_id, task_data)
+    if bulk_queue.must_wait(job_id):
+        task_data['queued'] = True
+        position = bulk_queue.position(job_id)
+        status_updater.update(status_msg, f"📋 **Added to queue!**\n\n**Job:** #{job_id}\n**Position:** {position}\n**Processing:** {task_data['count']} files\n\n⏳ **Will start when current tasks complete...**\n\nUse `/status {job_id}` to check on it.")
 
 
-async def copy_file_with_retry(client, message, retries=3, delay=5):
-    for attempt in range(retries):
-        try:
-            # Determine if the message has a document or video
-            if message.document:
-                file_id = message.document.file_id
-            elif message.video:
-                file_id = message.video.file_id
-            else:
-                print("No document or video found in the message.")
-                return None
+async def get_messages_in_range(client, chat_id, start_id, count):
+    """Fetch `count` consecutive messages with one get_messages call per 200 ids"""
+    messages = []
+    api_calls = 0
+    end_id = start_id + count
+    for batch_start in range(start_id, end_id, GET_MESSAGES_BATCH):
+        message_ids = list(range(batch_start, min(batch_start + GET_MESSAGES_BATCH, end_id)))
+        batch = await rate_limiter.call("get_messages", client.get_messages, chat_id, message_ids)
+        api_calls += 1
+        messages.extend(batch)
+    return messages, api_calls
 
-            # Copy the message to the bin channel
-            msg = await client.copy_message(
-                chat_id=BIN_CHANNEL,
-                from_chat_id=message.chat.id,
-                message_id=message.id
-            )
-            return msg  # If successful, return the message object
 
-        except FloodWait as e:
-            print(f"FloodWait encountered, sleeping for {e.value} seconds.")
-            await asyncio.sleep(e.value)
+async def copy_message_range(client, chat_id, start_id, count, status_msg=None, job_id=None):
+    """Copy every file among `count` messages from `start_id` to BIN_CHANNEL and build their links
+
+    With a `job_id` the progress is saved after every batch, and messages a
+    resumed job already handled are neither fetched nor copied again.
+    """
+    started = time.time()
+    end_id = start_id + count
+    processed_files = []
+    if job_id in job_store.progress:
+        progress = job_store.progress[job_id]
+        processed_files = list(progress['files'])
+        start_id = max(start_id, progress['last_message_id'] + 1)
+    messages, api_calls = await get_messages_in_range(client, chat_id, start_id, end_id - start_id)
+
+    # Only documents and videos get a link, everything else is dropped locally
+    media_messages = [m for m in messages if m and not m.empty and (m.document or m.video)]
+
+    for i in range(0, len(media_messages), COPY_BATCH):
+        batch = media_messages[i:i + COPY_BATCH]
+
+        # Update status between batches
+        if status_msg and i > 0:
+            status_updater.update(status_msg, f"⏳ **Processing files... {i}/{len(media_messages)} completed**")
+
+        copied, batch_calls = await copy_messages_to_bin(client, chat_id, batch)
+        api_calls += batch_calls
+
+        batch_files = []
+        for current_message in batch:
+            bin_id = copied.get(current_message.id)
+            if not bin_id:
+                continue
+            file_id = current_message.document or current_message.video
+            file_name = file_id.file_name.replace(" ", "_") if file_id.file_name else f"file_{bin_id}"
+            download_url = f"{STREAM_URL}/download/{bin_id}/{file_name}"
+
+            batch_files.append({
+                'name': file_name,
+                'url': download_url,
+                'msg_id': current_message.id
+            })
+        processed_files.extend(batch_files)
+
+        if job_id is not None:
+            # Everything before the next batch is handled, media or not
+            next_batch = media_messages[i + COPY_BATCH:i + COPY_BATCH + 1]
+            job_store.record_progress(job_id, batch_files, next_batch[0].id - 1 if next_batch else end_id - 1)
+
+    if job_id is not None and not media_messages:
+        job_store.record_progress(job_id, [], end_id - 1)
+
+    stats = {'api_calls': api_calls, 'seconds': time.time() - started}
+    print(f"Processed {count} messages from {chat_id}: {len(processed_files)} files, "
+          f"{stats['api_calls']} API calls, {stats['seconds']:.1f}s")
+    return processed_files, stats
+
+
+def format_stats(stats):
+    return f"**API calls:** {stats['api_calls']} | **Time:** {stats['seconds']:.1f}s"
+
+
+FORMAT_NAMES = ", ".join(f"`{name}`" for name in FORMATS)
+
+
+async def get_format(message, command_parts, index):
+    """Link list format given at `command_parts[index]` (txt if missing), None after telling the user it's invalid"""
+    file_format = parse_format(command_parts[index] if len(command_parts) > index else None)
+    if not file_format:
+        await rate_limiter.call("send_message", message.reply_text, f"❌ **Unknown format!**\n\n**Formats:** {FORMAT_NAMES}")
+    return file_format
+
+
+async def copy_messages_to_bin(client, from_chat_id, messages, lookup=True):
+    """Copy up to 100 messages of one chat to BIN_CHANNEL with a single API call
+
+    Returns ({source message id: BIN_CHANNEL message id}, api calls made).
+    Files already in BIN_CHANNEL are not copied again, messages the batch
+    call didn't deliver are copied one by one. Pass lookup=False if the
+    caller already checked the file index.
+    """
+    copied = {}
+    api_calls = 0
+    for message in messages if lookup else ():
+        bin_id = file_index.get(media_unique_id(message))
+        if bin_id:
+            copied[message.id] = bin_id
+    messages = [message for message in messages if message.id not in copied]
+    if not messages:
+        return copied, api_calls
+
+    random_ids = [client.rnd_id() for _ in messages]
+    try:
+        # Usually answered from the session storage, an API call when a peer isn't known yet
+        to_peer = await rate_limiter.call("resolve_peer", client.resolve_peer, BIN_CHANNEL)
+        from_peer = await rate_limiter.call("resolve_peer", client.resolve_peer, from_chat_id)
+        api_calls += 1
+        # drop_author makes the forward look like copy_message: no "Forwarded from" header
+        r = await rate_limiter.call(
+            "forward_messages", client.invoke,
+            raw.functions.messages.ForwardMessages(
+                to_peer=to_peer,
+                from_peer=from_peer,
+                id=[m.id for m in messages],
+                random_id=random_ids,
+                drop_author=True
+            ),
+            retries=2
+        )
+    except Exception as e:
+        print(f"Batch copy of {len(messages)} messages failed: {e}")
+    else:
+        # Map the new message ids back to the source messages through the random ids
+        new_ids = {u.random_id: u.id for u in r.updates if isinstance(u, raw.types.UpdateMessageID)}
+        delivered = {
+            u.message.id for u in r.updates
+            if isinstance(u, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage))
+        }
+        for message, random_id in zip(messages, random_ids):
+            bin_id = new_ids.get(random_id)
+            if bin_id in delivered:
+                copied[message.id] = bin_id
+                file_index.add(media_unique_id(message), bin_id)
+
+    for message in messages:
+        if message.id not in copied:
+            api_calls += 1
+            msg = await copy_file_with_retry(client, message)
+            if msg:
+                copied[message.id] = msg.id
+
+    return copied, api_calls
+
+
+class BinCopyBatcher:
+    """Collects single files sent in bulk mode and copies them to BIN_CHANNEL in batches"""
+
+    def __init__(self, delay=COPY_BATCH_DELAY):
+        self.delay = delay
+        self.pending = defaultdict(list)  # source chat id -> [(message, future)]
+        self.flush_tasks = {}  # source chat id -> scheduled flush
+
+    async def copy(self, client, message):
+        """BIN_CHANNEL message id of the file in `message`
+
+        Files not stored yet are copied together with whatever arrives in the next few seconds.
+        """
+        bin_id = file_index.get(media_unique_id(message))
+        if bin_id:
+            return bin_id
+        chat_id = message.chat.id
+        future = asyncio.get_running_loop().create_future()
+        self.pending[chat_id].append((message, future))
+
+        if len(self.pending[chat_id]) >= COPY_BATCH:
+            task = self.flush_tasks.pop(chat_id, None)
+            if task:
+                task.cancel()
+            asyncio.ensure_future(self.send(client, chat_id, self.pending.pop(chat_id)))
+        elif chat_id not in self.flush_tasks:
+            self.flush_tasks[chat_id] = asyncio.ensure_future(self.flush_later(client, chat_id))
+
+        return await future
+
+    async def flush_later(self, client, chat_id):
+        await asyncio.sleep(self.delay)
+        self.flush_tasks.pop(chat_id, None)
+        await self.flush(client, chat_id)
+
+    async def flush(self, client, chat_id):
+        batch = self.pending.pop(chat_id, [])
+        if batch:
+            await self.send(client, chat_id, batch)
+
+    async def send(self, client, chat_id, batch):
+        try:
+            copied, _ = await copy_messages_to_bin(client, chat_id, [message for message, _ in batch], lookup=False)
         except Exception as e:
-            print(f"Attempt {attempt + 1} failed: {e}")
-            if attempt < retries - 1:
-                await asyncio.sleep(delay)  # Wait before retrying
-            else:
-                print("Max retries reached. Could not copy the file.")
-                return None  # If all retries fail, return None
+            copied = {}
+            print(f"Error copying bulk batch from {chat_id}: {e}")
+        for message, future in batch:
+            if not future.done():
+                future.set_result(copied.get(message.id))
+
+
+bin_copy_batcher = BinCopyBatcher()
+
+
+class BulkSummary:
+    """Acknowledges files sent in bulk mode on one summary message per burst"""
+
+    def __init__(self, idle=BULK_SUMMARY_IDLE):
+        self.idle = idle
+        self.summaries = {}  # user_id -> counters and the summary message of the current burst
+
+    async def file_received(self, message):
+        """Count a new file of the user as in progress and return its summary"""
+        user_id = message.from_user.id
+        summary = self.summaries.get(user_id)
+        if summary is None or time.monotonic() - summary['updated'] > self.idle:
+            if summary and summary['reply'].done() and not summary['reply'].exception():
+                status_updater.forget(summary['reply'].result())
+            # Files arriving together wait for the same reply instead of sending their own
+            summary = self.summaries[user_id] = {
+                'reply': asyncio.ensure_future(rate_limiter.call(
+                    "send_message", message.reply_text, "⏳ **Processing files for bulk queue...**"
+                )),
+                'added': 0,
+                'failed': 0,
+                'pending': 0,
+                'last_name': None,
+                'updated': time.monotonic(),
+            }
+        summary['pending'] += 1
+        summary['updated'] = time.monotonic()
+        try:
+            await summary['reply']
+        except Exception:
+            if self.summaries.get(user_id) is summary:
+                del self.summaries[user_id]
+            raise
+        return summary
+
+    def file_done(self, user_id, summary, file_name=None):
+        """Mark a file as added (with its name) or failed and refresh the summary"""
+        summary['pending'] -= 1
+        if file_name:
+            summary['added'] += 1
+            summary['last_name'] = file_name
+        else:
+            summary['failed'] += 1
+        status_updater.update(summary['reply'].result(), self.render(user_id, summary))
+
+    @staticmethod
+    def render(user_id, summary):
+        text = "✅ **Added to bulk queue!**\n\n" if not summary['pending'] else "⏳ **Adding files to bulk queue...**\n\n"
+        text += f"**Files added:** {summary['added']}\n"
+        if summary['last_name']:
+            text += f"**Last file:** `{summary['last_name']}`\n"
+        if summary['pending']:
+            text += f"**Processing:** {summary['pending']}\n"
+        if summary['failed']:
+            text += f"**Failed:** {summary['failed']} (check if bot has access to the channel)\n"
+        text += (
+            f"**Queue size:** {len(temp.BULK_FILES.get(user_id, []))}\n\n"
+            f"📋 Use /get_bulk_link to get all links\n"
+            f"🗑️ Use /clear_bulk to clear queue\n"
+            f"🚪 Use /exit_bulk to exit bulk mode\n"
+            f"📄 Use /link_txt <count> to generate file from queue"
+        )
+        return text
+
+
+bulk_summary = BulkSummary()
+
+
+async def copy_file_with_retry(client, message, retries=3):
+    # FloodWaits are retried by the rate limiter, other errors are retried here
+    with bin_copy_seconds.time():
+        for attempt in range(retries):
+            try:
+                # Determine if the message has a document or video
+                if message.document:
+                    file_id = message.document.file_id
+                elif message.video:
+                    file_id = message.video.file_id
+                else:
+                    print("No document or video found in the message.")
+                    bin_copies.inc(result="no_media")
+                    return None
+
+                # Copy the message to the bin channel
+                msg = await rate_limiter.call(
+                    "copy_message", client.copy_message,
+                    chat_id=BIN_CHANNEL,
+                    from_chat_id=message.chat.id,
+                    message_id=message.id
+                )
+                file_index.add(media_unique_id(message), msg.id)
+                bin_copies.inc(result="copied")
+                return msg  # If successful, return the message object
+
+            except FloodWait:
+                print("FloodWait persisted after the rate limiter's retries. Could not copy the file.")
+                bin_copies.inc(result="flood_wait")
+                return None
+            except Exception as e:
+                print(f"Attempt {attempt + 1} failed: {e}")
+                if attempt == retries - 1:
+                    print("Max retries reached. Could not copy the file.")
+                    bin_copies.inc(result="failed")
+                    return None  # If all retries fail, return None
 
 
 # ... keep existing code (auth, unauth, users, bulk_links, get_bulk_links, clear_bulk, exit_bulk, private_receive_handler, photo_audio_error functions) the same ...
@@ -495,31 +917,31 @@ async def auth_user(client, message):
     
     # Only admin can authorize users
     if user_id != ADMIN_ID:
-        await message.reply_text("❌ **Access Denied!**\n\nOnly admin can authorize users.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Access Denied!**\n\nOnly admin can authorize users.")
         return
     
     try:
         # Extract user ID from command
         command_parts = message.text.split()
         if len(command_parts) != 2:
-            await message.reply_text("**Usage:** `/auth <user_id>`\n\nExample: `/auth 123456789`")
+            await rate_limiter.call("send_message", message.reply_text, "**Usage:** `/auth <user_id>`\n\nExample: `/auth 123456789`")
             return
         
         target_user_id = int(command_parts[1])
         
         if target_user_id in temp.AUTHORIZED_USERS:
-            await message.reply_text(f"✅ **User {target_user_id} is already authorized!**")
+            await rate_limiter.call("send_message", message.reply_text, f"✅ **User {target_user_id} is already authorized!**")
             return
         
         # Add user to authorized list
         temp.AUTHORIZED_USERS.add(target_user_id)
         
-        await message.reply_text(f"✅ **User {target_user_id} has been authorized!**\n\nThey can now use the bot.")
+        await rate_limiter.call("send_message", message.reply_text, f"✅ **User {target_user_id} has been authorized!**\n\nThey can now use the bot.")
         
     except ValueError:
-        await message.reply_text("❌ **Invalid user ID!**\n\nPlease provide a valid numeric user ID.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Invalid user ID!**\n\nPlease provide a valid numeric user ID.")
     except Exception as e:
-        await message.reply_text(f"❌ **Error:** {str(e)}")
+        await rate_limiter.call("send_message", message.reply_text, f"❌ **Error:** {str(e)}")
 
 
 @Client.on_message(filters.command("unauth") & filters.private)
@@ -528,31 +950,31 @@ async def unauth_user(client, message):
     
     # Only admin can unauthorize users
     if user_id != ADMIN_ID:
-        await message.reply_text("❌ **Access Denied!**\n\nOnly admin can unauthorize users.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Access Denied!**\n\nOnly admin can unauthorize users.")
         return
     
     try:
         # Extract user ID from command
         command_parts = message.text.split()
         if len(command_parts) != 2:
-            await message.reply_text("**Usage:** `/unauth <user_id>`\n\nExample: `/unauth 123456789`")
+            await rate_limiter.call("send_message", message.reply_text, "**Usage:** `/unauth <user_id>`\n\nExample: `/unauth 123456789`")
             return
         
         target_user_id = int(command_parts[1])
         
         if target_user_id not in temp.AUTHORIZED_USERS:
-            await message.reply_text(f"❌ **User {target_user_id} is not in authorized list!**")
+            await rate_limiter.call("send_message", message.reply_text, f"❌ **User {target_user_id} is not in authorized list!**")
             return
         
         # Remove user from authorized list
         temp.AUTHORIZED_USERS.remove(target_user_id)
         
-        await message.reply_text(f"✅ **User {target_user_id} has been removed from authorized list!**")
+        await rate_limiter.call("send_message", message.reply_text, f"✅ **User {target_user_id} has been removed from authorized list!**")
         
     except ValueError:
-        await message.reply_text("❌ **Invalid user ID!**\n\nPlease provide a valid numeric user ID.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Invalid user ID!**\n\nPlease provide a valid numeric user ID.")
     except Exception as e:
-        await message.reply_text(f"❌ **Error:** {str(e)}")
+        await rate_limiter.call("send_message", message.reply_text, f"❌ **Error:** {str(e)}")
 
 
 @Client.on_message(filters.command("users") & filters.private)
@@ -561,15 +983,103 @@ async def list_users(client, message):
     
     # Only admin can view authorized users
     if user_id != ADMIN_ID:
-        await message.reply_text("❌ **Access Denied!**\n\nOnly admin can view authorized users.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Access Denied!**\n\nOnly admin can view authorized users.")
         return
     
     if not temp.AUTHORIZED_USERS:
-        await message.reply_text("📝 **No authorized users found!**\n\nUse `/auth <user_id>` to authorize users.")
+        await rate_limiter.call("send_message", message.reply_text, "📝 **No authorized users found!**\n\nUse `/auth <user_id>` to authorize users.")
         return
     
     users_list = "\n".join([f"• {user_id}" for user_id in temp.AUTHORIZED_USERS])
-    await message.reply_text(f"📋 **Authorized Users ({len(temp.AUTHORIZED_USERS)}):**\n\n{users_list}")
+    await rate_limiter.call("send_message", message.reply_text, f"📋 **Authorized Users ({len(temp.AUTHORIZED_USERS)}):**\n\n{users_list}")
+
+
+@Client.on_message(filters.command("status"))
+async def job_status(client, message):
+    user_id = message.from_user.id
+    
+    if not is_authorized(user_id):
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Access Denied!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
+        return
+    
+    command_parts = message.text.split()
+    if len(command_parts) == 2:
+        try:
+            job = bulk_queue.jobs.get(int(command_parts[1].lstrip('#')))
+        except ValueError:
+            job = None
+        # Admin can look at anyone's job
+        if not job or (job['user_id'] != user_id and user_id != ADMIN_ID):
+            await rate_limiter.call("send_message", message.reply_text, "❌ **Job not found!**\n\nUse /status to list your jobs.")
+            return
+        jobs = [job]
+    else:
+        jobs = bulk_queue.user_jobs(user_id)[-10:]
+        if not jobs:
+            await rate_limiter.call("send_message", message.reply_text, "📝 **You have no jobs!**\n\nUse /link or /link_txt in a group or channel to start one.")
+            return
+    
+    lines = []
+    for job in jobs:
+        line = f"• **#{job['id']}** `/{job['type']} {job['count']}` - {job['state']}"
+        if job['state'] == 'queued':
+            line += f" (position {bulk_queue.position(job['id'])})"
+        elif job['state'] == 'running':
+            line += f" for {time.time() - job['started']:.0f}s"
+        elif job['finished'] and job['started']:
+            line += f" in {job['finished'] - job['started']:.1f}s"
+        if job['error']:
+            line += f"\n  ❌ {job['error']}"
+        lines.append(line)
+    
+    stats = bulk_queue.stats()
+    await rate_limiter.call(
+        "send_message", message.reply_text,
+        "📋 **Your Jobs:**\n\n" + "\n".join(lines) +
+        f"\n\n**Queue:** {stats['running']}/{stats['workers']} workers busy, {stats['queued']} jobs waiting"
+    )
+
+
+@Client.on_message(filters.command("stats") & filters.private)
+async def bot_stats(client, message):
+    # Only admin can view bot statistics
+    if message.from_user.id != ADMIN_ID:
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Access Denied!**\n\nOnly admin can view statistics.")
+        return
+    
+    index = file_index.stats()
+    queue = bulk_queue.stats()
+    clients = "\n".join(
+        f"• `{name}`: {state['active']} streams{'' if state['available'] else ' (paused)'}"
+        for name, state in client_pool.stats().items()
+    )
+    await rate_limiter.call(
+        "send_message", message.reply_text,
+        f"📊 **Bot Statistics:**\n\n"
+        f"**Files in BIN_CHANNEL index:** {index['files']}\n"
+        f"**Re-uploads reused:** {index['hits']}/{index['hits'] + index['misses']} ({index['hit_rate']:.1%})\n"
+        f"**Bulk jobs:** {queue['running']} running, {queue['queued']} waiting\n"
+        f"**Streaming clients:**\n{clients}\n\n"
+        f"💡 Use /rate_stats for Telegram rate limits."
+    )
+
+
+@Client.on_message(filters.command("rate_stats") & filters.private)
+async def rate_stats(client, message):
+    # Only admin can view the rate limiter state
+    if message.from_user.id != ADMIN_ID:
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Access Denied!**\n\nOnly admin can view rate limits.")
+        return
+    
+    lines = []
+    for method, stats in rate_limiter.stats().items():
+        line = f"• `{method}`: {stats['rate']}/{stats['base_rate']} per sec, {stats['waiting']} waiting"
+        if stats['flood_waits']:
+            line += f", {stats['flood_waits']} FloodWaits"
+        if stats['blocked_for']:
+            line += f", blocked for {stats['blocked_for']}s"
+        lines.append(line)
+    await rate_limiter.call("send_message", message.reply_text, "📊 **Telegram Rate Limits:**\n\n" + "\n".join(lines))
 
 
 @Client.on_message(filters.command("bulk_links") & filters.private)
@@ -577,14 +1087,16 @@ async def bulk_links_start(client, message):
     user_id = message.from_user.id
     
     if not is_authorized(user_id):
-        await message.reply_text("❌ **Access Denied!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Access Denied!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
         return
     
     # Initialize bulk files list for user
     if user_id not in temp.BULK_FILES:
         temp.BULK_FILES[user_id] = []
+        job_store.start_bulk(user_id)
     
-    await message.reply_text(
+    await rate_limiter.call(
+        "send_message", message.reply_text,
         "**🔄 Bulk Link Mode Activated!**\n\n"
         "Now you can send multiple files to me. I'll add them to your queue.\n\n"
         "📋 **Commands:**\n"
@@ -602,29 +1114,30 @@ async def get_bulk_links(client, message):
     user_id = message.from_user.id
     
     if not is_authorized(user_id):
-        await message.reply_text("❌ **Access Denied!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Access Denied!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
         return
     
     if user_id not in temp.BULK_FILES or not temp.BULK_FILES[user_id]:
-        await message.reply_text("❌ **No files in your bulk queue!**\n\nUse /bulk_links to start adding files.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **No files in your bulk queue!**\n\nUse /bulk_links to start adding files.")
         return
     
-    # Create text content with all links
-    links_content = "📁 **Your Bulk Download Links**\n\n"
-    
-    for idx, file_data in enumerate(temp.BULK_FILES[user_id], 1):
-        file_name = file_data['name']
-        download_url = file_data['download_url']
-        links_content += f"{idx}. {file_name} : {download_url}\n\n"
+    file_format = await get_format(message, message.text.split(), 1)
+    if not file_format:
+        return
     
-    # Create a text file
-    file_content = links_content.encode('utf-8')
-    file_buffer = io.BytesIO(file_content)
-    file_buffer.name = f"bulk_links_{user_id}.txt"
+    # Write all links straight into the file buffer
+    file_buffer = build_link_file(
+        ((file_data['name'], file_data['download_url']) for file_data in temp.BULK_FILES[user_id]),
+        file_format,
+        f"bulk_links_{message.from_user.first_name}",
+        header=("📁 **Your Bulk Download Links**",),
+        txt_line=numbered_line
+    )
     
-    await message.reply_document(
+    await rate_limiter.call(
+        "send_document", message.reply_document,
         document=file_buffer,
-        file_name=f"bulk_links_{message.from_user.first_name}.txt",
+        file_name=file_buffer.name,
         caption=f"📋 **Bulk Links Generated!**\n\n**Total Files:** {len(temp.BULK_FILES[user_id])}\n\n**Powered By - @sdbots1**"
     )
 
@@ -634,15 +1147,16 @@ async def clear_bulk_links(client, message):
     user_id = message.from_user.id
     
     if not is_authorized(user_id):
-        await message.reply_text("❌ **Access Denied!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Access Denied!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
         return
     
     if user_id in temp.BULK_FILES:
         cleared_count = len(temp.BULK_FILES[user_id])
         temp.BULK_FILES[user_id] = []
-        await message.reply_text(f"✅ **Bulk queue cleared!**\n\nRemoved {cleared_count} files from your queue.\n\n💡 **Still in bulk mode** - Use /exit_bulk to return to normal mode.")
+        job_store.drop_bulk_files(user_id)
+        await rate_limiter.call("send_message", message.reply_text, f"✅ **Bulk queue cleared!**\n\nRemoved {cleared_count} files from your queue.\n\n💡 **Still in bulk mode** - Use /exit_bulk to return to normal mode.")
     else:
-        await message.reply_text("❌ **No files to clear!**")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **No files to clear!**")
 
 
 @Client.on_message(filters.command("exit_bulk") & filters.private)
@@ -650,19 +1164,21 @@ async def exit_bulk_mode(client, message):
     user_id = message.from_user.id
     
     if not is_authorized(user_id):
-        await message.reply_text("❌ **Access Denied!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **Access Denied!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
         return
     
     if user_id in temp.BULK_FILES:
         # Remove user from bulk mode completely
         del temp.BULK_FILES[user_id]
-        await message.reply_text(
+        job_store.exit_bulk(user_id)
+        await rate_limiter.call(
+            "send_message", message.reply_text,
             "✅ **Successfully exited bulk mode!**\n\n"
             "🔄 **Now in normal mode** - Send any file to get instant download links.\n\n"
             "💡 Use /bulk_links to enter bulk mode again."
         )
     else:
-        await message.reply_text("❌ **You're not in bulk mode!**\n\nYou're already in normal mode. Send any file to get instant links.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **You're not in bulk mode!**\n\nYou're already in normal mode. Send any file to get instant links.")
 
 
 @Client.on_message((filters.private) & (filters.document | filters.video), group=4)
@@ -670,13 +1186,13 @@ async def private_receive_handler(client, message):
     user_id = message.from_user.id
     
     if not is_authorized(user_id):
-        await message.reply_text("❌ **You can't use this bot!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **You can't use this bot!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
         return
     
     file_id = message.document or message.video
     
     if not file_id:
-        await message.reply_text("❌ **No valid file found. Please send a document or video file.**")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **No valid file found. Please send a document or video file.**")
         return
     
     print(f"Processing file from user {user_id}: {file_id.file_name}")
@@ -684,41 +1200,38 @@ async def private_receive_handler(client, message):
     # Check if user is in bulk mode
     if user_id in temp.BULK_FILES:
         try:
-            # Add rate limiting for bulk mode - wait 3 seconds between uploads
-            await asyncio.sleep(3)
+            # Files sent in a row share one summary message instead of a reply each
+            summary = await bulk_summary.file_received(message)
             
-            status_msg = await message.reply_text("⏳ **Processing file for bulk queue...**")
-            
-            # Copy file to bin channel with retry logic
-            msg = await copy_file_with_retry(client, message)
+            # Copy file to bin channel together with the other files sent right now
+            try:
+                bin_id = await bin_copy_batcher.copy(client, message)
+            except Exception:
+                bulk_summary.file_done(user_id, summary)
+                raise
             
-            if msg:
-                file_name = file_id.file_name.replace(" ", "_") if file_id.file_name else f"file_{msg.id}"
-                online = f"{STREAM_URL}/watch/{msg.id}/{file_name}"
-                download = f"{STREAM_URL}/download/{msg.id}/{file_name}"
+            file_name = None
+            # The user may have left bulk mode while the file was copied
+            if bin_id and user_id in temp.BULK_FILES:
+                file_name = file_id.file_name.replace(" ", "_") if file_id.file_name else f"file_{bin_id}"
+                online = f"{STREAM_URL}/watch/{bin_id}/{file_name}"
+                download = f"{STREAM_URL}/download/{bin_id}/{file_name}"
                 d_play = f"https://sidplayer.vercel.app?direct_link={download}"
                 
                 # Add to bulk queue
-                temp.BULK_FILES[user_id].append({
+                file_data = {
                     'name': file_name,
                     'download_url': download,
                     'watch_url': d_play
-                })
-                
-                await status_msg.edit_text(
-                    f"✅ **Added to bulk queue!**\n\n"
-                    f"**File:** `{file_name}`\n"
-                    f"**Queue position:** {len(temp.BULK_FILES[user_id])}\n\n"
-                    f"📋 Use /get_bulk_link to get all links\n"
-                    f"🗑️ Use /clear_bulk to clear queue\n"
-                    f"🚪 Use /exit_bulk to exit bulk mode\n"
-                    f"📄 Use /link_txt <count> to generate file from queue"
-                )
-            else:
-                await status_msg.edit_text("❌ **Failed to process file. Please check if bot has access to the channel.**")
+                }
+                temp.BULK_FILES[user_id].append(file_data)
+                job_store.add_bulk_file(user_id, file_data)
+            
+            bulk_summary.file_done(user_id, summary, file_name)
                 
         except FloodWait as e:
-            await message.reply_text(
+            await rate_limiter.call(
+                "send_message", message.reply_text,
                 f"⚠️ **Rate limit exceeded!**\n\n"
                 f"Please wait {e.value} seconds before sending next file.\n"
                 f"This helps prevent flooding Telegram servers.\n\n"
@@ -726,26 +1239,30 @@ async def private_receive_handler(client, message):
             )
         except Exception as e:
             print(f"Error in bulk mode: {e}")
-            await message.reply_text(f"❌ **Error processing file:** {str(e)}")
+            await rate_limiter.call("send_message", message.reply_text, f"❌ **Error processing file:** {str(e)}")
     else:
         # Send instant link (normal mode)
         try:
             print("Processing file in normal mode")
             
-            status_msg = await message.reply_text("⏳ **Processing file...**")
+            status_msg = await rate_limiter.call("send_message", message.reply_text, "⏳ **Processing file...**")
             
-            # Copy file to bin channel
-            msg = await copy_file_with_retry(client, message)
+            # Reuse the copy in bin channel if this file was sent before
+            bin_id = file_index.get(media_unique_id(message))
+            if not bin_id:
+                msg = await copy_file_with_retry(client, message)
+                bin_id = msg.id if msg else None
             
-            if msg:
-                file_name = file_id.file_name.replace(" ", "_") if file_id.file_name else f"file_{msg.id}"
-                online = f"{STREAM_URL}/watch/{msg.id}/{file_name}"
-                download = f"{STREAM_URL}/download/{msg.id}/{file_name}"
+            if bin_id:
+                file_name = file_id.file_name.replace(" ", "_") if file_id.file_name else f"file_{bin_id}"
+                online = f"{STREAM_URL}/watch/{bin_id}/{file_name}"
+                download = f"{STREAM_URL}/download/{bin_id}/{file_name}"
                 d_play = f"https://sidplayer.vercel.app?direct_link={download}"
                 
                 print(f"Generated links - Watch: {d_play}, Download: {download}")
                 
-                await status_msg.edit_text(
+                await rate_limiter.call(
+                    "edit_message", status_msg.edit_text,
                     text=f"<b>Here Is Your Streamable Link\n\nFile Name</b>:\n<code>{file_name}</code>\n\n<b>Powered By - <a href=https://t.me/sdbots1>©sdBots</a></b>",
                     reply_markup=InlineKeyboardMarkup([
                         [
@@ -756,16 +1273,17 @@ async def private_receive_handler(client, message):
                     disable_web_page_preview=True
                 )
             else:
-                await status_msg.edit_text("❌ **Failed to process file. Please check if bot has access to the channel.**")
+                await rate_limiter.call("edit_message", status_msg.edit_text, "❌ **Failed to process file. Please check if bot has access to the channel.**")
                 
         except FloodWait as e:
-            await message.reply_text(
+            await rate_limiter.call(
+                "send_message", message.reply_text,
                 f"⚠️ **Rate limit exceeded!**\n\n"
                 f"Please wait {e.value} seconds before sending another file."
             )
         except Exception as e:
             print(f"Error in normal mode: {e}")
-            await message.reply_text(f"❌ **Error processing file:** {str(e)}")
+            await rate_limiter.call("send_message", message.reply_text, f"❌ **Error processing file:** {str(e)}")
 
 
 @Client.on_message((filters.private) & (filters.photo | filters.audio), group=4)
@@ -773,7 +1291,7 @@ async def photo_audio_error(client, message):
     user_id = message.from_user.id
     
     if not is_authorized(user_id):
-        await message.reply_text("❌ **You can't use this bot!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
+        await rate_limiter.call("send_message", message.reply_text, "❌ **You can't use this bot!**\n\nYou are not authorized to use this bot.\n\n📞 Contact the admin to get access.")
         return
     
-    await message.reply_text("**Dude! Send me a video file.**")
+    await rate_limiter.call("send_message", message.reply_text, "**Dude! Send me a video file.**")
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# web/ imports info.py, which requires these to be set
+for name, value in (("API_ID", "1"), ("API_HASH", "test"), ("BOT_TOKEN", "1:test"), ("BIN_CHANNEL", "-1001"),
+                    ("STREAM_URL", "http://localhost:8080"), ("ADMIN_ID", "1")):
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from web.utils.file_cache import TTLCache
+
+
+def test_get_or_load_coalesces_concurrent_callers():
+    async def main():
+        cache = TTLCache(10, 60)
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "value"
+
+        results = await asyncio.gather(*(cache.get_or_load("key", loader) for _ in range(5)))
+        return cache, calls, results
+
+    cache, calls, results = asyncio.run(main())
+    assert results == ["value"] * 5
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_cancelled_loader_does_not_cancel_waiters():
+    async def main():
+        cache = TTLCache(10, 60)
+        started = asyncio.Event()
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            started.set()
+            await asyncio.sleep(0.05)
+            return len(calls)
+
+        first = asyncio.ensure_future(cache.get_or_load("key", loader))
+        await started.wait()
+        second = asyncio.ensure_future(cache.get_or_load("key", loader))
+        await asyncio.sleep(0)
+        # The first caller's client disconnects while the second waits for its load
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second, calls, cache.get("key")
+
+    value, calls, cached = asyncio.run(main())
+    # The waiting caller ran the load again instead of failing
+    assert value == 2
+    assert len(calls) == 2
+    assert cached == 2
+
+
+def test_loader_errors_reach_every_waiter():
+    async def main():
+        cache = TTLCache(10, 60)
+
+        async def loader():
+            await asyncio.sleep(0.01)
+            raise ValueError("deleted")
+
+        return await asyncio.gather(*(cache.get_or_load("key", loader) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
@@ -0,0 +1,162 @@
+import random
+
+import pytest
+
+from web.utils.block_planner import BLOCK_SIZES, MAX_BLOCK_SIZE, choose_block_size, is_legal_block
+from web.utils.range_plan import MAX_RANGES, http_date, parse_range_header, plan_blocks, plan_request
+
+SEED = 20240601
+ETAG = "abc123"
+LAST_MODIFIED = 1700000000.0
+
+# Long enough for ranges that span several 1 MB blocks, random so a misaligned slice can't match
+FILE_SIZE = 3 * MAX_BLOCK_SIZE + 12345
+FILE = random.Random(SEED).getrandbits(8 * FILE_SIZE).to_bytes(FILE_SIZE, "big")
+
+
+def random_window(rng, file_size):
+    start = rng.randrange(file_size)
+    # Mostly short player style ranges, sometimes up to the end of the file
+    if rng.random() < 0.7:
+        end = min(file_size - 1, start + rng.randrange(1, 4 * 64 * 1024))
+    else:
+        end = rng.randrange(start, file_size)
+    return start, end
+
+
+def assemble(start, end, chunk_size):
+    """Slice the blocks of plan_blocks the way TGCustomYield.yield_file does"""
+    offset, first_part_cut, last_part_cut, part_count = plan_blocks(start, end, chunk_size)
+    body = b""
+    for part in range(1, part_count + 1):
+        block_offset = offset + (part - 1) * chunk_size
+        assert is_legal_block(block_offset, chunk_size)
+        chunk = FILE[block_offset:block_offset + chunk_size]
+        if part_count == 1:
+            body += chunk[first_part_cut:last_part_cut]
+        elif part == 1:
+            body += chunk[first_part_cut:]
+        elif part == part_count:
+            body += chunk[:last_part_cut]
+        else:
+            body += chunk
+    return body
+
+
+@pytest.mark.parametrize("chunk_size", BLOCK_SIZES)
+def test_plan_blocks_rebuilds_the_window(chunk_size):
+    rng = random.Random(SEED + chunk_size)
+    for _ in range(200):
+        start, end = random_window(rng, len(FILE))
+        assert assemble(start, end, chunk_size) == FILE[start:end + 1]
+
+
+def test_plan_blocks_edges():
+    size = BLOCK_SIZES[0]
+    for start, end in ((0, 0), (0, size - 1), (size - 1, size), (size, size), (0, len(FILE) - 1)):
+        assert assemble(start, end, size) == FILE[start:end + 1]
+
+
+def test_choose_block_size_is_legal():
+    rng = random.Random(SEED)
+    for _ in range(500):
+        start, end = random_window(rng, len(FILE))
+        rtt = rng.uniform(0.01, 1)
+        bandwidth = rng.uniform(64 * 1024, 64 * 1024 * 1024)
+        chunk_size = choose_block_size(start, end, rtt, bandwidth)
+        assert chunk_size in BLOCK_SIZES
+        assert assemble(start, end, chunk_size) == FILE[start:end + 1]
+
+
+def expected_bytes(specs, file_size):
+    """Byte positions the specs ask for, clamped to the file"""
+    wanted = set()
+    for first, last in specs:
+        if first is None:
+            wanted.update(range(max(0, file_size - last), file_size))
+        else:
+            wanted.update(range(first, min(last if last is not None else file_size - 1, file_size - 1) + 1))
+    return wanted
+
+
+def format_spec(first, last):
+    return f"{'' if first is None else first}-{'' if last is None else last}"
+
+
+def test_parse_range_header_merges_into_disjoint_windows():
+    rng = random.Random(SEED)
+    for _ in range(1000):
+        file_size = rng.randrange(1, 5000)
+        specs = []
+        for _ in range(rng.randrange(1, MAX_RANGES + 1)):
+            kind = rng.random()
+            if kind < 0.2:
+                specs.append((None, rng.randrange(1, file_size * 2)))
+            elif kind < 0.4:
+                specs.append((rng.randrange(file_size * 2), None))
+            else:
+                first = rng.randrange(file_size * 2)
+                specs.append((first, first + rng.randrange(file_size)))
+        header = "bytes=" + ", ".join(format_spec(first, last) for first, last in specs)
+
+        ranges = parse_range_header(header, file_size)
+        covered = set()
+        for index, (start, end) in enumerate(ranges):
+            assert 0 <= start <= end < file_size
+            if index:
+                # Sorted, and adjacent or overlapping windows are merged
+                assert start > ranges[index - 1][1] + 1
+            covered.update(range(start, end + 1))
+        assert covered == expected_bytes(specs, file_size)
+
+
+def test_parse_range_header_caps_the_number_of_ranges():
+    header = "bytes=" + ",".join(f"{i * 10}-{i * 10 + 1}" for i in range(MAX_RANGES + 1))
+    assert parse_range_header(header, 1000) == [(0, MAX_RANGES * 10 + 1)]
+
+
+@pytest.mark.parametrize("header", ["", "bytes=", "items=0-1", "bytes=a-5", "bytes=5-1", "bytes=-", "bytes=1"])
+def test_parse_range_header_ignores_malformed(header):
+    assert parse_range_header(header, 100) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=200-300", "bytes=-0"])
+def test_parse_range_header_unsatisfiable(header):
+    assert parse_range_header(header, 100) == []
+
+
+def test_plan_request_ranges():
+    assert plan_request({}, 100, ETAG) == (200, [(0, 99)])
+    assert plan_request({}, 0, ETAG) == (200, [])
+    assert plan_request({"Range": "bytes=10-19"}, 100, ETAG) == (206, [(10, 19)])
+    assert plan_request({"Range": "bytes=-10"}, 100, ETAG) == (206, [(90, 99)])
+    assert plan_request({"Range": "bytes=0-9,5-30,50-"}, 100, ETAG) == (206, [(0, 30), (50, 99)])
+    assert plan_request({"Range": "bytes=100-"}, 100, ETAG) == (416, [])
+    assert plan_request({"Range": "bytes=x"}, 100, ETAG) == (200, [(0, 99)])
+
+
+def test_plan_request_not_modified():
+    date = http_date(LAST_MODIFIED)
+    older = http_date(LAST_MODIFIED - 60)
+    assert plan_request({"If-None-Match": f'"{ETAG}"'}, 100, ETAG).status == 304
+    assert plan_request({"If-None-Match": f'W/"{ETAG}", "other"'}, 100, ETAG).status == 304
+    assert plan_request({"If-None-Match": "*"}, 100, ETAG).status == 304
+    assert plan_request({"If-None-Match": '"other"'}, 100, ETAG).status == 200
+    assert plan_request({"If-Modified-Since": date}, 100, ETAG, LAST_MODIFIED).status == 304
+    assert plan_request({"If-Modified-Since": older}, 100, ETAG, LAST_MODIFIED).status == 200
+    # If-None-Match wins over If-Modified-Since
+    assert plan_request({"If-None-Match": '"other"', "If-Modified-Since": date}, 100, ETAG, LAST_MODIFIED).status == 200
+    # 304 is decided before the range, even an unsatisfiable one
+    assert plan_request({"If-None-Match": f'"{ETAG}"', "Range": "bytes=500-"}, 100, ETAG).status == 304
+
+
+def test_plan_request_if_range():
+    date = http_date(LAST_MODIFIED)
+    headers = {"Range": "bytes=10-19"}
+    assert plan_request({**headers, "If-Range": f'"{ETAG}"'}, 100, ETAG) == (206, [(10, 19)])
+    assert plan_request({**headers, "If-Range": '"other"'}, 100, ETAG) == (200, [(0, 99)])
+    assert plan_request({**headers, "If-Range": f'W/"{ETAG}"'}, 100, ETAG) == (200, [(0, 99)])
+    assert plan_request({**headers, "If-Range": date}, 100, ETAG, LAST_MODIFIED) == (206, [(10, 19)])
+    assert plan_request({**headers, "If-Range": http_date(LAST_MODIFIED - 60)}, 100, ETAG, LAST_MODIFIED) \
+        == (200, [(0, 99)])
+    assert plan_request({**headers, "If-Range": date}, 100, ETAG) == (200, [(0, 99)])
@@ -1,2 +1,2 @@
 
-from .routes import web_server
+from .routes import metrics_server, web_server
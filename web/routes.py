@@ -1,18 +1,45 @@
 
-import math
+import time
 import logging
 import secrets
+import weakref
 import mimetypes
-from info import BIN_CHANNEL, temp
+from info import temp
 from aiohttp import web
-from web.utils.custom_dl import TGCustomYield, chunk_size, offset_fix
-from web.utils.render_template import render_page
+from web.utils.block_planner import plan_range
+from web.utils.block_fetcher import block_fetcher
+from web.utils.client_pool import client_pool
+from web.utils.custom_dl import TGCustomYield, file_cache, get_file_properties
+from web.utils.disk_cache import disk_cache
+from web.utils.media_sessions import get_session_pool
+from web.utils.metrics import active_streams, registry, stream_bytes, stream_requests, stream_ttfb
+from web.utils.range_plan import (
+    http_date, multipart_closing, multipart_length, multipart_part_header, plan_request
+)
+from web.utils.render_template import get_page
+from web.utils.shared_cache import shared_cache
+from web.utils.stream_trace import stream_tracer
 
 routes = web.RouteTableDef()
 
+registry.add_stats("file2link_file_cache", file_cache.stats)
+registry.add_stats("file2link_block_fetcher", block_fetcher.stats)
+registry.add_stats("file2link_disk_cache", disk_cache.stats)
+registry.add_stats("file2link_shared_cache", shared_cache.stats)
+registry.add_stats("file2link_client", client_pool.stats, label="client")
+registry.add_stats("file2link_stream_trace", stream_tracer.stats)
+
 async def web_server():
     web_app = web.Application(client_max_size=30000000)
     web_app.add_routes(routes)
+    web_app.on_response_prepare.append(keep_stream_validators)
+    return web_app
+
+
+async def metrics_server():
+    """App with only /metrics, for the bot process while stream workers serve PORT"""
+    web_app = web.Application()
+    web_app.router.add_get("/metrics", metrics_handler)
     return web_app
 
 
@@ -21,56 +48,139 @@ async def root_route_handler(request):
     return web.Response(text="file2link Backend is working")
 
 
+@routes.get("/ready", allow_head=True)
+async def ready_handler(request):
+    if temp.BOT is None:
+        return web.json_response({"ready": False, "dcs": {}}, status=503)
+    readiness = get_session_pool(temp.BOT).readiness()
+    return web.json_response(readiness, status=200 if readiness["ready"] else 503)
+
+
+@routes.get("/metrics")
+async def metrics_handler(request):
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8",
+                        headers={"Cache-Control": "no-cache"})
+
+
 @routes.get("/watch/{message_id}/{file_name}")
 async def stream_handler(request):
     try:
         message_id = int(request.match_info['message_id'])
-        return web.Response(text=await render_page(message_id), content_type='text/html')
+        page = await get_page(message_id)
+        headers = {"ETag": f'"{page.etag}"', "Cache-Control": "no-cache"}
+        if any(etag.value in (page.etag, "*") for etag in request.if_none_match or ()):
+            return web.Response(status=304, headers=headers)
+        return web.Response(text=page.html, content_type='text/html', headers=headers)
     except ValueError as e:
         logging.error(e)
         raise web.HTTPNotFound
 
 
-@routes.get("/download/{message_id}/{file_name}")
-@routes.get("/{message_id}/{file_name}")
+@routes.get("/download/{message_id}/{file_name}", allow_head=True)
+@routes.get("/{message_id}/{file_name}", allow_head=True)
 async def old_stream_handler(request):
     try:
         message_id = int(request.match_info['message_id'])
-        return await media_streamer(request, message_id)
+        response = await media_streamer(request, message_id)
     except ValueError as e:
         logging.error(e)
+        stream_requests.inc(status=404)
         raise web.HTTPNotFound
+    # FileResponse only sets the status of a disk cached range in prepare()
+    status = response.planned_status if isinstance(response, CachedFileResponse) else response.status
+    stream_requests.inc(status=status)
+    return response
 
 
-async def media_streamer(request, message_id: int):
-    range_header = request.headers.get('Range', 0)
-    media_msg = await temp.BOT.get_messages(BIN_CHANNEL, message_id)
-    file_properties = await TGCustomYield().generate_file_properties(media_msg)
+async def stream_range(client, file_properties, start: int, end: int, trace=None, lease=None):
+    """Yield bytes start..end (inclusive) of the file through `client`"""
+    # Blocks are the largest legal GetFile size unless a smaller one is
+    # cheaper, e.g. for a seek probe of a few hundred bytes
+    offset, first_part_cut, last_part_cut, part_count, chunk_size = plan_range(start, end, file_properties.dc_id)
+    async for chunk in TGCustomYield(client).yield_file(file_properties, offset, first_part_cut, last_part_cut,
+                                                        part_count, chunk_size, trace=trace, lease=lease):
+        yield chunk
+
+
+async def stream_multipart(client, file_properties, ranges, boundary: str, content_type: str, trace=None,
+                           lease=None):
     file_size = file_properties.file_size
+    for start, end in ranges:
+        yield multipart_part_header(boundary, content_type, start, end, file_size)
+        async for chunk in stream_range(client, file_properties, start, end, trace, lease):
+            yield chunk
+        yield b"\r\n"
+    yield multipart_closing(boundary)
 
-    # Enhanced range request handling for better video seeking
-    if range_header:
-        from_bytes, until_bytes = range_header.replace('bytes=', '').split('-')
-        from_bytes = int(from_bytes)
-        until_bytes = int(until_bytes) if until_bytes else file_size - 1
-    else:
-        from_bytes = request.http_range.start or 0
-        until_bytes = request.http_range.stop or file_size - 1
 
-    req_length = until_bytes - from_bytes
+async def get_stream_client(message_id: int):
+    """Pick the least busy streaming client and the file properties as that client sees them
+
+    The stream is counted towards the client from here on, the caller
+    releases the returned lease once the response is done.
+    """
+    client = client_pool.pick()
+    lease = client_pool.lease(client)
+    try:
+        try:
+            file_properties = await get_file_properties(message_id, client)
+        except Exception as e:
+            # A missing or deleted file is missing for the main bot too
+            if client is temp.BOT or isinstance(e, ValueError):
+                raise
+            # A helper that can't read BIN_CHANNEL right now: let the main bot serve it
+            client_pool.on_error(client, e)
+            client = temp.BOT
+            lease.move(client)
+            file_properties = await get_file_properties(message_id, client)
+    except BaseException:
+        lease.release()
+        raise
+    client_pool.on_success(client)
+    return client, file_properties, lease
 
-    # Optimize chunk size for video streaming - larger chunks for better performance
-    if file_properties.mime_type and 'video' in file_properties.mime_type:
-        # Use larger chunks for video files to improve streaming performance
-        new_chunk_size = await chunk_size(min(req_length, 1024 * 1024))  # Max 1MB chunks for video
-    else:
-        new_chunk_size = await chunk_size(req_length)
-    
-    offset = await offset_fix(from_bytes, new_chunk_size)
-    first_part_cut = from_bytes - offset
-    last_part_cut = (until_bytes % new_chunk_size) + 1
-    part_count = math.ceil(req_length / new_chunk_size)
-    body = TGCustomYield().yield_file(media_msg, offset, first_part_cut, last_part_cut, part_count, new_chunk_size)
+
+async def measure_stream(body, started: float, status: int, trace=None, lease=None):
+    """Pass a response body through, recording time to first byte and bytes sent"""
+    active_streams.inc()
+    first = True
+    waiting = time.monotonic()
+    try:
+        async for chunk in body:
+            arrived = time.monotonic()
+            if first:
+                stream_ttfb.observe(arrived - started)
+                first = False
+            stream_bytes.inc(len(chunk), source="telegram")
+            if trace is not None:
+                trace.chunk(arrived - waiting, len(chunk))
+            yield chunk
+            waiting = time.monotonic()
+            if trace is not None:
+                # Resumed once the client accepted the chunk
+                trace.wrote(arrived)
+    finally:
+        active_streams.dec()
+        await body.aclose()
+        stream_tracer.finish(trace, status)
+        if lease is not None:
+            lease.release()
+
+
+async def media_streamer(request, message_id: int):
+    started = time.monotonic()
+    trace = stream_tracer.start(request, message_id)
+    try:
+        client, file_properties, lease = await get_stream_client(message_id)
+    except Exception as e:
+        stream_tracer.finish(trace, None, f"{type(e).__name__}: {e}")
+        raise
+    if trace is not None:
+        trace.record("metadata", started)
+        trace.set(client=client.name, dc=file_properties.dc_id, file_size=file_properties.file_size)
+    file_size = file_properties.file_size
+    etag = file_properties.file_unique_id
+    last_modified = file_properties.last_modified
 
     file_name = file_properties.file_name if file_properties.file_name else f"{secrets.token_hex(2)}.jpeg"
     mime_type = file_properties.mime_type if file_properties.mime_type else f"{mimetypes.guess_type(file_name)}"
@@ -80,15 +190,11 @@ async def media_streamer(request, message_id: int):
         "Content-Type": mime_type,
         "Accept-Ranges": "bytes",
         "Content-Disposition": f'attachment; filename="{file_name}"',
+        "ETag": f'"{etag}"',
     }
-    
-    # Add range headers for partial content
-    if range_header:
-        headers["Content-Range"] = f"bytes {from_bytes}-{until_bytes}/{file_size}"
-        headers["Content-Length"] = str(req_length + 1)
-    else:
-        headers["Content-Length"] = str(file_size)
-    
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+
     # Add caching and streaming optimization headers for video files
     if mime_type and 'video' in mime_type:
         headers.update({
@@ -97,10 +203,89 @@ async def media_streamer(request, message_id: int):
             "X-Content-Type-Options": "nosniff",
         })
 
+    plan = plan_request(request.headers, file_size, etag, last_modified)
+
+    if plan.status == 304:
+        for header in ("Content-Type", "Content-Disposition"):
+            headers.pop(header)
+        stream_tracer.finish(trace, 304)
+        lease.release()
+        return web.Response(status=304, headers=headers)
+    if plan.status == 416:
+        headers["Content-Range"] = f"bytes */{file_size}"
+        stream_tracer.finish(trace, 416)
+        lease.release()
+        return web.Response(status=416, headers=headers)
+
+    ranges = plan.ranges
+    is_head = request.method == "HEAD"
+
+    # Serve ranges that are fully in the disk cache with zero-copy sendfile
+    if len(ranges) == 1 and disk_cache.has_range(file_properties.file_unique_id, *ranges[0]):
+        if not is_head:
+            stream_bytes.inc(ranges[0][1] - ranges[0][0] + 1, source="disk")
+        stream_tracer.finish(trace, plan.status)
+        lease.release()
+        return CachedFileResponse(
+            disk_cache.data_path(file_properties.file_unique_id), ranges[0] if plan.status == 206 else None,
+            headers=headers
+        )
+
+    if len(ranges) > 1:
+        boundary = secrets.token_hex(16)
+        headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+        headers["Content-Length"] = str(multipart_length(boundary, mime_type, ranges, file_size))
+        body = None if is_head else stream_multipart(client, file_properties, ranges, boundary, mime_type, trace, lease)
+    elif ranges:
+        start, end = ranges[0]
+        if plan.status == 206:
+            headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        headers["Content-Length"] = str(end - start + 1)
+        body = None if is_head else stream_range(client, file_properties, start, end, trace, lease)
+    else:
+        # Empty file
+        headers["Content-Length"] = "0"
+        body = None
+
+    if body is None:
+        stream_tracer.finish(trace, plan.status)
+        lease.release()
+    else:
+        body = measure_stream(body, started, plan.status, trace, lease)
+        # A body that is never iterated, e.g. the client left before the
+        # headers were sent, doesn't run its finally
+        weakref.finalize(body, lease.release)
     return_resp = web.Response(
-        status=206 if range_header else 200,
+        status=plan.status,
         body=body,
         headers=headers
     )
 
     return return_resp
+
+
+class CachedFileResponse(web.FileResponse):
+    """Sends one already planned range of a disk cached file with sendfile"""
+
+    def __init__(self, path, byte_range, headers):
+        super().__init__(path, headers=headers)
+        self.byte_range = byte_range
+        self.planned_status = 200 if byte_range is None else 206
+        self.validators = (headers["ETag"], headers.get("Last-Modified"))
+
+    async def prepare(self, request):
+        # Preconditions are settled by plan_request already, so FileResponse
+        # only gets to see the range it has to send
+        plain_headers = {k: v for k, v in request.headers.items() if not k.lower().startswith(("if-", "range"))}
+        if self.byte_range is not None:
+            plain_headers["Range"] = "bytes={}-{}".format(*self.byte_range)
+        return await super().prepare(request.clone(headers=plain_headers))
+
+
+async def keep_stream_validators(request, response):
+    """FileResponse derives ETag/Last-Modified from the cache file, put the stream's own back"""
+    if isinstance(response, CachedFileResponse):
+        etag, last_modified = response.validators
+        response.headers["ETag"] = etag
+        if last_modified:
+            response.headers["Last-Modified"] = last_modified
@@ -0,0 +1,65 @@
+"""A streaming worker process: `python -m web.stream_worker <index>`
+
+bot.py starts STREAM_WORKERS of these when the setting is above 0. Every
+worker logs in as the bot with its own session file that receives no
+updates, kept next to bot.py so restarts don't log in again, and serves the web routes on PORT with SO_REUSEPORT, so the kernel
+spreads connections over all workers and the download path uses every core.
+"""
+import os
+import sys
+import signal
+import asyncio
+from aiohttp import web
+from pyrogram import Client
+from info import API_ID, API_HASH, BOT_TOKEN, PORT, HELPER_BOT_TOKENS, WARMUP_DCS, temp
+from web import web_server
+from web.utils.client_pool import client_pool
+from web.utils.media_sessions import get_session_pool, stop_session_pools
+
+# Same directory as the bot's own session file
+WORKDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def serve(index: int):
+    client = Client(
+        name=f"stream_worker_{index}",
+        api_id=API_ID,
+        api_hash=API_HASH,
+        bot_token=BOT_TOKEN,
+        workdir=WORKDIR,
+        no_updates=True,
+        sleep_threshold=5,
+    )
+    await client.start()
+    temp.BOT = client
+    client_pool.add(client)
+    if HELPER_BOT_TOKENS:
+        await client_pool.start_helpers(HELPER_BOT_TOKENS, prefix=f"stream_worker_{index}_helper", workdir=WORKDIR)
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopped.set)
+
+    runner = web.AppRunner(await web_server())
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", PORT, reuse_port=True).start()
+
+    if WARMUP_DCS:
+        warmup_task = asyncio.ensure_future(asyncio.gather(
+            *(get_session_pool(pool_client).warm_up(WARMUP_DCS) for pool_client in client_pool.states)
+        ))
+    print(f"Stream worker {index} serving on port {PORT}")
+
+    await stopped.wait()
+    if WARMUP_DCS:
+        warmup_task.cancel()
+    await runner.cleanup()
+    await stop_session_pools()
+    await client_pool.stop()
+    await client.stop()
+    print(f"Stream worker {index} stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(serve(int(sys.argv[1])))
@@ -0,0 +1,76 @@
+import asyncio
+from collections import OrderedDict
+from info import BLOCK_CACHE_SIZE
+
+
+class BlockFetcher:
+    """Shares GetFile results between concurrent streams of the same file"""
+
+    def __init__(self, max_bytes: int = BLOCK_CACHE_SIZE):
+        self.max_bytes = max_bytes
+        self.blocks = OrderedDict()  # (media_id, offset, limit) -> bytes, LRU order
+        self.cached_bytes = 0
+        self.in_flight = {}  # key -> Task downloading the block
+        self.requests = 0
+        self.hits = 0
+        self.coalesced = 0
+        self.fetches = 0
+
+    def get_cached(self, key):
+        block = self.blocks.get(key)
+        if block is not None:
+            self.blocks.move_to_end(key)
+        return block
+
+    def store(self, key, block: bytes):
+        if not block or len(block) > self.max_bytes:
+            return
+        old = self.blocks.pop(key, None)
+        if old is not None:
+            self.cached_bytes -= len(old)
+        self.blocks[key] = block
+        self.cached_bytes += len(block)
+        while self.cached_bytes > self.max_bytes:
+            _, evicted = self.blocks.popitem(last=False)
+            self.cached_bytes -= len(evicted)
+
+    async def get(self, key, fetch) -> bytes:
+        """Return the block for `key`, calling `fetch()` only if nobody else has it"""
+        self.requests += 1
+
+        block = self.get_cached(key)
+        if block is not None:
+            self.hits += 1
+            return block
+
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.fetches += 1
+            # The download runs in its own task so a reader that disconnects
+            # doesn't cancel it for everybody else waiting on the same block
+            task = self.in_flight[key] = asyncio.ensure_future(fetch())
+            task.add_done_callback(lambda t: self.on_fetched(key, t))
+
+        return await asyncio.shield(task)
+
+    def on_fetched(self, key, task):
+        self.in_flight.pop(key, None)
+        if task.cancelled():
+            return
+        if task.exception() is None:
+            self.store(key, task.result())
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "fetches": self.fetches,
+            "cached_blocks": len(self.blocks),
+            "cached_bytes": self.cached_bytes,
+        }
+
+
+block_fetcher = BlockFetcher()
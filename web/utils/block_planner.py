@@ -0,0 +1,64 @@
+from collections import defaultdict
+from web.utils.range_plan import plan_blocks
+
+# upload.GetFile rules: limit is a power of two between 4 KB and 1 MB,
+# offset is a multiple of limit, so a request never crosses a 1 MB boundary
+MIN_BLOCK_SIZE = 4 * 1024
+MAX_BLOCK_SIZE = 1024 * 1024
+BLOCK_SIZES = [MIN_BLOCK_SIZE << shift for shift in range(9)]  # 4 KB ... 1 MB
+
+# Starting guesses until a DC has served a few requests
+DEFAULT_RTT = 0.1  # seconds per GetFile round trip
+DEFAULT_BANDWIDTH = 4 * 1024 * 1024  # bytes per second
+
+
+def is_legal_block(offset: int, limit: int) -> bool:
+    return limit in BLOCK_SIZES and offset % limit == 0
+
+
+class DCThroughput:
+    """Moving averages of GetFile round trip time and bandwidth per DC"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.rtt = defaultdict(lambda: DEFAULT_RTT)
+        self.bandwidth = defaultdict(lambda: DEFAULT_BANDWIDTH)
+
+    def observe(self, dc_id: int, seconds: float, size: int):
+        if seconds <= 0:
+            return
+        if size <= 64 * 1024:
+            # Small blocks are dominated by the round trip
+            self.rtt[dc_id] += self.alpha * (seconds - self.rtt[dc_id])
+        else:
+            transfer = max(seconds - self.rtt[dc_id], seconds / 10)
+            self.bandwidth[dc_id] += self.alpha * (size / transfer - self.bandwidth[dc_id])
+
+    def estimate(self, dc_id: int):
+        return self.rtt[dc_id], self.bandwidth[dc_id]
+
+
+dc_throughput = DCThroughput()
+
+
+def choose_block_size(start: int, end: int, rtt: float = DEFAULT_RTT,
+                      bandwidth: float = DEFAULT_BANDWIDTH) -> int:
+    """Legal block size that fetches start..end (inclusive) in the least estimated time"""
+    best_size, best_cost = MAX_BLOCK_SIZE, None
+    for size in BLOCK_SIZES:
+        parts = end // size - start // size + 1
+        cost = parts * rtt + parts * size / bandwidth
+        # Ties go to the larger block, it is more likely to be shared with other streams
+        if best_cost is None or cost <= best_cost:
+            best_size, best_cost = size, cost
+    return best_size
+
+
+def plan_range(start: int, end: int, dc_id: int = None):
+    """Arguments for TGCustomYield.yield_file to send bytes start..end (inclusive)
+
+    Returns (offset, first_part_cut, last_part_cut, part_count, chunk_size).
+    """
+    rtt, bandwidth = dc_throughput.estimate(dc_id)
+    chunk_size = choose_block_size(start, end, rtt, bandwidth)
+    return (*plan_blocks(start, end, chunk_size), chunk_size)
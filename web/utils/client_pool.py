@@ -0,0 +1,161 @@
+import time
+import asyncio
+from pyrogram import Client
+from info import API_ID, API_HASH, temp
+
+# A client is skipped for new streams after this many errors in a row,
+# until RETRY_AFTER seconds have passed since the last one
+MAX_ERRORS = 3
+RETRY_AFTER = 60
+
+
+class ClientState:
+    def __init__(self, client: Client, helper: bool):
+        self.client = client
+        self.helper = helper
+        self.active = 0  # streams running right now
+        self.streams = 0
+        self.flood_until = 0.0
+        self.flood_waits = 0
+        self.errors = 0  # consecutive
+        self.failed_at = 0.0
+
+    def available(self, now: float) -> bool:
+        if now < self.flood_until:
+            return False
+        return self.errors < MAX_ERRORS or now - self.failed_at >= RETRY_AFTER
+
+
+class StreamLease:
+    """One download counted towards a client's active streams until release()
+
+    Taken when the client is picked, so requests arriving together already
+    see each other's load.
+    """
+
+    def __init__(self, pool, client: Client):
+        self.pool = pool
+        self.client = client
+        self.released = False
+        pool.stream_started(client)
+
+    def move(self, client: Client):
+        """The stream carries on through `client`"""
+        if client is not self.client and not self.released:
+            self.pool.stream_finished(self.client)
+            self.pool.stream_started(client)
+        self.client = client
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.pool.stream_finished(self.client)
+
+
+class ClientPool:
+    """The main bot plus helper bots that share the streaming traffic
+
+    Every client has its own connections, media sessions and flood limits,
+    so streams are spread over the least loaded client that is neither
+    flood waiting nor failing.
+    """
+
+    def __init__(self):
+        self.states = {}  # Client -> ClientState, main bot first
+
+    def add(self, client: Client, helper: bool = False):
+        self.states[client] = ClientState(client, helper)
+
+    async def start_helpers(self, tokens, prefix: str = "helper", workdir: str = None):
+        """Log in the helper bots, with session files when `workdir` is given"""
+        async def start(index, token):
+            client = Client(
+                name=f"{prefix}_{index}",
+                api_id=API_ID,
+                api_hash=API_HASH,
+                bot_token=token,
+                in_memory=workdir is None,
+                workdir=workdir or Client.WORKDIR,
+                no_updates=True,
+            )
+            try:
+                await client.start()
+            except Exception as e:
+                print(f"Error starting helper bot {index}: {e}")
+                return
+            self.add(client, helper=True)
+            print(f"Helper bot {index} started as @{client.me.username}")
+
+        await asyncio.gather(*(start(index, token) for index, token in enumerate(tokens, 1)))
+
+    def pick(self, exclude: Client = None) -> Client:
+        """Client for a new stream: the least busy one that is available right now
+
+        With `exclude`, for a stream moving away from that client, None is
+        returned when no other client is available.
+        """
+        now = time.monotonic()
+        states = [state for state in self.states.values() if state.available(now) and state.client is not exclude]
+        if not states:
+            # Everyone is limited, the main bot still beats refusing the stream
+            return temp.BOT if exclude is None else None
+        return min(states, key=lambda state: state.active).client
+
+    def lease(self, client: Client) -> StreamLease:
+        return StreamLease(self, client)
+
+    def stream_started(self, client: Client):
+        state = self.states.get(client)
+        if state is not None:
+            state.active += 1
+            state.streams += 1
+
+    def stream_finished(self, client: Client):
+        state = self.states.get(client)
+        if state is not None:
+            state.active -= 1
+
+    def on_success(self, client: Client):
+        state = self.states.get(client)
+        if state is not None:
+            state.errors = 0
+
+    def on_error(self, client: Client, error: Exception):
+        state = self.states.get(client)
+        if state is not None:
+            state.errors += 1
+            state.failed_at = time.monotonic()
+            print(f"Error on streaming client {client.name}: {error}")
+
+    def on_flood_wait(self, client: Client, seconds: float):
+        state = self.states.get(client)
+        if state is not None:
+            state.flood_waits += 1
+            state.flood_until = max(state.flood_until, time.monotonic() + seconds)
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            state.client.name: {
+                "helper": state.helper,
+                "active": state.active,
+                "streams": state.streams,
+                "available": state.available(now),
+                "flood_waits": state.flood_waits,
+                "errors": state.errors,
+            }
+            for state in self.states.values()
+        }
+
+    async def stop(self):
+        for client, state in list(self.states.items()):
+            if not state.helper:
+                continue
+            try:
+                await client.stop()
+            except Exception as e:
+                print(f"Error stopping helper bot {client.name}: {e}")
+            del self.states[client]
+
+
+client_pool = ClientPool()
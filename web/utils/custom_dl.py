@@ -1,32 +1,75 @@
 
-import math
+import time
+import asyncio
+from collections import deque
 from typing import Union
 from pyrogram.types import Message
-from info import temp
+from info import (
+    BIN_CHANNEL, FILE_CACHE_SIZE, FILE_CACHE_TTL, PREFETCH_CHUNKS, PREFETCH_MAX_BYTES, STREAM_MAX_FLOOD_WAIT,
+    STREAM_RETRIES, STREAM_RETRY_BACKOFF, temp
+)
 from pyrogram import Client, utils, raw
-from pyrogram.session import Session, Auth
-from pyrogram.errors import AuthBytesInvalid
+from pyrogram.errors import FileReferenceExpired, FloodWait
 from pyrogram.file_id import FileId, FileType, ThumbnailSource
+from web.utils.block_fetcher import block_fetcher
+from web.utils.block_planner import dc_throughput
+from web.utils.client_pool import client_pool
+from web.utils.disk_cache import disk_cache
+from web.utils.file_cache import TTLCache
+from web.utils.file_index import file_index
+from web.utils.media_sessions import get_session_pool
+from web.utils.metrics import (
+    flood_wait_seconds, getfile_seconds, media_session_seconds, stream_failures, stream_recoveries
+)
+from web.utils.rate_limiter import rate_limiter
+from web.utils.shared_cache import shared_cache
 
+# A GetFile failing with these is retried; the pool decides whether its session is broken
+CONNECTION_ERRORS = (OSError, TimeoutError, asyncio.TimeoutError, ConnectionError)
 
-async def chunk_size(length):
-    # Optimized chunk sizing for better video streaming performance with fast-start support
-    if length > 50 * 1024 * 1024:  # Files larger than 50MB get larger chunks
-        return min(2 * 1024 * 1024, 2 ** max(min(math.ceil(math.log2(length / 1024)), 21), 11) * 1024)
-    elif length > 10 * 1024 * 1024:  # Files larger than 10MB
-        return min(1024 * 1024, 2 ** max(min(math.ceil(math.log2(length / 1024)), 20), 10) * 1024)
-    else:
-        return 2 ** max(min(math.ceil(math.log2(length / 1024)), 10), 2) * 1024
+# message_id -> decoded FileId with file_size/mime_type/file_name attached
+file_cache = TTLCache(FILE_CACHE_SIZE, FILE_CACHE_TTL)
 
 
-async def offset_fix(offset, chunksize):
-    offset -= offset % chunksize
-    return offset
+def file_cache_key(client: Client, message_id: int):
+    # File references are only valid for the bot that fetched the message.
+    # Keyed by bot id, so streaming workers logged in as the same bot share them.
+    return getattr(getattr(client, "me", None), "id", None), message_id
+
+
+async def get_file_properties(message_id: int, client: Client = None) -> FileId:
+    """Return the cached file properties of a BIN_CHANNEL message, fetching them once on a miss"""
+    client = client or temp.BOT
+
+    key = file_cache_key(client, message_id)
+
+    async def load():
+        # Another streaming worker may have fetched this message already
+        file_id = await shared_cache.get(*key)
+        if file_id is not None:
+            return file_id
+
+        # A download request can't wait out long FloodWaits like a bulk job can
+        media_msg = await rate_limiter.call("get_messages", client.get_messages, BIN_CHANNEL, message_id,
+                                            max_wait=STREAM_MAX_FLOOD_WAIT)
+        try:
+            file_id = await TGCustomYield.generate_file_properties(media_msg)
+        except ValueError:
+            # Deleted from BIN_CHANNEL, new uploads of this file need a fresh copy
+            file_index.discard_message(message_id)
+            raise
+        setattr(file_id, "message_id", message_id)
+        # Files in BIN_CHANNEL never change, the message date doubles as Last-Modified
+        setattr(file_id, "last_modified", media_msg.date.timestamp() if media_msg.date else None)
+        await shared_cache.set(*key, file_id)
+        return file_id
+
+    return await file_cache.get_or_load(key, load)
 
 
 class TGCustomYield:
-    def __init__(self):
-        self.main_bot = temp.BOT
+    def __init__(self, client: Client = None):
+        self.main_bot = client or temp.BOT
 
     @staticmethod
     async def generate_file_properties(msg: Message):
@@ -49,56 +92,16 @@ class TGCustomYield:
             file_id_str = media.file_id
 
         file_id_obj = FileId.decode(file_id_str)
+        setattr(file_id_obj, "file_id_str", file_id_str)
 
         # Add file properties
         setattr(file_id_obj, "file_size", getattr(media, "file_size", 0))
         setattr(file_id_obj, "mime_type", getattr(media, "mime_type", ""))
         setattr(file_id_obj, "file_name", getattr(media, "file_name", ""))
+        setattr(file_id_obj, "file_unique_id", getattr(media, "file_unique_id", "") or str(file_id_obj.media_id))
 
         return file_id_obj
 
-    async def generate_media_session(self, client: Client, msg: Message):
-        data = await self.generate_file_properties(msg)
-        media_session = client.media_sessions.get(data.dc_id, None)
-
-        if media_session is None:
-            if data.dc_id != await client.storage.dc_id():
-                media_session = Session(
-                    client, data.dc_id, await Auth(client, data.dc_id, await client.storage.test_mode()).create(),
-                    await client.storage.test_mode(), is_media=True
-                )
-                await media_session.start()
-
-                for _ in range(3):
-                    exported_auth = await client.invoke(
-                        raw.functions.auth.ExportAuthorization(dc_id=data.dc_id)
-                    )
-
-                    try:
-                        await media_session.send(
-                            raw.functions.auth.ImportAuthorization(
-                                id=exported_auth.id,
-                                bytes=exported_auth.bytes
-                            )
-                        )
-                    except AuthBytesInvalid:
-                        continue
-                    else:
-                        break
-                else:
-                    await media_session.stop()
-                    raise AuthBytesInvalid
-            else:
-                media_session = Session(
-                    client, data.dc_id, await client.storage.auth_key(),
-                    await client.storage.test_mode(), is_media=True
-                )
-                await media_session.start()
-
-            client.media_sessions[data.dc_id] = media_session
-
-        return media_session
-
     @staticmethod
     async def get_location(file_id: FileId):
         file_type = file_id.file_type
@@ -141,54 +144,200 @@ class TGCustomYield:
 
         return location
 
-    async def yield_file(self, media_msg: Message, offset: int, first_part_cut: int,
-                         last_part_cut: int, part_count: int, chunk_size: int):
-        client = self.main_bot
-        data = await self.generate_file_properties(media_msg)
-        media_session = await self.generate_media_session(client, media_msg)
+    @staticmethod
+    def prefetch_window(chunk_size: int) -> int:
+        """Number of GetFile requests a single stream may keep in flight"""
+        # Never hold more than PREFETCH_MAX_BYTES per stream, so a slow
+        # client can't make us buffer the whole file in memory
+        return max(1, min(PREFETCH_CHUNKS, PREFETCH_MAX_BYTES // chunk_size))
 
-        current_part = 1
-        location = await self.get_location(data)
+    async def yield_file(self, data: FileId, offset: int, first_part_cut: int,
+                         last_part_cut: int, part_count: int, chunk_size: int, trace=None, lease=None):
+        # The caller's lease counts the stream from the moment its client was
+        # picked; without one the stream is counted while this runs
+        own_lease = lease is None
+        if own_lease:
+            lease = client_pool.lease(self.main_bot)
+        else:
+            # An earlier range of the same response may have moved it elsewhere
+            lease.move(self.main_bot)
+        # What blocks are downloaded through. A recovery replaces it with a
+        # fresh file reference or another client; `generation` tells the
+        # read-ahead requests that failed together that one of them did it.
+        source = {
+            'client': self.main_bot,
+            'data': data,
+            'location': await self.get_location(data),
+            'generation': 0,
+        }
+        recovery_lock = asyncio.Lock()
+        message_id = getattr(data, "message_id", None)
 
-        # Enhanced streaming for better video performance with fast-start optimization
+        async def get_file(part_offset, used):
+            client, file_id = used['client'], used['data']
+            session_pool = get_session_pool(client)
+            # Each GetFile borrows the least loaded session of the pool, so
+            # the read-ahead requests are spread over all of them
+            waited = time.monotonic()
+            async with session_pool.acquire(file_id.dc_id) as media_session:
+                started = time.monotonic()
+                media_session_seconds.observe(started - waited, dc=file_id.dc_id)
+                if trace is not None:
+                    trace.record("session", waited, dc=file_id.dc_id)
+                try:
+                    r = await media_session.send(
+                        raw.functions.upload.GetFile(
+                            location=used['location'],
+                            offset=part_offset,
+                            limit=chunk_size
+                        ),
+                    )
+                except CONNECTION_ERRORS as e:
+                    session_pool.request_failed(file_id.dc_id, media_session, e)
+                    raise
+                except FloodWait as e:
+                    # Send new streams to other clients while this one waits
+                    client_pool.on_flood_wait(client, e.value)
+                    flood_wait_seconds.inc(e.value, method="get_file")
+                    raise
+                session_pool.request_done(media_session)
+            elapsed = time.monotonic() - started
+            getfile_seconds.observe(elapsed, dc=file_id.dc_id)
+            if trace is not None:
+                trace.record("getfile", started, offset=part_offset,
+                             bytes=len(r.bytes) if isinstance(r, raw.types.upload.File) else 0)
+            if isinstance(r, raw.types.upload.File):
+                dc_throughput.observe(file_id.dc_id, elapsed, len(r.bytes))
+                return r.bytes
+            return b""
+
+        async def load_block(part_offset, used):
+            started = time.monotonic()
+            block = await disk_cache.read(data.file_unique_id, part_offset, chunk_size)
+            if block is not None:
+                if trace is not None:
+                    trace.record("disk_read", started, offset=part_offset)
+                return block
+            block = await get_file(part_offset, used)
+            if disk_cache.accepts(data.file_size, part_offset, block):
+                asyncio.ensure_future(disk_cache.write(data.file_unique_id, data.file_size, part_offset, block))
+            return block
+
+        async def switch_to(client):
+            """Download the rest through `client`, with file properties fetched for it"""
+            file_id = await get_file_properties(message_id, client)
+            location = await self.get_location(file_id)
+            lease.move(client)
+            source.update(client=client, data=file_id, location=location)
+
+        async def recover(used, reason, attempt, flood_wait=0):
+            """Make `source` ready for another try after a request through `used` failed
+
+            Returns False if the stream can't go on.
+            """
+            async with recovery_lock:
+                if source['generation'] != used['generation']:
+                    # Another read-ahead request hit the same problem and already recovered
+                    return True
+                started = time.monotonic()
+                client = used['client']
+                action = None
+                try:
+                    if reason == "file_reference_expired":
+                        key = file_cache_key(client, message_id)
+                        file_cache.invalidate(key)
+                        await shared_cache.invalidate(*key)
+                        await switch_to(client)
+                        action = "refresh"
+                    elif reason == "flood_wait" or attempt > 0:
+                        # Rather than wait, carry on through a client that isn't limited
+                        other = client_pool.pick(exclude=client)
+                        if other is not None:
+                            await switch_to(other)
+                            action = "switch_client"
+                except Exception as e:
+                    print(f"Error recovering stream of message {message_id}: {e}")
+                    if reason == "file_reference_expired":
+                        return False
+
+                if action is None:
+                    if reason == "flood_wait" and flood_wait > STREAM_MAX_FLOOD_WAIT:
+                        return False
+                    # The retry takes the least loaded healthy session, a broken one was discarded
+                    await asyncio.sleep(max(flood_wait, min(STREAM_RETRY_BACKOFF * 2 ** attempt, 8)))
+                    action = "retry"
+
+                source['generation'] += 1
+                stream_recoveries.inc(reason=reason, action=action)
+                if trace is not None:
+                    trace.record("recovery", started, reason=reason, action=action)
+                print(f"Stream of message {message_id} recovered from {reason}: {action}")
+                return True
+
+        async def fetch(part_offset):
+            # Streams of the same file share blocks that are cached or in flight
+            key = (data.media_id, part_offset, chunk_size)
+            for attempt in range(STREAM_RETRIES + 1):
+                used = dict(source)
+                try:
+                    return await block_fetcher.get(key, lambda: load_block(part_offset, used))
+                except FileReferenceExpired:
+                    if message_id is None or attempt == STREAM_RETRIES or \
+                            not await recover(used, "file_reference_expired", attempt):
+                        raise
+                except FloodWait as e:
+                    if attempt == STREAM_RETRIES or not await recover(used, "flood_wait", attempt, e.value):
+                        raise
+                except CONNECTION_ERRORS:
+                    if attempt == STREAM_RETRIES or not await recover(used, "connection", attempt):
+                        raise
+
+        # Read-ahead: keep up to `window` GetFile requests in flight and hand
+        # the chunks out in order. A new request is only scheduled when the
+        # client consumes a chunk, which gives us per-stream backpressure.
+        window = self.prefetch_window(chunk_size)
+        pending = deque()
+        next_part = 1
+
+        def schedule():
+            nonlocal next_part
+            while next_part <= part_count and len(pending) < window:
+                part_offset = offset + (next_part - 1) * chunk_size
+                pending.append(asyncio.ensure_future(fetch(part_offset)))
+                next_part += 1
+
+        current_part = 1
         try:
-            r = await media_session.send(
-                raw.functions.upload.GetFile(
-                    location=location,
-                    offset=offset,
-                    limit=chunk_size
-                ),
-            )
+            schedule()
+            while pending:
+                chunk = await pending.popleft()
+                if not chunk:
+                    break
+                schedule()
 
-            if isinstance(r, raw.types.upload.File):
-                while current_part <= part_count:
-                    chunk = r.bytes
-                    if not chunk:
-                        break
-                    
-                    # Optimized chunk delivery for video streaming with fast-start support
-                    if part_count == 1:
-                        yield chunk[first_part_cut:last_part_cut]
-                        break
-                    elif current_part == 1:
-                        yield chunk[first_part_cut:]
-                    elif current_part == part_count:
-                        yield chunk[:last_part_cut]
-                    else:
-                        yield chunk
-
-                    offset += chunk_size
-                    
-                    # Pre-fetch next chunk for smoother streaming
-                    if current_part < part_count:
-                        r = await media_session.send(
-                            raw.functions.upload.GetFile(
-                                location=location,
-                                offset=offset,
-                                limit=chunk_size
-                            ),
-                        )
-                    
-                    current_part += 1
+                if part_count == 1:
+                    yield chunk[first_part_cut:last_part_cut]
+                    break
+                elif current_part == 1:
+                    yield chunk[first_part_cut:]
+                elif current_part == part_count:
+                    yield chunk[:last_part_cut]
+                else:
+                    yield chunk
+
+                current_part += 1
         except Exception as e:
+            # Recovery gave up: the response ends short of its Content-Length
             print(f"Error in yield_file: {e}")
+            stream_failures.inc(reason=type(e).__name__)
+            if trace is not None:
+                trace.set(error=f"{type(e).__name__}: {e}")
+        finally:
+            if own_lease:
+                lease.release()
+            # The client went away or we stopped early: drop the read-ahead
+            for task in pending:
+                if task.done() and not task.cancelled():
+                    task.exception()
+                else:
+                    task.cancel()
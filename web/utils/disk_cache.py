@@ -0,0 +1,266 @@
+import os
+import shutil
+import asyncio
+from collections import OrderedDict
+from info import DISK_CACHE_DIR, DISK_CACHE_SIZE, STREAM_WORKERS
+
+# Blocks are 1 MB aligned, the largest block Telegram serves per GetFile
+DISK_BLOCK_SIZE = 1024 * 1024
+
+
+# Every file gets a directory holding a sparse `data` file of the real file
+# size and a `blocks` log with one line per cached block offset
+class CachedFile:
+    def __init__(self, path: str, file_size: int, blocks=None, log_size: int = 0):
+        self.path = path
+        self.file_size = file_size
+        self.blocks = set(blocks or ())  # offsets of the blocks present in `data`
+        self.log_size = log_size  # size of `blocks` when it was last read
+
+    @property
+    def data_path(self):
+        return os.path.join(self.path, "data")
+
+    @property
+    def log_path(self):
+        return os.path.join(self.path, "blocks")
+
+    def block_length(self, offset: int) -> int:
+        return min(DISK_BLOCK_SIZE, self.file_size - offset)
+
+    @property
+    def cached_bytes(self):
+        return sum(self.block_length(offset) for offset in self.blocks)
+
+    def has_range(self, start: int, end: int) -> bool:
+        """True if every byte from `start` to `end` (inclusive) is on disk"""
+        first = start - start % DISK_BLOCK_SIZE
+        return all(offset in self.blocks for offset in range(first, end + 1, DISK_BLOCK_SIZE))
+
+
+class DiskBlockCache:
+    """Size-bounded on-disk cache of aligned file blocks, evicted per file in LRU order"""
+
+    def __init__(self, directory: str = DISK_CACHE_DIR, max_bytes: int = DISK_CACHE_SIZE,
+                 shared: bool = STREAM_WORKERS > 0):
+        self.directory = directory
+        # Every worker process evicts by its own index, so each gets an
+        # equal share and the directory as a whole stays within max_bytes
+        self.max_bytes = max_bytes // max(1, STREAM_WORKERS) if shared else max_bytes
+        # Other worker processes write to and evict from the same directory
+        self.shared = shared
+        self.files = OrderedDict()  # file_unique_id -> CachedFile, LRU order
+        self.cached_bytes = 0
+        self.hits = 0
+        self.writes = 0
+        self.evictions = 0
+        self.loaded = False
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def load(self):
+        """Rebuild the index from what is on disk, oldest files first"""
+        self.loaded = True
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+
+        found = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            cached_file = self.read_entry(path)
+            if cached_file is None:
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            found.append((os.path.getmtime(cached_file.log_path), name, cached_file))
+
+        for _, name, cached_file in sorted(found):
+            self.files[name] = cached_file
+            self.cached_bytes += cached_file.cached_bytes
+        self.evict()
+
+    @staticmethod
+    def read_entry(path: str):
+        try:
+            file_size = os.path.getsize(os.path.join(path, "data"))
+            with open(os.path.join(path, "blocks")) as log:
+                text = log.read()
+        except OSError:
+            return None
+
+        lines = text.split("\n")
+
+        blocks = set()
+        # The last element is either empty or a line cut short by a crash
+        for line in lines[:-1]:
+            try:
+                offset = int(line)
+            except ValueError:
+                continue
+            if offset % DISK_BLOCK_SIZE == 0 and 0 <= offset < file_size:
+                blocks.add(offset)
+        return CachedFile(path, file_size, blocks, len(text)) if blocks else None
+
+    def refresh(self, file_unique_id: str):
+        """Pick up blocks another worker process wrote or evicted since we last looked"""
+        path = os.path.join(self.directory, file_unique_id)
+        try:
+            log_size = os.path.getsize(os.path.join(path, "blocks"))
+        except OSError:
+            log_size = 0
+
+        cached_file = self.files.get(file_unique_id)
+        if cached_file is not None and (log_size == cached_file.log_size or not (log_size or cached_file.blocks)):
+            # Unchanged, or our own first block is still being written
+            return
+        fresh = self.read_entry(path) if log_size else None
+        if fresh is None:
+            if cached_file is not None:
+                # Evicted by another worker, the directory is already gone
+                self.files.pop(file_unique_id)
+                self.cached_bytes -= cached_file.cached_bytes
+            return
+        if cached_file is None:
+            self.files[file_unique_id] = fresh
+            self.cached_bytes += fresh.cached_bytes
+            return
+        # Updated in place, a write in progress still holds this object
+        self.cached_bytes += fresh.cached_bytes - cached_file.cached_bytes
+        cached_file.blocks = fresh.blocks
+        cached_file.log_size = fresh.log_size
+
+    def get(self, file_unique_id: str):
+        if not self.enabled:
+            return None
+        if not self.loaded:
+            self.load()
+        if self.shared:
+            self.refresh(file_unique_id)
+        cached_file = self.files.get(file_unique_id)
+        if cached_file is not None:
+            self.files.move_to_end(file_unique_id)
+        return cached_file
+
+    def has_range(self, file_unique_id: str, start: int, end: int) -> bool:
+        cached_file = self.get(file_unique_id)
+        return cached_file is not None and cached_file.has_range(start, end)
+
+    def data_path(self, file_unique_id: str) -> str:
+        return self.files[file_unique_id].data_path
+
+    async def read(self, file_unique_id: str, offset: int, limit: int):
+        """Return `limit` bytes at `offset` if the 1 MB block holding them is cached"""
+        cached_file = self.get(file_unique_id)
+        if cached_file is None:
+            return None
+        block_offset = offset - offset % DISK_BLOCK_SIZE
+        if block_offset not in cached_file.blocks or offset + limit > block_offset + DISK_BLOCK_SIZE:
+            return None
+
+        length = min(limit, cached_file.file_size - offset)
+        try:
+            data = await asyncio.get_running_loop().run_in_executor(
+                None, read_at, cached_file.data_path, offset, length
+            )
+        except OSError as e:
+            print(f"Error reading disk cache for {file_unique_id}: {e}")
+            self.remove(file_unique_id)
+            return None
+        self.hits += 1
+        return data
+
+    def accepts(self, file_size: int, offset: int, block: bytes) -> bool:
+        """Only whole aligned blocks are stored, so every cached byte is at its real offset"""
+        return self.enabled and offset % DISK_BLOCK_SIZE == 0 and 0 < file_size <= self.max_bytes and \
+            len(block) == min(DISK_BLOCK_SIZE, file_size - offset)
+
+    async def write(self, file_unique_id: str, file_size: int, offset: int, block: bytes):
+        if not self.accepts(file_size, offset, block):
+            return
+        cached_file = self.get(file_unique_id)
+        if cached_file is None:
+            cached_file = self.files[file_unique_id] = CachedFile(
+                os.path.join(self.directory, file_unique_id), file_size
+            )
+        elif offset in cached_file.blocks:
+            return
+
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, write_block, cached_file, offset, block
+            )
+        except OSError as e:
+            print(f"Error writing disk cache for {file_unique_id}: {e}")
+            self.remove(file_unique_id)
+            return
+
+        if self.files.get(file_unique_id) is not cached_file:
+            # Evicted while we were writing
+            shutil.rmtree(cached_file.path, ignore_errors=True)
+            return
+        if offset not in cached_file.blocks:
+            cached_file.blocks.add(offset)
+            self.cached_bytes += cached_file.block_length(offset)
+            self.writes += 1
+        self.evict(keep=file_unique_id)
+
+    def remove(self, file_unique_id: str):
+        cached_file = self.files.pop(file_unique_id, None)
+        if cached_file is not None:
+            self.cached_bytes -= cached_file.cached_bytes
+            shutil.rmtree(cached_file.path, ignore_errors=True)
+
+    def evict(self, keep: str = None):
+        while self.cached_bytes > self.max_bytes and self.files:
+            file_unique_id = next(iter(self.files))
+            if file_unique_id == keep:
+                if len(self.files) == 1:
+                    break
+                self.files.move_to_end(keep)
+                continue
+            self.remove(file_unique_id)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "files": len(self.files),
+            "cached_bytes": self.cached_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "writes": self.writes,
+            "evictions": self.evictions,
+        }
+
+
+def read_at(path: str, offset: int, length: int) -> bytes:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.pread(fd, length, offset)
+    finally:
+        os.close(fd)
+
+
+def write_block(cached_file: CachedFile, offset: int, block: bytes):
+    os.makedirs(cached_file.path, exist_ok=True)
+    fd = os.open(cached_file.data_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if os.fstat(fd).st_size != cached_file.file_size:
+            os.ftruncate(fd, cached_file.file_size)
+        os.pwrite(fd, block, offset)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+    # Only record the block once its bytes are safely on disk, so after a
+    # crash the log never points at data that isn't there
+    fd = os.open(cached_file.log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, f"{offset}\n".encode())
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+disk_cache = DiskBlockCache()
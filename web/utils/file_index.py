@@ -0,0 +1,59 @@
+from web.utils.job_store import job_store
+
+
+def media_unique_id(message):
+    """file_unique_id of the document or video in `message`, if any"""
+    media = message.document or message.video
+    return media.file_unique_id if media else None
+
+
+class FileIndex:
+    """Maps file_unique_id to the BIN_CHANNEL message already holding that file
+
+    Entries are saved in the job database, so they outlive restarts.
+    """
+
+    def __init__(self):
+        self.messages = {}  # file_unique_id -> BIN_CHANNEL message id
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        if job_store.db is None:
+            return
+        self.messages.update(job_store.db.execute("SELECT file_unique_id, message_id FROM bin_files"))
+
+    def get(self, file_unique_id: str):
+        message_id = self.messages.get(file_unique_id) if file_unique_id else None
+        if message_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return message_id
+
+    def add(self, file_unique_id: str, message_id: int):
+        if not file_unique_id or self.messages.get(file_unique_id) == message_id:
+            return
+        self.messages[file_unique_id] = message_id
+        job_store.queue(("INSERT OR REPLACE INTO bin_files (file_unique_id, message_id) VALUES (?, ?)",
+                         (file_unique_id, message_id)))
+
+    def discard_message(self, message_id: int):
+        """Forget a BIN_CHANNEL message that turned out to be gone"""
+        stale = [uid for uid, msg_id in self.messages.items() if msg_id == message_id]
+        for file_unique_id in stale:
+            del self.messages[file_unique_id]
+        if stale:
+            job_store.queue(("DELETE FROM bin_files WHERE message_id = ?", (message_id,)))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "files": len(self.messages),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+file_index = FileIndex()
@@ -0,0 +1,221 @@
+import time
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from info import JOB_DB_PATH, JOB_DB_FLUSH_INTERVAL
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    start_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    base_name TEXT,
+    format TEXT,
+    message_id INTEGER,
+    status_msg_id INTEGER,
+    state TEXT NOT NULL,
+    last_message_id INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL,
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS job_files (
+    job_id INTEGER NOT NULL,
+    src_msg_id INTEGER NOT NULL,
+    name TEXT,
+    url TEXT,
+    PRIMARY KEY (job_id, src_msg_id)
+);
+CREATE TABLE IF NOT EXISTS bulk_users (
+    user_id INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS bulk_files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    name TEXT,
+    download_url TEXT,
+    watch_url TEXT
+);
+CREATE INDEX IF NOT EXISTS bulk_files_user ON bulk_files (user_id, id);
+CREATE TABLE IF NOT EXISTS bin_files (
+    file_unique_id TEXT PRIMARY KEY,
+    message_id INTEGER NOT NULL
+);
+"""
+
+# Columns of a job that are needed to run it again after a restart
+JOB_FIELDS = ('id', 'user_id', 'type', 'chat_id', 'start_id', 'count', 'base_name', 'format',
+              'message_id', 'status_msg_id', 'state', 'last_message_id', 'created')
+
+
+class JobStore:
+    """SQLite (WAL) copy of bulk jobs, their progress, BULK_FILES and the file index
+
+    The in-memory state stays authoritative. Changes are queued and written
+    in one transaction every JOB_DB_FLUSH_INTERVAL seconds, so statements
+    queued together always reach the disk together.
+    """
+
+    def __init__(self, path: str = JOB_DB_PATH, flush_interval: float = JOB_DB_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.db = None
+        self.pending = []  # [(sql, params or [params])], in order
+        self.progress = {}  # job_id -> {'files': [...], 'last_message_id': int} of unfinished jobs
+        self.executor = ThreadPoolExecutor(max_workers=1)  # sqlite3 connections stay on one thread
+        self.flush_task = None
+        self.flushes = 0
+        self.statements = 0
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def open(self):
+        """Open the database and return (unfinished jobs, BULK_FILES) as saved"""
+        if not self.enabled:
+            return [], {}
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        # Databases from before link list formats existed
+        if 'format' not in {row[1] for row in self.db.execute("PRAGMA table_info(jobs)")}:
+            self.db.execute("ALTER TABLE jobs ADD COLUMN format TEXT")
+
+        jobs = []
+        rows = self.db.execute(
+            f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE state IN ('queued', 'running') ORDER BY id"
+        )
+        for row in rows.fetchall():
+            job = dict(zip(JOB_FIELDS, row))
+            files = self.db.execute(
+                "SELECT name, url, src_msg_id FROM job_files WHERE job_id = ? ORDER BY src_msg_id", (job['id'],)
+            ).fetchall()
+            self.progress[job['id']] = {
+                'files': [{'name': name, 'url': url, 'msg_id': msg_id} for name, url, msg_id in files],
+                'last_message_id': job['last_message_id'],
+            }
+            jobs.append(job)
+
+        bulk_files = {user_id: [] for user_id, in self.db.execute("SELECT user_id FROM bulk_users")}
+        for user_id, name, download_url, watch_url in self.db.execute(
+                "SELECT user_id, name, download_url, watch_url FROM bulk_files ORDER BY id"):
+            bulk_files.setdefault(user_id, []).append({
+                'name': name,
+                'download_url': download_url,
+                'watch_url': watch_url
+            })
+        return jobs, bulk_files
+
+    def last_job_id(self) -> int:
+        if self.db is None:
+            return 0
+        return self.db.execute("SELECT COALESCE(MAX(id), 0) FROM jobs").fetchone()[0]
+
+    def queue(self, *statements):
+        if self.db is None:
+            return
+        self.pending.extend(statements)
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.ensure_future(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        if not self.pending:
+            return
+        statements, self.pending = self.pending, []
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.write, statements)
+        except sqlite3.Error as e:
+            print(f"Error saving job state: {e}")
+            return
+        self.flushes += 1
+        self.statements += len(statements)
+
+    def write(self, statements):
+        with self.db:
+            for sql, params in statements:
+                if isinstance(params, list):
+                    self.db.executemany(sql, params)
+                else:
+                    self.db.execute(sql, params)
+
+    async def close(self):
+        if self.db is None:
+            return
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+        await self.flush()
+        self.db.close()
+        self.db = None
+
+    # Jobs
+
+    def add_job(self, job: dict):
+        self.progress[job['id']] = {'files': [], 'last_message_id': 0}
+        self.queue((
+            f"INSERT OR REPLACE INTO jobs ({', '.join(JOB_FIELDS)}, updated) "
+            f"VALUES ({', '.join('?' * len(JOB_FIELDS))}, ?)",
+            tuple(job.get(field) for field in JOB_FIELDS) + (time.time(),)
+        ))
+
+    def set_state(self, job_id: int, state: str, error: str = None):
+        statements = [("UPDATE jobs SET state = ?, error = ?, updated = ? WHERE id = ?",
+                       (state, error, time.time(), job_id))]
+        if state in ('done', 'failed'):
+            self.progress.pop(job_id, None)
+            statements.append(("DELETE FROM job_files WHERE job_id = ?", (job_id,)))
+        self.queue(*statements)
+
+    def record_progress(self, job_id: int, files, last_message_id: int):
+        """Remember copied files and that every message up to `last_message_id` is handled"""
+        progress = self.progress.get(job_id)
+        if progress is None:
+            return
+        progress['files'].extend(files)
+        progress['last_message_id'] = last_message_id
+        self.queue(
+            ("INSERT OR REPLACE INTO job_files (job_id, src_msg_id, name, url) VALUES (?, ?, ?, ?)",
+             [(job_id, f['msg_id'], f['name'], f['url']) for f in files]),
+            ("UPDATE jobs SET last_message_id = ?, updated = ? WHERE id = ?",
+             (last_message_id, time.time(), job_id)),
+        )
+
+    # BULK_FILES
+
+    def start_bulk(self, user_id: int):
+        self.queue(("INSERT OR IGNORE INTO bulk_users (user_id) VALUES (?)", (user_id,)))
+
+    def add_bulk_file(self, user_id: int, file_data: dict):
+        self.queue(("INSERT INTO bulk_files (user_id, name, download_url, watch_url) VALUES (?, ?, ?, ?)",
+                    (user_id, file_data['name'], file_data['download_url'], file_data['watch_url'])))
+
+    def drop_bulk_files(self, user_id: int, count: int = None):
+        """Forget the first `count` bulk files of a user, or all of them"""
+        if count is None:
+            self.queue(("DELETE FROM bulk_files WHERE user_id = ?", (user_id,)))
+        else:
+            self.queue(("DELETE FROM bulk_files WHERE id IN "
+                        "(SELECT id FROM bulk_files WHERE user_id = ? ORDER BY id LIMIT ?)", (user_id, count)))
+
+    def exit_bulk(self, user_id: int):
+        self.drop_bulk_files(user_id)
+        self.queue(("DELETE FROM bulk_users WHERE user_id = ?", (user_id,)))
+
+    def stats(self):
+        return {
+            "pending": len(self.pending),
+            "flushes": self.flushes,
+            "statements": self.statements,
+            "active_jobs": len(self.progress),
+        }
+
+
+job_store = JobStore()
@@ -0,0 +1,104 @@
+import io
+import csv
+import json
+from itertools import islice
+
+# Output formats of link lists and the extension of the file they are sent as
+FORMATS = {
+    "txt": "txt",
+    "m3u8": "m3u8",
+    "csv": "csv",
+    "json": "json",
+}
+DEFAULT_FORMAT = "txt"
+# Pieces joined and encoded at a time
+CHUNK_LINES = 1024
+
+
+def parse_format(value: str):
+    """Normalized format name, or None if `value` isn't one of FORMATS"""
+    value = (value or DEFAULT_FORMAT).lower().lstrip(".")
+    if value == "m3u":
+        value = "m3u8"
+    return value if value in FORMATS else None
+
+
+def plain_line(idx, name, url):
+    return f"{name} : {url}\n"
+
+
+def numbered_line(idx, name, url):
+    return f"{idx}. {name} : {url}\n\n"
+
+
+# Writers yield the document as str pieces, in order
+def write_txt(entries, header, txt_line):
+    for line in header:
+        yield f"{line}\n"
+    if header:
+        yield "\n"
+    for idx, (name, url) in enumerate(entries, 1):
+        yield txt_line(idx, name, url)
+
+
+def write_m3u8(entries, header, txt_line):
+    yield "#EXTM3U\n"
+    for line in header:
+        yield f"# {line}\n"
+    for name, url in entries:
+        yield f"#EXTINF:-1,{name}\n{url}\n"
+
+
+class RowCollector(list):
+    """File-like target for csv.writer that keeps the written rows"""
+    write = list.append
+
+
+def write_csv(entries, header, txt_line):
+    rows = RowCollector()
+    writer = csv.writer(rows)
+    writer.writerow(("index", "name", "url"))
+    numbered = ((idx, name, url) for idx, (name, url) in enumerate(entries, 1))
+    while True:
+        writer.writerows(islice(numbered, CHUNK_LINES))
+        if not rows:
+            break
+        yield from rows
+        rows.clear()
+
+
+def write_json(entries, header, txt_line):
+    # One entry at a time, so the list is never held as a Python object
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    yield '{"title": %s, "files": [' % encode("\n".join(header))
+    for idx, (name, url) in enumerate(entries):
+        yield f'{", " if idx else ""}{{"name": {encode(name)}, "url": {encode(url)}}}'
+    yield "]}\n"
+
+
+WRITERS = {
+    "txt": write_txt,
+    "m3u8": write_m3u8,
+    "csv": write_csv,
+    "json": write_json,
+}
+
+
+def build_link_file(entries, file_format: str, base_name: str, header=(), txt_line=plain_line):
+    """Write (name, url) pairs as a link list document ready for reply_document
+
+    Pieces are joined and encoded into one buffer a chunk at a time instead
+    of growing a string, so a 10k entry list costs about one copy of the
+    output. `header` lines are a title (a comment in m3u8, ignored in csv)
+    and `txt_line(idx, name, url)` formats one txt entry.
+    """
+    buffer = io.BytesIO()
+    pieces = WRITERS[file_format](entries, list(header), txt_line)
+    while True:
+        chunk = list(islice(pieces, CHUNK_LINES))
+        if not chunk:
+            break
+        buffer.write("".join(chunk).encode("utf-8"))
+    buffer.seek(0)
+    buffer.name = f"{base_name}.{FORMATS[file_format]}"
+    return buffer
@@ -0,0 +1,240 @@
+import asyncio
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from pyrogram import Client, raw
+from pyrogram.session import Session, Auth
+from pyrogram.errors import AuthBytesInvalid
+from info import MEDIA_SESSIONS_PER_DC, MEDIA_SESSION_HEALTH_INTERVAL, MEDIA_SESSION_MAX_TIMEOUTS
+
+# Seconds before warming up a DC again after a failure, doubled up to the maximum
+WARMUP_RETRY_DELAY = 5
+WARMUP_RETRY_MAX_DELAY = 300
+
+
+class MediaSessionPool:
+    """Pool of media sessions per DC for a single client"""
+
+    def __init__(self, client: Client, size: int = MEDIA_SESSIONS_PER_DC):
+        self.client = client
+        self.size = max(1, size)
+        self.sessions = defaultdict(list)  # dc_id -> [Session]
+        self.load = {}  # Session -> requests in flight
+        self.timeouts = {}  # Session -> requests timed out in a row
+        self.locks = defaultdict(asyncio.Lock)  # dc_id -> creation lock
+        self.growing = set()  # dc_ids with a background creation running
+        self.health_task = None
+        self.warmup = {}  # dc_id -> "pending" | "warm" | "failed"
+
+    async def create_session(self, dc_id: int) -> Session:
+        client = self.client
+        test_mode = await client.storage.test_mode()
+
+        if dc_id != await client.storage.dc_id():
+            media_session = Session(
+                client, dc_id, await Auth(client, dc_id, test_mode).create(),
+                test_mode, is_media=True
+            )
+            await media_session.start()
+
+            for _ in range(3):
+                exported_auth = await client.invoke(
+                    raw.functions.auth.ExportAuthorization(dc_id=dc_id)
+                )
+
+                try:
+                    await media_session.send(
+                        raw.functions.auth.ImportAuthorization(
+                            id=exported_auth.id,
+                            bytes=exported_auth.bytes
+                        )
+                    )
+                except AuthBytesInvalid:
+                    continue
+                else:
+                    break
+            else:
+                await media_session.stop()
+                raise AuthBytesInvalid
+        else:
+            media_session = Session(
+                client, dc_id, await client.storage.auth_key(),
+                test_mode, is_media=True
+            )
+            await media_session.start()
+
+        return media_session
+
+    @staticmethod
+    def is_healthy(session: Session) -> bool:
+        return session.is_started.is_set()
+
+    def healthy_sessions(self, dc_id: int):
+        return [s for s in self.sessions[dc_id] if self.is_healthy(s)]
+
+    async def add_session(self, dc_id: int) -> Session:
+        """Create one more session for `dc_id`; only one creation runs per DC at a time"""
+        async with self.locks[dc_id]:
+            healthy = self.healthy_sessions(dc_id)
+            # Whoever held the lock before us may already have done the work
+            if healthy and len(self.sessions[dc_id]) >= self.size:
+                return min(healthy, key=lambda s: self.load.get(s, 0))
+
+            # Make room by dropping sessions that are no longer running
+            for session in list(self.sessions[dc_id]):
+                if not self.is_healthy(session):
+                    self.discard(dc_id, session)
+
+            session = await self.create_session(dc_id)
+            self.sessions[dc_id].append(session)
+            self.load[session] = 0
+            self.start_health_checks()
+            return session
+
+    async def grow(self, dc_id: int):
+        try:
+            await self.add_session(dc_id)
+        except Exception as e:
+            print(f"Error creating media session for DC {dc_id}: {e}")
+        finally:
+            self.growing.discard(dc_id)
+
+    async def get(self, dc_id: int) -> Session:
+        """Return the least loaded healthy session for `dc_id`"""
+        healthy = self.healthy_sessions(dc_id)
+        if not healthy:
+            return await self.add_session(dc_id)
+
+        session = min(healthy, key=lambda s: self.load.get(s, 0))
+
+        # Every session is busy and the pool has room: open another one in
+        # the background instead of making this request wait for it
+        if self.load.get(session, 0) > 0 and len(self.sessions[dc_id]) < self.size \
+                and dc_id not in self.growing:
+            self.growing.add(dc_id)
+            asyncio.ensure_future(self.grow(dc_id))
+
+        return session
+
+    @asynccontextmanager
+    async def acquire(self, dc_id: int):
+        """Borrow a session for one request, counting it towards the session's load"""
+        session = await self.get(dc_id)
+        self.load[session] = self.load.get(session, 0) + 1
+        try:
+            yield session
+        finally:
+            if session in self.load:
+                self.load[session] -= 1
+
+    def discard(self, dc_id: int, session: Session):
+        """Drop a broken session, the next request for `dc_id` creates a new one"""
+        if session in self.sessions.get(dc_id, ()):
+            self.sessions[dc_id].remove(session)
+            self.load.pop(session, None)
+            self.timeouts.pop(session, None)
+            asyncio.ensure_future(self.stop_session(session))
+
+    def request_done(self, session: Session):
+        self.timeouts.pop(session, None)
+
+    def request_failed(self, dc_id: int, session: Session, error: Exception):
+        """Discard `session` if `error` means it is broken; a single slow request doesn't"""
+        if isinstance(error, (TimeoutError, asyncio.TimeoutError)) and self.is_healthy(session):
+            # Session.send gives up on one slow request while the connection
+            # carries on serving the others
+            self.timeouts[session] = self.timeouts.get(session, 0) + 1
+            if self.timeouts[session] < MEDIA_SESSION_MAX_TIMEOUTS:
+                return
+            print(f"Media session for DC {dc_id} timed out {self.timeouts[session]} times in a row")
+        self.discard(dc_id, session)
+
+    @staticmethod
+    async def stop_session(session: Session):
+        try:
+            await session.stop()
+        except Exception as e:
+            print(f"Error stopping media session: {e}")
+
+    def start_health_checks(self):
+        if self.health_task is None and MEDIA_SESSION_HEALTH_INTERVAL > 0:
+            self.health_task = asyncio.ensure_future(self.health_check_worker())
+
+    async def health_check_worker(self):
+        while True:
+            await asyncio.sleep(MEDIA_SESSION_HEALTH_INTERVAL)
+            for dc_id, sessions in list(self.sessions.items()):
+                for session in list(sessions):
+                    # Busy sessions prove themselves healthy by serving requests
+                    if self.load.get(session, 0) > 0:
+                        continue
+                    try:
+                        if not self.is_healthy(session):
+                            raise ConnectionError("session is not started")
+                        await session.send(raw.functions.Ping(ping_id=0), timeout=10)
+                    except Exception as e:
+                        print(f"Media session for DC {dc_id} failed health check: {e}")
+                        self.discard(dc_id, session)
+
+    async def warm_up(self, dc_ids):
+        """Open the full pool for every DC in `dc_ids` ahead of the first stream
+
+        A DC that fails is retried with backoff until it is warm.
+        """
+        for dc_id in dc_ids:
+            self.warmup.setdefault(dc_id, "pending")
+
+        async def warm(dc_id):
+            delay = WARMUP_RETRY_DELAY
+            while True:
+                try:
+                    while len(self.healthy_sessions(dc_id)) < self.size:
+                        await self.add_session(dc_id)
+                except Exception as e:
+                    print(f"Error warming up media sessions for DC {dc_id}, retrying in {delay}s: {e}")
+                    self.warmup[dc_id] = "failed"
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, WARMUP_RETRY_MAX_DELAY)
+                else:
+                    self.warmup[dc_id] = "warm"
+                    return
+
+        await asyncio.gather(*(warm(dc_id) for dc_id in dc_ids))
+
+    def is_ready(self, dc_id: int) -> bool:
+        # Once warm, sessions dropped later are reopened by the next stream
+        return self.warmup.get(dc_id) == "warm" or bool(self.healthy_sessions(dc_id))
+
+    def readiness(self):
+        """Warm-up state per DC and whether every requested DC is warm or has a working session"""
+        return {
+            "ready": all(self.is_ready(dc_id) for dc_id in self.warmup),
+            "dcs": {
+                dc_id: {"state": state, "sessions": len(self.healthy_sessions(dc_id))}
+                for dc_id, state in sorted(self.warmup.items())
+            },
+        }
+
+    async def stop(self):
+        if self.health_task is not None:
+            self.health_task.cancel()
+            self.health_task = None
+        for dc_id in list(self.sessions):
+            for session in self.sessions.pop(dc_id):
+                await self.stop_session(session)
+        self.load.clear()
+        self.timeouts.clear()
+
+
+_pools = {}  # Client -> MediaSessionPool
+
+
+def get_session_pool(client: Client) -> MediaSessionPool:
+    pool = _pools.get(client)
+    if pool is None:
+        pool = _pools[client] = MediaSessionPool(client)
+    return pool
+
+
+async def stop_session_pools():
+    for pool in _pools.values():
+        await pool.stop()
@@ -0,0 +1,217 @@
+import time
+from bisect import bisect_left
+
+# Upper bounds in seconds for latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Upper bounds in seconds for whole bulk jobs
+JOB_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.values = {}  # label values tuple -> value
+
+    def key(self, labels):
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.label_names)
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, format_labels(self.label_names, key), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        self.values[self.key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        state = self.values.get(key)
+        if state is None:
+            # Per-bucket counts (the last one is +Inf), sum, count
+            state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def time(self, **labels):
+        return Timer(self, labels)
+
+    def samples(self):
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{format_value(bound)}"'
+                yield f"{self.name}_bucket", format_labels(self.label_names, key, le), cumulative
+            yield f"{self.name}_sum", format_labels(self.label_names, key), total
+            yield f"{self.name}_count", format_labels(self.label_names, key), count
+
+
+class Timer:
+    """`with histogram.time(**labels):` observes the seconds the block took"""
+
+    def __init__(self, histogram: Histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.monotonic() - self.started, **self.labels)
+
+
+class Registry:
+    """Metrics updated in place by the code paths, plus stats() dicts read at scrape time
+
+    Updating a metric is a dict lookup and an addition; all formatting
+    happens in render(), when /metrics is requested.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.stats_sources = []  # (prefix, stats function, label name or None)
+
+    def register(self, metric: Metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def add_stats(self, prefix: str, stats, label: str = None):
+        """Export the numbers of an existing stats() function as gauges
+
+        With `label`, stats() returns {label value: {name: number}}, like the
+        per-method stats of the rate limiter.
+        """
+        self.stats_sources.append((prefix, stats, label))
+
+    def collect_stats(self):
+        gauges = {}
+        for prefix, stats, label in self.stats_sources:
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"Error collecting {prefix} metrics: {e}")
+                continue
+            groups = values.items() if label else ((None, values),)
+            for label_value, group in groups:
+                for field, value in group.items():
+                    if isinstance(value, bool):
+                        value = int(value)
+                    if not isinstance(value, (int, float)):
+                        continue
+                    name = f"{prefix}_{field}"
+                    gauge = gauges.get(name)
+                    if gauge is None:
+                        gauge = gauges[name] = Gauge(name, f"{field} from {prefix} stats", (label,) if label else ())
+                    if label:
+                        gauge.set(value, **{label: label_value})
+                    else:
+                        gauge.set(value)
+        return gauges.values()
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()) + list(self.collect_stats()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Streaming
+stream_requests = registry.counter(
+    "file2link_stream_requests_total", "Download requests answered, by status", ("status",))
+stream_bytes = registry.counter(
+    "file2link_stream_bytes_total", "Response body bytes sent, by source", ("source",))
+stream_ttfb = registry.histogram(
+    "file2link_stream_ttfb_seconds", "Time from request to the first body chunk from Telegram")
+active_streams = registry.gauge(
+    "file2link_active_streams", "Response bodies being streamed from Telegram right now")
+getfile_seconds = registry.histogram(
+    "file2link_getfile_seconds", "GetFile round trip per data center", ("dc",))
+media_session_seconds = registry.histogram(
+    "file2link_media_session_seconds", "Time to get a media session per data center", ("dc",))
+stream_recoveries = registry.counter(
+    "file2link_stream_recoveries_total", "Failed block downloads a stream recovered from, by reason and action",
+    ("reason", "action"))
+stream_failures = registry.counter(
+    "file2link_stream_failures_total", "Streams that ended early after recovery gave up, by error", ("reason",))
+flood_wait_seconds = registry.counter(
+    "file2link_flood_wait_seconds_total", "Seconds Telegram told us to wait, by method", ("method",))
+
+# Bot
+bin_copies = registry.counter(
+    "file2link_bin_copies_total", "Files stored in BIN_CHANNEL by copy_file_with_retry, by result", ("result",))
+bin_copy_seconds = registry.histogram(
+    "file2link_bin_copy_seconds", "Time copy_file_with_retry took including retries")
+bulk_jobs = registry.counter(
+    "file2link_bulk_jobs_total", "Bulk jobs finished, by type and state", ("type", "state"))
+bulk_job_seconds = registry.histogram(
+    "file2link_bulk_job_seconds", "Run time of bulk jobs, by type", ("type",), buckets=JOB_BUCKETS)
@@ -0,0 +1,161 @@
+from collections import namedtuple
+from email.utils import formatdate, parsedate_to_datetime
+
+# More ranges than this in one request are served as a single spanning range
+MAX_RANGES = 16
+
+RangePlan = namedtuple('RangePlan', ['status', 'ranges'])
+
+
+def parse_range_header(header: str, file_size: int):
+    """Turn a Range header into sorted, merged (start, end) byte windows, both ends inclusive
+
+    Returns None when the header is missing or malformed (serve the whole
+    file) and an empty list when no range can be satisfied (416).
+    """
+    if not header:
+        return None
+    unit, _, range_set = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not range_set.strip():
+        return None
+
+    ranges = []
+    specs = [spec.strip() for spec in range_set.split(',') if spec.strip()]
+    if not specs:
+        return None
+    for spec in specs:
+        first, sep, last = spec.partition('-')
+        first, last = first.strip(), last.strip()
+        if not sep or not (first or last) or (first and not first.isdigit()) \
+                or (last and not last.isdigit()):
+            return None
+
+        if not first:
+            # Suffix range: the last N bytes
+            suffix = int(last)
+            if suffix == 0 or file_size == 0:
+                continue
+            ranges.append((max(0, file_size - suffix), file_size - 1))
+            continue
+
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= file_size:
+            continue
+        end = min(int(last), file_size - 1) if last else file_size - 1
+        ranges.append((start, end))
+
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    if len(merged) > MAX_RANGES:
+        merged = [(merged[0][0], max(end for _, end in merged))]
+    return merged
+
+
+def parse_etags(header: str):
+    """Opaque values of a comma separated list of (weak or strong) entity tags"""
+    tags = []
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        tags.append(tag.strip('"'))
+    return tags
+
+
+def parse_http_date(value: str):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def is_not_modified(headers, etag: str, last_modified: float = None) -> bool:
+    """If-None-Match wins over If-Modified-Since, as RFC 9110 asks"""
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match:
+        tags = parse_etags(if_none_match)
+        return '*' in tags or etag in tags
+
+    if_modified_since = headers.get('If-Modified-Since')
+    if if_modified_since and last_modified is not None:
+        since = parse_http_date(if_modified_since)
+        return since is not None and int(last_modified) <= since
+    return False
+
+
+def if_range_matches(header: str, etag: str, last_modified: float = None) -> bool:
+    """If-Range only allows a partial response while the representation is unchanged"""
+    header = header.strip()
+    if header.startswith('"'):
+        return header.strip('"') == etag
+    if header.startswith('W/'):
+        # Weak validators never satisfy If-Range
+        return False
+    since = parse_http_date(header)
+    return since is not None and last_modified is not None and int(last_modified) == since
+
+
+def plan_request(headers, file_size: int, etag: str, last_modified: float = None) -> RangePlan:
+    """Decide the status code and byte windows for a GET/HEAD on a file"""
+    if is_not_modified(headers, etag, last_modified):
+        return RangePlan(304, [])
+
+    whole_file = RangePlan(200, [(0, file_size - 1)] if file_size else [])
+
+    if_range = headers.get('If-Range')
+    if if_range and not if_range_matches(if_range, etag, last_modified):
+        return whole_file
+
+    ranges = parse_range_header(headers.get('Range', ''), file_size)
+    if ranges is None:
+        return whole_file
+    if not ranges:
+        return RangePlan(416, [])
+    return RangePlan(206, ranges)
+
+
+def plan_blocks(start: int, end: int, chunk_size: int):
+    """Map the byte window start..end (inclusive) onto aligned blocks of `chunk_size`
+
+    Returns the arguments TGCustomYield.yield_file expects: the offset of
+    the first block, the bytes to drop from the first block, the bytes to
+    keep of the last block and the number of blocks.
+    """
+    offset = start - start % chunk_size
+    first_part_cut = start - offset
+    last_part_cut = end % chunk_size + 1
+    part_count = end // chunk_size - start // chunk_size + 1
+    return offset, first_part_cut, last_part_cut, part_count
+
+
+def multipart_part_header(boundary: str, content_type: str, start: int, end: int, file_size: int) -> bytes:
+    return (
+        f"--{boundary}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+    ).encode()
+
+
+def multipart_closing(boundary: str) -> bytes:
+    return f"--{boundary}--\r\n".encode()
+
+
+def multipart_length(boundary: str, content_type: str, ranges, file_size: int) -> int:
+    """Exact Content-Length of a multipart/byteranges body for `ranges`"""
+    length = len(multipart_closing(boundary))
+    for start, end in ranges:
+        length += len(multipart_part_header(boundary, content_type, start, end, file_size))
+        length += end - start + 1 + 2  # data + CRLF
+    return length
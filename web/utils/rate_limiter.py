@@ -0,0 +1,126 @@
+import time
+import asyncio
+from pyrogram.errors import FloodWait
+from info import TELEGRAM_MAX_RATE
+from web.utils.metrics import flood_wait_seconds
+
+# Starting rate (calls per second) and burst per method. Rates are halved on
+# every FloodWait and creep back up to these values while calls succeed.
+METHOD_LIMITS = {
+    "get_messages": (5, 10),
+    "get_chat": (5, 10),
+    "get_chat_member": (5, 10),
+    "resolve_peer": (5, 10),
+    "forward_messages": (1, 3),
+    "copy_message": (1, 5),
+    "send_message": (1, 5),
+    "edit_message": (1, 3),
+    "delete_messages": (1, 5),
+    "send_document": (0.5, 2),
+}
+DEFAULT_LIMIT = (1, 5)
+
+# Slowest rate a method is throttled down to
+MIN_RATE = 0.05
+# Share of the starting rate won back per successful call
+RECOVERY_STEP = 0.05
+
+
+class TokenBucket:
+    """Token bucket whose rate backs off on FloodWait and recovers gradually"""
+
+    def __init__(self, rate: float, burst: int):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.waiting = 0
+        self.flood_waits = 0
+        self.lock = asyncio.Lock()  # waiters take tokens in arrival order
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        self.waiting += 1
+        try:
+            async with self.lock:
+                while True:
+                    now = time.monotonic()
+                    if now < self.blocked_until:
+                        await asyncio.sleep(self.blocked_until - now)
+                        continue
+                    self.refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+        finally:
+            self.waiting -= 1
+
+    def on_flood_wait(self, seconds: float):
+        now = time.monotonic()
+        self.flood_waits += 1
+        self.rate = max(MIN_RATE, self.rate / 2)
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0.0
+        self.updated = max(now, self.blocked_until)
+
+    def on_success(self):
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * RECOVERY_STEP)
+
+    def stats(self):
+        return {
+            "rate": round(self.rate, 3),
+            "base_rate": self.base_rate,
+            "tokens": round(self.tokens, 2),
+            "waiting": self.waiting,
+            "flood_waits": self.flood_waits,
+            "blocked_for": round(max(0.0, self.blocked_until - time.monotonic()), 1),
+        }
+
+
+class RateLimiter:
+    """Paces every Telegram call through a global bucket and one bucket per method"""
+
+    def __init__(self, global_rate: float = TELEGRAM_MAX_RATE):
+        self.global_bucket = TokenBucket(global_rate, max(1, int(global_rate)))
+        self.buckets = {}
+
+    def bucket(self, method: str) -> TokenBucket:
+        if method not in self.buckets:
+            self.buckets[method] = TokenBucket(*METHOD_LIMITS.get(method, DEFAULT_LIMIT))
+        return self.buckets[method]
+
+    async def call(self, method: str, func, *args, retries: int = 3, max_wait: int = 300, **kwargs):
+        """Await func(*args, **kwargs) once the limits allow it, retrying after FloodWait
+
+        FloodWaits longer than `max_wait` seconds, or after `retries` attempts, are raised.
+        """
+        bucket = self.bucket(method)
+        for attempt in range(retries):
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                result = await func(*args, **kwargs)
+            except FloodWait as e:
+                bucket.on_flood_wait(e.value)
+                flood_wait_seconds.inc(e.value, method=method)
+                print(f"FloodWait of {e.value} seconds on {method}, slowing down to {bucket.rate:.2f}/s")
+                if e.value > max_wait or attempt == retries - 1:
+                    raise
+                continue
+            bucket.on_success()
+            return result
+
+    def stats(self):
+        stats = {method: bucket.stats() for method, bucket in sorted(self.buckets.items())}
+        stats["global"] = self.global_bucket.stats()
+        return stats
+
+
+rate_limiter = RateLimiter()
@@ -1,11 +1,47 @@
 
-from info import BIN_CHANNEL, STREAM_URL, temp
-from web.utils.custom_dl import TGCustomYield
+from info import FILE_CACHE_SIZE, FILE_CACHE_TTL, STREAM_URL, TEMPLATE_RELOAD
+from web.utils.custom_dl import get_file_properties
+from web.utils.file_cache import TTLCache
+from collections import namedtuple
 import urllib.parse
 import secrets
 import mimetypes
-import aiofiles
-import aiohttp
+import hashlib
+import os
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'template')
+
+Page = namedtuple('Page', ['html', 'etag'])
+
+# kind -> template with the player tag already filled in, ready for % formatting
+templates = {}
+template_mtimes = {}
+
+# message_id -> rendered Page
+page_cache = TTLCache(FILE_CACHE_SIZE, FILE_CACHE_TTL)
+
+
+def load_templates():
+    """Read and prepare every template once; pages rendered from old templates are dropped"""
+    for name in ('req.html', 'dl.html'):
+        path = os.path.join(TEMPLATE_DIR, name)
+        template_mtimes[path] = os.path.getmtime(path)
+        with open(path) as f:
+            if name == 'req.html':
+                html = f.read()
+                templates['video'] = html.replace('tag', 'video')
+                templates['audio'] = html.replace('tag', 'audio')
+            else:
+                templates['download'] = f.read()
+    page_cache.clear()
+
+
+def reload_changed_templates():
+    if any(os.path.getmtime(path) != mtime for path, mtime in template_mtimes.items()):
+        load_templates()
+
+
+load_templates()
 
 
 def get_size(size):
@@ -20,34 +56,38 @@ def get_size(size):
 
 
 async def fetch_properties(message_id):
-    media_msg = await temp.BOT.get_messages(BIN_CHANNEL, message_id)
-    file_properties = await TGCustomYield().generate_file_properties(media_msg)
+    file_properties = await get_file_properties(message_id)
     file_name = file_properties.file_name if file_properties.file_name else f"{secrets.token_hex(2)}.jpeg"
     mime_type = file_properties.mime_type if file_properties.mime_type else f"{mimetypes.guess_type(file_name)}"
-    return file_name, mime_type
+    return file_name, mime_type, file_properties.file_size
 
 
 async def render_page(message_id):
-    file_name, mime_type = await fetch_properties(message_id)
+    file_name, mime_type, file_size = await fetch_properties(message_id)
     src = urllib.parse.urljoin(STREAM_URL, str(message_id))
     audio_formats = ['audio/mpeg', 'audio/mp4', 'audio/x-mpegurl', 'audio/vnd.wav']
     video_formats = ['video/mp4', 'video/avi', 'video/ogg', 'video/h264', 'video/h265', 'video/x-matroska']
-    
+
     if mime_type.lower() in video_formats:
-        async with aiofiles.open('web/template/req.html') as r:
-            heading = 'Watch {}'.format(file_name)
-            tag = mime_type.split('/')[0].strip()
-            html = (await r.read()).replace('tag', tag) % (heading, file_name, src)
+        heading = 'Watch {}'.format(file_name)
+        html = templates['video'] % (heading, file_name, src)
     elif mime_type.lower() in audio_formats:
-        async with aiofiles.open('web/template/req.html') as r:
-            heading = 'Listen {}'.format(file_name)
-            tag = mime_type.split('/')[0].strip()
-            html = (await r.read()).replace('tag', tag) % (heading, file_name, src)
+        heading = 'Listen {}'.format(file_name)
+        html = templates['audio'] % (heading, file_name, src)
     else:
-        async with aiofiles.open('web/template/dl.html') as r:
-            heading = 'Download {}'.format(file_name)
-            async with aiohttp.ClientSession() as s:
-                async with s.get(src) as u:
-                    file_size = get_size(u.headers.get('Content-Length', 0))
-                    html = (await r.read()) % (heading, file_name, src, file_size)
+        heading = 'Download {}'.format(file_name)
+        # The size is already in the file properties, no need to ask our own stream URL
+        html = templates['download'] % (heading, file_name, src, get_size(file_size or 0))
     return html
+
+
+async def get_page(message_id):
+    """Return the rendered page for `message_id` with its ETag, rendering it only once"""
+    if TEMPLATE_RELOAD:
+        reload_changed_templates()
+
+    async def render():
+        html = await render_page(message_id)
+        return Page(html, hashlib.sha1(html.encode()).hexdigest())
+
+    return await page_cache.get_or_load(message_id, render)
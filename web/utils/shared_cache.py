@@ -0,0 +1,128 @@
+import time
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pyrogram.file_id import FileId
+from info import FILE_CACHE_TTL, SHARED_CACHE_PATH, STREAM_WORKERS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_properties (
+    client_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    file_id TEXT NOT NULL,
+    file_size INTEGER,
+    mime_type TEXT,
+    file_name TEXT,
+    file_unique_id TEXT,
+    last_modified REAL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (client_id, message_id)
+);
+"""
+
+# Attributes generate_file_properties and get_file_properties attach to a FileId
+PROPERTIES = ('file_size', 'mime_type', 'file_name', 'file_unique_id', 'last_modified')
+FIELDS = ('file_id',) + PROPERTIES + ('updated',)
+
+
+class SharedPropertiesCache:
+    """File properties shared by the streaming worker processes through SQLite
+
+    Every worker keeps its own in-memory cache in front of this one, so a
+    message is fetched from Telegram once for all workers instead of once
+    per worker.
+    """
+
+    def __init__(self, path: str = SHARED_CACHE_PATH, ttl: float = FILE_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.db = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return bool(self.path) and STREAM_WORKERS > 0
+
+    def connect(self):
+        if self.db is None:
+            db = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            try:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                db.executescript(SCHEMA)
+            except sqlite3.Error:
+                # e.g. locked while other workers create it, the next call tries again
+                db.close()
+                raise
+            self.db = db
+        return self.db
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def read(self, client_id, message_id):
+        row = self.connect().execute(
+            f"SELECT {', '.join(FIELDS)} FROM file_properties WHERE client_id = ? AND message_id = ?",
+            (client_id, message_id)
+        ).fetchone()
+        return dict(zip(FIELDS, row)) if row else None
+
+    def write(self, client_id, message_id, values):
+        with self.connect() as db:
+            db.execute(
+                f"INSERT OR REPLACE INTO file_properties (client_id, message_id, {', '.join(FIELDS)}) "
+                f"VALUES (?, ?, {', '.join('?' * len(FIELDS))})",
+                (client_id, message_id) + tuple(values[field] for field in FIELDS)
+            )
+
+    def delete(self, client_id, message_id):
+        with self.connect() as db:
+            db.execute("DELETE FROM file_properties WHERE client_id = ? AND message_id = ?", (client_id, message_id))
+
+    async def get(self, client_id, message_id):
+        """Decoded FileId with its properties attached, or None"""
+        if not self.enabled:
+            return None
+        try:
+            row = await self.run(self.read, client_id, message_id)
+        except sqlite3.Error as e:
+            print(f"Error reading shared file cache: {e}")
+            return None
+        if row is None or row['updated'] + self.ttl < time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+
+        file_id = FileId.decode(row['file_id'])
+        setattr(file_id, "file_id_str", row['file_id'])
+        for field in PROPERTIES:
+            setattr(file_id, field, row[field])
+        setattr(file_id, "message_id", message_id)
+        return file_id
+
+    async def set(self, client_id, message_id, file_id: FileId):
+        """Store properties made by generate_file_properties for the other workers"""
+        if not self.enabled:
+            return
+        values = {field: getattr(file_id, field, None) for field in PROPERTIES}
+        values.update(file_id=file_id.file_id_str, updated=time.time())
+        try:
+            await self.run(self.write, client_id, message_id, values)
+        except sqlite3.Error as e:
+            print(f"Error writing shared file cache: {e}")
+
+    async def invalidate(self, client_id, message_id):
+        if not self.enabled:
+            return
+        try:
+            await self.run(self.delete, client_id, message_id)
+        except sqlite3.Error as e:
+            print(f"Error writing shared file cache: {e}")
+
+    def stats(self):
+        return {"enabled": self.enabled, "hits": self.hits, "misses": self.misses}
+
+
+shared_cache = SharedPropertiesCache()
@@ -0,0 +1,81 @@
+import time
+import asyncio
+from pyrogram.errors import MessageNotModified
+from info import STATUS_EDIT_INTERVAL
+from web.utils.rate_limiter import rate_limiter
+
+
+class StatusUpdater:
+    """Edits status messages at most once every `interval` seconds, always with the latest text"""
+
+    def __init__(self, interval: float = STATUS_EDIT_INTERVAL):
+        self.interval = interval
+        self.states = {}  # (chat id, message id) -> latest wanted text and what was sent
+        self.updates = 0
+        self.edits = 0
+        self.unchanged = 0
+
+    @staticmethod
+    def key(message):
+        return message.chat.id, message.id
+
+    def update(self, message, text: str, **kwargs):
+        """Show `text` on `message` soon; newer updates replace older ones that weren't sent yet"""
+        self.updates += 1
+        state = self.states.setdefault(self.key(message), {'sent_text': None, 'sent_at': 0.0, 'task': None})
+        state.update(message=message, text=text, kwargs=kwargs)
+        if state['task'] is None or state['task'].done():
+            state['task'] = asyncio.ensure_future(self.send_later(self.key(message)))
+
+    async def send_later(self, key):
+        state = self.states.get(key)
+        # Updates that arrive while an edit is being sent are picked up by the next round
+        while True:
+            delay = state['sent_at'] + self.interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.states.get(key) is not state or state['text'] == state['sent_text']:
+                self.unchanged += 1
+                return
+
+            text = state['text']
+            state['sent_text'], state['sent_at'] = text, time.monotonic()
+            try:
+                await rate_limiter.call("edit_message", state['message'].edit_text, text, **state['kwargs'])
+                self.edits += 1
+            except MessageNotModified:
+                self.unchanged += 1
+            except Exception as e:
+                print(f"Error updating status message: {e}")
+            if self.states.get(key) is not state or state['text'] == state['sent_text']:
+                return
+
+    async def finish(self, message, text: str, **kwargs):
+        """Show `text` right away and drop pending updates; errors are raised to the caller"""
+        state = self.forget(message)
+        if state and state['sent_text'] == text:
+            self.unchanged += 1
+            return
+        self.edits += 1
+        try:
+            await rate_limiter.call("edit_message", message.edit_text, text, **kwargs)
+        except MessageNotModified:
+            pass
+
+    def forget(self, message):
+        """Stop updating `message`, e.g. before deleting it"""
+        state = self.states.pop(self.key(message), None)
+        if state and state['task'] and not state['task'].done():
+            state['task'].cancel()
+        return state
+
+    def stats(self):
+        return {
+            "messages": len(self.states),
+            "updates": self.updates,
+            "edits": self.edits,
+            "unchanged": self.unchanged,
+        }
+
+
+status_updater = StatusUpdater()
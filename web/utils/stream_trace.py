@@ -0,0 +1,143 @@
+import json
+import time
+import random
+from info import SLOW_STREAM_LOG, SLOW_STREAM_SECONDS, STREAM_TRACE_SAMPLE_RATE
+
+# Timeline entries kept per trace, later ones are only counted
+MAX_EVENTS = 200
+# Single client writes blocked longer than this get their own timeline entry
+WRITE_EVENT_SECONDS = 0.1
+
+
+class StreamTrace:
+    """Timeline of one download request, from metadata lookup to the last byte
+
+    Times in the log are milliseconds since the request started.
+    """
+
+    def __init__(self, message_id: int, method: str, range_header: str = None):
+        self.message_id = message_id
+        self.method = method
+        self.range_header = range_header
+        self.started = time.monotonic()
+        self.timestamp = time.time()
+        self.fields = {}
+        self.events = []
+        self.dropped = 0
+        self.bytes = 0
+        self.chunks = 0
+        self.ttfb = None
+        self.max_stall = 0.0  # longest wait for the next chunk after the first one
+        self.write_wait = 0.0  # total time blocked on the client reading
+        self.max_write = 0.0
+        self.getfile_count = 0
+        self.getfile_total = 0.0
+        self.getfile_max = 0.0
+
+    def ms(self, seconds: float) -> float:
+        return round(seconds * 1000, 1)
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def record(self, name: str, started: float, **fields):
+        """Add a step that began at monotonic time `started` and ends now"""
+        now = time.monotonic()
+        if name == "getfile":
+            self.getfile_count += 1
+            self.getfile_total += now - started
+            self.getfile_max = max(self.getfile_max, now - started)
+        if len(self.events) >= MAX_EVENTS:
+            self.dropped += 1
+            return
+        self.events.append({"step": name, "at": self.ms(started - self.started), "ms": self.ms(now - started),
+                            **fields})
+
+    def chunk(self, waited: float, size: int):
+        """A body chunk arrived after waiting `waited` seconds for it"""
+        self.chunks += 1
+        self.bytes += size
+        if self.ttfb is None:
+            self.ttfb = time.monotonic() - self.started
+        else:
+            self.max_stall = max(self.max_stall, waited)
+
+    def wrote(self, started: float):
+        """The client took from `started` until now to accept a chunk"""
+        seconds = time.monotonic() - started
+        self.write_wait += seconds
+        self.max_write = max(self.max_write, seconds)
+        if seconds >= WRITE_EVENT_SECONDS:
+            self.record("client_write", started)
+
+    def summary(self, status, error):
+        return {
+            "time": self.timestamp,
+            "message_id": self.message_id,
+            "method": self.method,
+            "range": self.range_header,
+            "status": status,
+            "error": error,
+            **self.fields,
+            "total_ms": self.ms(time.monotonic() - self.started),
+            "ttfb_ms": None if self.ttfb is None else self.ms(self.ttfb),
+            "max_stall_ms": self.ms(self.max_stall),
+            "client_write_ms": self.ms(self.write_wait),
+            "max_client_write_ms": self.ms(self.max_write),
+            "bytes": self.bytes,
+            "chunks": self.chunks,
+            "getfile": {
+                "count": self.getfile_count,
+                "total_ms": self.ms(self.getfile_total),
+                "max_ms": self.ms(self.getfile_max),
+            },
+            "events": self.events,
+            "dropped_events": self.dropped,
+        }
+
+
+class StreamTracer:
+    """Traces a sample of download requests and logs the slow ones as JSON lines
+
+    A stream is slow when its first byte or any later chunk took at least
+    `slow_seconds`. Requests outside the sample cost one random() call.
+    """
+
+    def __init__(self, sample_rate: float = STREAM_TRACE_SAMPLE_RATE, slow_seconds: float = SLOW_STREAM_SECONDS,
+                 log_path: str = SLOW_STREAM_LOG):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.log_path = log_path
+        self.sampled = 0
+        self.slow = 0
+
+    def start(self, request, message_id: int):
+        """A new trace for this request, or None if it isn't sampled"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        self.sampled += 1
+        return StreamTrace(message_id, request.method, request.headers.get("Range"))
+
+    def is_slow(self, trace: StreamTrace) -> bool:
+        first_byte = trace.ttfb if trace.ttfb is not None else time.monotonic() - trace.started
+        return first_byte >= self.slow_seconds or trace.max_stall >= self.slow_seconds
+
+    def finish(self, trace: StreamTrace, status, error: str = None):
+        if trace is None or not self.is_slow(trace):
+            return
+        self.slow += 1
+        line = json.dumps(trace.summary(status, error), ensure_ascii=False)
+        if not self.log_path:
+            print(line)
+            return
+        try:
+            with open(self.log_path, "a", encoding="utf-8") as log:
+                log.write(line + "\n")
+        except OSError as e:
+            print(f"Error writing slow stream log: {e}")
+
+    def stats(self):
+        return {"sample_rate": self.sample_rate, "sampled": self.sampled, "slow": self.slow}
+
+
+stream_tracer = StreamTracer()